@@ -14,13 +14,617 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import time
+# Recorded before anything else is imported for the --profile-startup report.
+STARTUP_TIME = time.perf_counter()
+
 import sys
 import os
 import re
+import difflib
+import functools
 import could_try_harder
 import config
-from PySide2.QtCore import Qt, Slot
-from PySide2.QtWidgets import QApplication, QMainWindow, QHBoxLayout, QVBoxLayout, QGridLayout, QWidget, QLabel, QLineEdit, QTextEdit, QPushButton, QListWidget, QComboBox, QFileDialog, QInputDialog, QMessageBox
+import profiling
+from PySide2.QtCore import Qt, Slot, Signal, QObject, QRunnable, QThreadPool, QTimer, QEvent, QAbstractListModel, QModelIndex
+from PySide2.QtGui import QBrush, QColor
+from PySide2.QtWidgets import QApplication, QMainWindow, QHBoxLayout, QVBoxLayout, QGridLayout, QWidget, QLabel, QLineEdit, QTextEdit, QPushButton, QListWidget, QListWidgetItem, QListView, QComboBox, QFileDialog, QInputDialog, QMessageBox, QProgressDialog, QAbstractItemView
+
+# File dialog filters for each export format
+EXPORT_FILTERS = {
+    "Text Files (*.txt)": 'txt',
+    "CSV Files (*.csv)": 'csv',
+    "JSON Lines Files (*.jsonl)": 'jsonl'
+}
+
+class Task(QRunnable):
+    """
+    A function call run on a TaskRunner's thread pool.
+
+    Params:
+        runner: TaskRunner
+        function: callable
+        args: arguments for function
+    """
+
+    def __init__(self, runner, function, args, on_finished, on_failed):
+        QRunnable.__init__(self)
+        # Kept by the runner until finished, so Qt mustn't delete it
+        self.setAutoDelete(False)
+        self.runner = runner
+        self.function = function
+        self.args = args
+        self.on_finished = on_finished
+        self.on_failed = on_failed
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Stops the task running if it hasn't started yet, and stops its result being delivered if it has.
+        """
+        self.cancelled = True
+
+    def run(self):
+        result = error = None
+        if not self.cancelled:
+            try:
+                result = self.function(*self.args)
+            except Exception as err:
+                error = err
+        self.runner.signals.done.emit(self, result, error)
+
+class TaskSignals(QObject):
+    # Task, result, exception (or None)
+    done = Signal(object, object, object)
+
+class TaskRunner(QObject):
+    """
+    Runs functions on a thread pool and calls back on the GUI thread with their results, so text processing and
+    saving don't freeze the windows.
+
+    Params:
+        max_threads: int or None for one thread per CPU. With one thread tasks run in the order they were started,
+            and their callbacks are called in the same order.
+    """
+
+    def __init__(self, max_threads=None, parent=None):
+        QObject.__init__(self, parent)
+        self.pool = QThreadPool(self)
+        if max_threads:
+            self.pool.setMaxThreadCount(max_threads)
+        self.signals = TaskSignals()
+        self.signals.done.connect(self.do_done)
+        self.tasks = set()
+
+    def run(self, function, *args, on_finished=None, on_failed=None):
+        """
+        Starts function(*args) in the background.
+
+        Params:
+            function: callable - must not touch any widgets
+            on_finished: callable or None - called with the function's return value on the GUI thread
+            on_failed: callable or None - called with the exception if the function raises one. If None, the
+                exception is printed.
+
+        Returns:
+            Task - can be cancelled
+        """
+        task = Task(self, function, args, on_finished, on_failed)
+        self.tasks.add(task)
+        self.pool.start(task)
+        return task
+
+    def after_running_tasks(self, callback):
+        """
+        Calls callback on the GUI thread once the tasks already started (and their callbacks) have finished. Only
+        for runners with one thread.
+        """
+        self.run(lambda: None, on_finished=lambda result: callback())
+
+    def wait(self):
+        """
+        Blocks until every task has finished.
+        """
+        self.pool.waitForDone()
+
+    @Slot(object, object, object)
+    def do_done(self, task, result, error):
+        self.tasks.discard(task)
+        if task.cancelled:
+            return
+        if error is not None:
+            if task.on_failed is None:
+                # TODO better error handling here
+                print(error)
+            else:
+                task.on_failed(error)
+        elif task.on_finished is not None:
+            task.on_finished(result)
+
+_task_runners = {}
+
+def get_task_runner(name):
+    """
+    Gets one of the shared task runners, creating it the first time:
+        'render' - fills in placeholders for display, using every CPU
+        'edit' - styles edited comments and saves subjects, one task at a time in order, so that saves see every
+                 edit made before them
+
+    Returns:
+        TaskRunner
+    """
+    if name not in _task_runners:
+        _task_runners[name] = TaskRunner(1 if name == 'edit' else None, QApplication.instance())
+    return _task_runners[name]
+
+def style_comment(text, first_name, pronouns):
+    """
+    Fills in placeholders and applies the style rules to a student comment. Safe to run in the background.
+
+    Returns:
+        string
+    """
+    return could_try_harder.style_student_comment(text, first_name, pronouns)
+
+def render_comments(comments, first_name, pronouns):
+    """
+    Fills in placeholders in comments for a student. Safe to run in the background.
+
+    Params:
+        comments: list of strings
+
+    Returns:
+        list of strings
+    """
+    return [could_try_harder.compile_template(comment).render(first_name, pronouns) for comment in comments]
+
+def copy_subject(subject):
+    """
+    Copies a subject deeply enough to save it in the background while the window carries on editing the original.
+    """
+    return dict(subject,
+        comment_bank=list(subject['comment_bank']),
+        students=[student.copy() for student in subject['students']])
+
+class Autosaver(QObject):
+    """
+    Saves a window's unsaved changes as a draft in the background (see could_try_harder.save_draft), so they aren't
+    lost if the window is cancelled or the app crashes.
+
+    Changes are coalesced: the draft is written config.AUTOSAVE_DELAY ms after the last change, or at most
+    config.AUTOSAVE_MAX_DELAY ms after the first one if changes keep coming. Drafts are written on the 'edit' task
+    runner, in order with styling and saving, and only one write is queued at a time. Changes made while a draft is
+    being written are written once it has finished.
+
+    Params:
+        subject_name: string
+        kind: string - one of could_try_harder.DRAFT_KINDS
+        snapshot: callable returning the draft as a dict. Called on the GUI thread, so it must copy anything the
+            window goes on editing.
+        saved: dict - what snapshot returns when there are no unsaved changes
+    """
+
+    def __init__(self, subject_name, kind, snapshot, saved, parent=None):
+        QObject.__init__(self, parent)
+        self.subject_name = subject_name
+        self.kind = kind
+        self.snapshot = snapshot
+        # Last draft written (or being written), so unchanged drafts aren't written again
+        self.last_draft = saved
+        # Draft waiting for the one being written to finish
+        self.next_draft = None
+        self.writing = False
+        self.stopped = False
+        self.first_change = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.do_write)
+
+    def changed(self, *args):
+        """
+        Schedules a draft to be written. Takes any arguments so it can be connected to any signal.
+        """
+        if self.stopped or not config.AUTOSAVE_DELAY:
+            return
+        now = time.monotonic()
+        if self.first_change is None:
+            self.first_change = now
+        waited = (now - self.first_change) * 1000
+        self.timer.start(int(max(0, min(config.AUTOSAVE_DELAY, config.AUTOSAVE_MAX_DELAY - waited))))
+
+    @Slot()
+    def do_write(self):
+        self.first_change = None
+        draft = self.snapshot()
+        if draft == self.last_draft:
+            return
+        self.last_draft = draft
+        if self.writing:
+            self.next_draft = draft
+        else:
+            self.write(draft)
+
+    def write(self, draft):
+        self.writing = True
+        get_task_runner('edit').run(could_try_harder.save_draft, self.subject_name, self.kind, draft,
+            on_finished=self.written)
+
+    def written(self, success):
+        self.writing = False
+        if self.next_draft is not None and not self.stopped:
+            draft, self.next_draft = self.next_draft, None
+            self.write(draft)
+
+    def flush(self):
+        """
+        Writes changes still waiting for the timer straight away and stops autosaving, e.g. when the window closes.
+        """
+        if self.timer.isActive():
+            self.timer.stop()
+            self.do_write()
+        self.stopped = True
+
+    def discard(self):
+        """
+        Stops autosaving and deletes the draft, e.g. once the subject has been saved. Any draft still being written is
+        deleted once it has finished.
+        """
+        self.stopped = True
+        self.timer.stop()
+        self.next_draft = None
+        get_task_runner('edit').run(could_try_harder.delete_draft, self.subject_name, self.kind)
+
+def ask_to_restore_draft(parent, subject_name, draft):
+    """
+    Asks whether to restore the unsaved changes in a draft.
+
+    Params:
+        parent: QWidget or None
+        subject_name: string
+        draft: dict from could_try_harder.load_draft
+
+    Returns:
+        Boolean
+    """
+    saved = time.strftime("%Y-%m-%d %H:%M", time.localtime(draft.get('draft_saved', 0)))
+    confirm_msg = QMessageBox(parent)
+    confirm_msg.setWindowTitle("Unsaved Changes")
+    confirm_msg.setText("There are unsaved changes to {} from {}. Restore them?".format(subject_name, saved))
+    confirm_msg.setInformativeText("Discarding them can't be undone.")
+    restore_button = confirm_msg.addButton("Restore", QMessageBox.AcceptRole)
+    confirm_msg.addButton("Discard", QMessageBox.DestructiveRole)
+    confirm_msg.setDefaultButton(restore_button)
+    confirm_msg.exec()
+    return confirm_msg.clickedButton() is restore_button
+
+class CommentBankModel(QAbstractListModel):
+    """
+    List model for a comment bank.
+
+    With a student set, comments are shown with the placeholders filled in for that student. Each comment is only
+    rendered when a view asks for it (i.e. when it is scrolled into view), in the background on the 'render' task
+    runner; until then the comment is shown greyed out with its placeholders. Changes emit signals for just the rows
+    affected rather than resetting the whole list.
+
+    Params:
+        comment_bank: list of strings - the model edits this list in place
+    """
+
+    def __init__(self, comment_bank, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self.comment_bank = comment_bank
+        self.search_index = could_try_harder.CommentIndex(comment_bank)
+        self.student = None
+        # Comments already rendered for the current student, by row
+        self.rendered = {}
+        # Rows waiting to be rendered, and the task rendering them
+        self.pending_rows = set()
+        self.render_task = None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.comment_bank)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.comment_bank):
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            if self.student is None:
+                return self.comment_bank[row]
+            if row in self.rendered:
+                return self.rendered[row]
+            self.request_render(row)
+            return self.comment_bank[row]
+        if role == Qt.ForegroundRole:
+            if self.student is not None and row not in self.rendered:
+                return QBrush(QColor(Qt.gray))
+            return None
+        if role == Qt.EditRole:
+            return self.comment_bank[row]
+        return None
+
+    def get_text(self, row):
+        """
+        Returns:
+            string - the comment at row, rendered for the current student if there is one
+        """
+        if self.student is None:
+            return self.comment_bank[row]
+        if row not in self.rendered:
+            self.rendered[row] = render_comments([self.comment_bank[row]], self.student['first_name'], self.student['pronouns'])[0]
+        return self.rendered[row]
+
+    def is_rendered(self):
+        """
+        Returns:
+            Boolean - True if every comment has been rendered for the current student
+        """
+        return self.student is None or len(self.rendered) == len(self.comment_bank)
+
+    def request_render(self, row):
+        """
+        Queues a row to be rendered in the background. Rows requested while drawing the view are rendered together.
+        """
+        if not self.pending_rows:
+            QTimer.singleShot(0, self.render_pending)
+        self.pending_rows.add(row)
+
+    @Slot()
+    def render_pending(self):
+        rows = sorted(row for row in self.pending_rows if row not in self.rendered and row < len(self.comment_bank))
+        self.pending_rows.clear()
+        if not rows or self.student is None:
+            return
+        comments = [self.comment_bank[row] for row in rows]
+        student = self.student
+
+        def show_rendered(rendered):
+            if student is not self.student or any(row >= len(self.comment_bank) or self.comment_bank[row] != comment
+                                                  for row, comment in zip(rows, comments)):
+                # Out of date
+                return
+            self.rendered.update(zip(rows, rendered))
+            self.dataChanged.emit(self.index(rows[0]), self.index(rows[-1]), [Qt.DisplayRole, Qt.ForegroundRole])
+
+        self.render_task = get_task_runner('render').run(
+            render_comments, comments, student['first_name'], student['pronouns'], on_finished=show_rendered)
+
+    def cancel_render(self):
+        """
+        Stops rendering rows for the current student.
+        """
+        if self.render_task is not None:
+            self.render_task.cancel()
+            self.render_task = None
+        self.pending_rows.clear()
+
+    def set_student(self, student, rendered=None):
+        """
+        Shows the comments rendered for a different student. Views only fetch the rows they are showing again, and
+        any rows still being rendered for the previous student are cancelled.
+
+        Params:
+            student: dict or None to show the comments with their placeholders
+            rendered: list of strings or None - every comment already rendered for the student
+        """
+        self.cancel_render()
+        self.student = student
+        self.rendered.clear()
+        if rendered is not None and len(rendered) == len(self.comment_bank):
+            self.rendered.update(enumerate(rendered))
+        if self.comment_bank:
+            self.dataChanged.emit(self.index(0), self.index(len(self.comment_bank) - 1), [Qt.DisplayRole, Qt.ForegroundRole])
+
+    def set_comment(self, row, comment):
+        self.comment_bank[row] = comment
+        self.search_index.update(row, comment)
+        self.rendered.pop(row, None)
+        self.dataChanged.emit(self.index(row), self.index(row), [Qt.DisplayRole, Qt.EditRole, Qt.ForegroundRole])
+
+    def add_comment(self, comment):
+        row = len(self.comment_bank)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.comment_bank.append(comment)
+        self.search_index.add(comment)
+        self.endInsertRows()
+
+    def remove_comment(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.comment_bank[row]
+        self.search_index.remove(row)
+        # Rows after the one removed have moved up
+        self.rendered = {r - (r > row): text for r, text in self.rendered.items() if r != row}
+        self.endRemoveRows()
+
+    def set_comment_bank(self, comment_bank):
+        """
+        Replaces the whole comment bank (e.g. when importing one from another subject).
+
+        Params:
+            comment_bank: list of strings
+        """
+        self.beginResetModel()
+        self.cancel_render()
+        self.comment_bank[:] = comment_bank
+        self.search_index = could_try_harder.CommentIndex(self.comment_bank)
+        self.rendered.clear()
+        self.endResetModel()
+
+class CommentFilterModel(QAbstractListModel):
+    """
+    Shows the comments in a CommentBankModel matching a search, best matches first, using the comment bank's
+    search index. With no search, shows every comment in order.
+
+    Only changing the search resets the model. Changes to the comment bank emit signals for just the rows shown or
+    hidden, so views keep their selection and scroll position.
+
+    Params:
+        source: CommentBankModel
+    """
+
+    def __init__(self, source, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self.source = source
+        self.search = ""
+        # Source rows shown, in order
+        self.rows = list(range(source.rowCount()))
+        # Where each source row is shown, worked out when needed
+        self.positions = None
+        source.dataChanged.connect(self.do_source_data_changed)
+        source.rowsInserted.connect(self.do_source_rows_inserted)
+        source.rowsRemoved.connect(self.do_source_rows_removed)
+        source.modelReset.connect(self.do_source_reset)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.rows):
+            return None
+        return self.source.data(self.source.index(self.rows[index.row()]), role)
+
+    def source_row(self, row):
+        """
+        Returns:
+            int - row in the comment bank of the comment shown at row
+        """
+        return self.rows[row]
+
+    def set_search(self, search):
+        """
+        Params:
+            search: string - words to search for. The last word also matches longer words starting with it.
+        """
+        if search != self.search:
+            self.beginResetModel()
+            self.search = search
+            self.rows = self.matching_rows()
+            self.positions = None
+            self.endResetModel()
+
+    def matching_rows(self):
+        """
+        Returns:
+            list of ints - the source rows the search should show, in order
+        """
+        if self.search.strip():
+            return self.source.search_index.search(self.search)
+        return list(range(self.source.rowCount()))
+
+    def update_rows(self):
+        """
+        Shows the rows matching the search, removing and inserting just the rows which differ from those shown.
+        """
+        rows = self.matching_rows()
+        matcher = difflib.SequenceMatcher(None, self.rows, rows, autojunk=False)
+        # Rows inserted or removed so far move the later opcodes along
+        offset = 0
+        for tag, start, end, new_start, new_end in matcher.get_opcodes():
+            if tag in ('delete', 'replace'):
+                self.beginRemoveRows(QModelIndex(), start + offset, end + offset - 1)
+                del self.rows[start + offset:end + offset]
+                self.positions = None
+                self.endRemoveRows()
+                offset -= end - start
+            if tag in ('insert', 'replace'):
+                self.beginInsertRows(QModelIndex(), end + offset, end + offset + new_end - new_start - 1)
+                self.rows[end + offset:end + offset] = rows[new_start:new_end]
+                self.positions = None
+                self.endInsertRows()
+                offset += new_end - new_start
+
+    @Slot()
+    def do_source_rows_inserted(self, parent, first, last):
+        if not self.search.strip():
+            self.beginInsertRows(QModelIndex(), first, last)
+            self.rows = list(range(self.source.rowCount()))
+            self.positions = None
+            self.endInsertRows()
+            return
+        # Rows after the new ones have moved down
+        count = last - first + 1
+        self.rows = [row + count if row >= first else row for row in self.rows]
+        self.positions = None
+        self.update_rows()
+
+    @Slot()
+    def do_source_rows_removed(self, parent, first, last):
+        if not self.search.strip():
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self.rows = list(range(self.source.rowCount()))
+            self.positions = None
+            self.endRemoveRows()
+            return
+        # Take out the rows removed from the source, then the rows after them have moved up
+        for row in reversed(range(len(self.rows))):
+            if first <= self.rows[row] <= last:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.rows[row]
+                self.endRemoveRows()
+        count = last - first + 1
+        self.rows = [row - count if row > last else row for row in self.rows]
+        self.positions = None
+        self.update_rows()
+
+    @Slot()
+    def do_source_reset(self):
+        self.update_rows()
+        # Rows still shown may have different comments in them
+        if self.rows:
+            self.dataChanged.emit(self.index(0), self.index(len(self.rows) - 1), [Qt.DisplayRole, Qt.EditRole, Qt.ForegroundRole])
+
+    @Slot()
+    def do_source_data_changed(self, top_left, bottom_right, roles=[]):
+        if not self.search.strip():
+            self.dataChanged.emit(self.index(top_left.row()), self.index(bottom_right.row()), roles)
+            return
+        if Qt.EditRole in roles:
+            # A comment was changed, so it might not match any more (or might match now)
+            self.update_rows()
+        if self.positions is None:
+            self.positions = {source_row: row for row, source_row in enumerate(self.rows)}
+        changed = [self.positions[source_row] for source_row in range(top_left.row(), bottom_right.row() + 1)
+                   if source_row in self.positions]
+        if changed:
+            self.dataChanged.emit(self.index(min(changed)), self.index(max(changed)), roles)
+
+class StudentListModel(QAbstractListModel):
+    """
+    List model for the students in a subject, showing each student's name and whether their report has been written.
+
+    Params:
+        students: list of student dicts
+    """
+
+    def __init__(self, students, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self.students = students
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.students)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.students):
+            return None
+        student = self.students[index.row()]
+        if role == Qt.DisplayRole:
+            # Mark students who still need a report
+            return "{} {}{}".format(student['first_name'], student['last_name'], "" if student['comment'].strip() else " *")
+        if role == Qt.ToolTipRole:
+            return "Report written" if student['comment'].strip() else "No report yet"
+        return None
+
+    def student_changed(self, row):
+        """
+        Call after changing a student's comment so views can update that row.
+        """
+        self.dataChanged.emit(self.index(row), self.index(row), [Qt.DisplayRole, Qt.ToolTipRole])
 
 class MainWindow(QMainWindow):
 
@@ -35,9 +639,12 @@ class MainWindow(QMainWindow):
         self.import_button = QPushButton('Import CSV...')
         self.saved_label = QLabel('You have the following saved classes:')
         self.saved_listwidget = QListWidget(self)
+        self.saved_listwidget.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.summary_label = QLabel()
         self.edit_comment_bank_button = QPushButton('Edit Comment Bank')
         self.edit_reports_button = QPushButton('Edit Reports')
         self.export_reports_button = QPushButton('Export Reports')
+        self.bulk_export_button = QPushButton('Export All...')
         self.delete_class_button = QPushButton('Delete')
 
         # Layout
@@ -46,9 +653,11 @@ class MainWindow(QMainWindow):
         self.layout.addWidget(self.import_button)
         self.layout.addWidget(self.saved_label)
         self.layout.addWidget(self.saved_listwidget)
+        self.layout.addWidget(self.summary_label)
         self.layout.addWidget(self.edit_comment_bank_button)
         self.layout.addWidget(self.edit_reports_button)
         self.layout.addWidget(self.export_reports_button)
+        self.layout.addWidget(self.bulk_export_button)
         self.layout.addWidget(self.delete_class_button)
 
         # Initial run of listbox update
@@ -60,6 +669,7 @@ class MainWindow(QMainWindow):
         self.edit_comment_bank_button.clicked.connect(self.edit_comment_bank)
         self.edit_reports_button.clicked.connect(self.edit_reports)
         self.export_reports_button.clicked.connect(self.export_reports)
+        self.bulk_export_button.clicked.connect(self.bulk_export_reports)
         self.delete_class_button.clicked.connect(self.delete_class)
 
         self.widget = QWidget()
@@ -73,19 +683,63 @@ class MainWindow(QMainWindow):
         # properly using QLineEdit
         subject_name, ok = QInputDialog().getText(self, "Subject Name", "Enter a name or code for the subject:")
         if subject_name and ok:
-            filename, filt = QFileDialog.getOpenFileName(self, "Import CSV", os.path.expanduser("~"), "Comma Separated (*.csv)")
-            if could_try_harder.import_class_list(filename, subject_name):
+            filename, filt = QFileDialog.getOpenFileName(self, "Import CSV", os.path.expanduser("~"), "Comma Separated (*.csv *.txt *.tsv)")
+            if not filename:
+                return
+            report = could_try_harder.ImportReport(filename)
+            if could_try_harder.import_class_list(filename, subject_name, report):
                 self.update_saved_list()
+                if report.problems:
+                    QMessageBox.warning(self, "Import", "Some rows had problems:\n\n" + str(report))
             else:
                 # TODO better error handling here
                 print("Import Failed")
+                QMessageBox.warning(self, "Import Failed", str(report))
                 return
 
     def update_saved_list(self):
+        self.summaries = could_try_harder.get_subject_summaries()
         self.saved_listwidget.clear()
-        self.saved_listwidget.addItems(could_try_harder.get_saved_list())
+        for subject_name in sorted(self.summaries):
+            item = QListWidgetItem(subject_name)
+            self.update_tooltip(item)
+            self.saved_listwidget.addItem(item)
         self.do_update_selection()
 
+    def update_tooltip(self, item):
+        summary = self.summaries.get(item.text())
+        if summary and summary['students'] is not None:
+            item.setToolTip("{} of {} reports written, {} comments in the comment bank".format(
+                summary['completed'], summary['students'], summary['comment_bank']))
+
+    def event(self, event):
+        # Pick up reports written in the other windows when coming back to this one
+        if event.type() == QEvent.WindowActivate and hasattr(self, 'summaries'):
+            summaries = could_try_harder.get_subject_summaries()
+            if set(summaries) != set(self.summaries):
+                self.update_saved_list()
+            elif summaries != self.summaries:
+                self.summaries = summaries
+                for i in range(self.saved_listwidget.count()):
+                    self.update_tooltip(self.saved_listwidget.item(i))
+                self.update_summary()
+        return QMainWindow.event(self, event)
+
+    def update_summary(self):
+        """
+        Shows how many reports have been written in the selected classes, or all classes if none are selected.
+        """
+        subject_names = [item.text() for item in self.saved_listwidget.selectedItems()] or list(self.summaries)
+        summaries = [self.summaries[subject_name] for subject_name in subject_names
+                     if self.summaries[subject_name]['students'] is not None]
+        students = sum(summary['students'] for summary in summaries)
+        completed = sum(summary['completed'] for summary in summaries)
+        if not students:
+            self.summary_label.setText("")
+            return
+        self.summary_label.setText("{} of {} reports written ({:.0%}) in {} {}".format(
+            completed, students, completed / students, len(summaries), "class" if len(summaries) == 1 else "classes"))
+
     @Slot()
     def do_update_selection(self):
         if self.saved_listwidget.selectedItems():
@@ -96,6 +750,13 @@ class MainWindow(QMainWindow):
         self.edit_reports_button.setEnabled(state)
         self.export_reports_button.setEnabled(state)
         self.delete_class_button.setEnabled(state)
+        # Exports the selected classes if there are several, otherwise all of them
+        if len(self.saved_listwidget.selectedItems()) > 1:
+            self.bulk_export_button.setText('Export Selected...')
+        else:
+            self.bulk_export_button.setText('Export All...')
+        self.bulk_export_button.setEnabled(self.saved_listwidget.count() > 0)
+        self.update_summary()
 
     @Slot()
     def edit_comment_bank(self):
@@ -112,13 +773,72 @@ class MainWindow(QMainWindow):
     @Slot()
     def export_reports(self):
         subject_name = self.saved_listwidget.currentItem().text()
-        filename, filt = QFileDialog.getSaveFileName(self, "Export", os.path.expanduser("~"), "Text Files (*.txt)")
+        filename, filt = QFileDialog.getSaveFileName(self, "Export", os.path.expanduser("~"), ";;".join(EXPORT_FILTERS))
         if filename:
-            if not could_try_harder.export(subject_name, filename):
+            export_format = EXPORT_FILTERS[filt] if filt in EXPORT_FILTERS else could_try_harder.get_export_format(filename)
+            if not os.path.splitext(filename)[1]:
+                filename += "." + export_format
+            progress_dialog = QProgressDialog("Exporting {}...".format(subject_name), None, 0, 0, self)
+            progress_dialog.setWindowTitle("Export")
+            progress_dialog.setWindowModality(Qt.WindowModal)
+            progress_dialog.setMinimumDuration(500)
+
+            def show_progress(done, total):
+                progress_dialog.setMaximum(total)
+                progress_dialog.setValue(done)
+                QApplication.processEvents()
+
+            exported = could_try_harder.export(subject_name, filename, export_format, show_progress)
+            progress_dialog.close()
+            if not exported:
                 # TODO better error handling here
                 print("Export failed.")
                 return
 
+    @Slot()
+    def bulk_export_reports(self):
+        selected = self.saved_listwidget.selectedItems()
+        if len(selected) > 1:
+            subject_names = [item.text() for item in selected]
+        else:
+            subject_names = [self.saved_listwidget.item(i).text() for i in range(self.saved_listwidget.count())]
+        folder = QFileDialog.getExistingDirectory(self, "Export To Folder", os.path.expanduser("~"))
+        if not folder:
+            return
+        export_format, ok = QInputDialog.getItem(self, "Export Format", "Export format:", list(could_try_harder.EXPORT_FORMATS), 0, False)
+        if not ok:
+            return
+        combined_filename = None
+        combine = QMessageBox.question(self, "Combined File", "Also create a single file containing every class?", QMessageBox.No | QMessageBox.Yes, QMessageBox.Yes)
+        if combine == QMessageBox.Yes:
+            combined_filename = os.path.join(folder, "all-classes." + export_format)
+
+        progress_dialog = QProgressDialog("Exporting {} classes...".format(len(subject_names)), None, 0, len(subject_names), self)
+        progress_dialog.setWindowTitle("Export")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+
+        def show_progress(result, done, total):
+            progress_dialog.setValue(done)
+            QApplication.processEvents()
+
+        results = could_try_harder.export_many(subject_names, folder, export_format, combined_filename, progress=show_progress)
+        progress_dialog.close()
+
+        # Summary of times and failures
+        lines = []
+        for result in results:
+            if result['success']:
+                lines.append("{}: exported in {:.2f}s".format(result['subject_name'], result['seconds']))
+            else:
+                lines.append("{}: FAILED - {}".format(result['subject_name'], result['error']))
+        failed = len([result for result in results if not result['success']])
+        summary_msg = QMessageBox(self)
+        summary_msg.setWindowTitle("Export")
+        summary_msg.setText("Exported {} of {} classes.".format(len(results) - failed, len(results)))
+        summary_msg.setDetailedText("\n".join(lines))
+        summary_msg.exec()
+
     @Slot()
     def delete_class(self):
         confirm_msg = QMessageBox(self)
@@ -145,6 +865,8 @@ class EditCommentBankWindow(QMainWindow):
 
         self.subject = could_try_harder.load(subject_name)
         self.saved_list = could_try_harder.get_saved_list()
+        saved_draft = self.draft(self.subject['intro_comment'], self.subject['comment_bank'])
+        self.restore_draft(saved_draft)
 
         # Widgets
         self.intro_comment_label = QLabel("Introductory Comment:")
@@ -152,7 +874,15 @@ class EditCommentBankWindow(QMainWindow):
         self.intro_comment_textedit = QTextEdit()
         self.comment_bank_label = QLabel("Comment Bank")
         self.comment_bank_label.setProperty("styleClass", "heading")
-        self.comment_bank_listwidget = QListWidget()
+        self.comment_bank_model = CommentBankModel(list(self.subject['comment_bank']), self)
+        self.comment_bank_listview = QListView()
+        # Lets the view work out its layout without asking for every row
+        self.comment_bank_listview.setUniformItemSizes(True)
+        self.comment_bank_filter = CommentFilterModel(self.comment_bank_model, self)
+        self.comment_bank_listview.setModel(self.comment_bank_filter)
+        self.comment_search_entry = QLineEdit()
+        self.comment_search_entry.setPlaceholderText("Search comments...")
+        self.comment_search_entry.setClearButtonEnabled(True)
         self.placeholder_instructions_label = QLabel(config.PLACEHOLDER_INSTRUCTIONS)
         self.add_comment_label = QLabel("Add Comment:")
         self.add_comment_entry = QLineEdit()
@@ -177,7 +907,8 @@ class EditCommentBankWindow(QMainWindow):
         self.layout.addLayout(self.top_layout)
         self.middle_layout = QVBoxLayout()
         self.middle_layout.addWidget(self.comment_bank_label)
-        self.middle_layout.addWidget(self.comment_bank_listwidget)
+        self.middle_layout.addWidget(self.comment_search_entry)
+        self.middle_layout.addWidget(self.comment_bank_listview)
         self.comment_actions_layout = QHBoxLayout()
         self.comment_actions_layout.addWidget(self.delete_comment_button, 0, Qt.AlignLeft)
         self.comment_actions_layout.addWidget(self.import_comments_combo, 1, Qt.AlignRight)
@@ -198,7 +929,8 @@ class EditCommentBankWindow(QMainWindow):
         self.layout.addLayout(self.bottom_layout)
 
         # Slot connections
-        self.comment_bank_listwidget.itemSelectionChanged.connect(self.do_update_comment_bank_selection)
+        self.comment_bank_listview.selectionModel().selectionChanged.connect(self.do_update_comment_bank_selection)
+        self.comment_search_entry.textChanged.connect(self.comment_bank_filter.set_search)
         self.import_comments_button.clicked.connect(self.do_import_comments)
         self.update_comment_button.clicked.connect(self.do_update_comment)
         self.update_comment_entry.returnPressed.connect(self.do_update_comment)
@@ -211,10 +943,44 @@ class EditCommentBankWindow(QMainWindow):
         # Initial UI update
         self.update_ui()
 
+        # Autosave, once the widgets have their initial contents
+        self.autosaver = Autosaver(subject_name, 'comment-bank', lambda: self.draft(
+            self.intro_comment_textedit.toPlainText(), self.comment_bank_model.comment_bank), saved_draft, self)
+        self.intro_comment_textedit.textChanged.connect(self.autosaver.changed)
+        self.comment_bank_model.dataChanged.connect(self.autosaver.changed)
+        self.comment_bank_model.rowsInserted.connect(self.autosaver.changed)
+        self.comment_bank_model.rowsRemoved.connect(self.autosaver.changed)
+        self.comment_bank_model.modelReset.connect(self.autosaver.changed)
+
         self.widget = QWidget()
         self.widget.setLayout(self.layout)
         self.setCentralWidget(self.widget)
 
+    def draft(self, intro_comment, comment_bank):
+        """
+        Returns:
+            dict - a draft of the intro comment and comment bank for the autosaver
+        """
+        return {"intro_comment": intro_comment, "comment_bank": list(comment_bank)}
+
+    def restore_draft(self, saved_draft):
+        """
+        Offers to restore the intro comment and comment bank from a draft left by a window that wasn't saved.
+
+        Params:
+            saved_draft: dict - the draft of the subject as saved
+        """
+        subject_name = self.subject['subject_name']
+        draft = could_try_harder.load_draft(subject_name, 'comment-bank')
+        if draft is None:
+            return
+        restored = self.draft(draft.get('intro_comment', ""), draft.get('comment_bank', []))
+        if restored != saved_draft and ask_to_restore_draft(None, subject_name, draft):
+            self.subject['intro_comment'] = restored['intro_comment']
+            self.subject['comment_bank'] = restored['comment_bank']
+        else:
+            could_try_harder.delete_draft(subject_name, 'comment-bank')
+
     def update_ui(self):
         self.update_import_comments_list()
         self.update_intro_comment()
@@ -229,36 +995,52 @@ class EditCommentBankWindow(QMainWindow):
         self.intro_comment_textedit.insertPlainText(self.subject['intro_comment'])
 
     def update_comment_bank(self):
-        self.comment_bank_listwidget.clear()
-        self.comment_bank_listwidget.addItems(self.subject['comment_bank'])
+        self.comment_bank_model.set_comment_bank(self.subject['comment_bank'])
         self.do_update_comment_bank_selection()
 
     @Slot()
     def do_import_comments(self):
-        # TODO confirm dialog first
         confirm_msg = QMessageBox(self)
         confirm_msg.setWindowTitle("Confirm")
-        confirm_msg.setText("This will override current comments.")
-        confirm_msg.setInformativeText("Do you want to continue?")
-        confirm_msg.setStandardButtons(QMessageBox.No | QMessageBox.Yes)
-        confirm_msg.setDefaultButton(QMessageBox.Yes)
-        confirm = confirm_msg.exec()
-        if confirm == QMessageBox.Yes:
-            if self.import_comments_combo.count() > 0:
-                new_subject = could_try_harder.load(self.import_comments_combo.currentText())
-                if new_subject:
-                    self.subject['intro_comment'] = new_subject['intro_comment']
-                    self.subject['comment_bank'] = new_subject['comment_bank']
-                    self.update_ui()
-                else:
-                    # TODO better error handling here
-                    print('Tried to import empty subject.')
-                    return
+        confirm_msg.setText("Add the comments from {} to this comment bank, or replace this comment bank and intro comment with them?".format(
+            self.import_comments_combo.currentText()))
+        confirm_msg.setInformativeText("Adding skips comments that are already in the comment bank.")
+        merge_button = confirm_msg.addButton("Add", QMessageBox.AcceptRole)
+        replace_button = confirm_msg.addButton("Replace", QMessageBox.DestructiveRole)
+        confirm_msg.addButton(QMessageBox.Cancel)
+        confirm_msg.setDefaultButton(merge_button)
+        confirm_msg.exec()
+        if confirm_msg.clickedButton() not in (merge_button, replace_button):
+            return
+        if self.import_comments_combo.count() > 0:
+            if confirm_msg.clickedButton() is merge_button:
+                # Only needs the comment bank, not the whole subject
+                comment_bank = could_try_harder.load_comment_bank(self.import_comments_combo.currentText())
+                for comment in could_try_harder.merge_comment_banks(self.comment_bank_model.comment_bank, comment_bank):
+                    self.comment_bank_model.add_comment(comment)
+                could_try_harder.forget_style_fingerprints(self.subject, ['comment_bank'])
+                self.do_update_comment_bank_selection()
+                return
+            new_subject = could_try_harder.load(self.import_comments_combo.currentText())
+            if not new_subject:
+                # TODO better error handling here
+                print('Tried to import empty subject.')
+                return
+            could_try_harder.import_comment_bank(self.subject, new_subject['comment_bank'], new_subject['intro_comment'])
+            self.update_intro_comment()
+            self.update_comment_bank()
         return
 
+    def current_comment_row(self):
+        """
+        Returns:
+            int - row in the comment bank of the selected comment
+        """
+        return self.comment_bank_filter.source_row(self.comment_bank_listview.currentIndex().row())
+
     @Slot()
     def do_update_comment_bank_selection(self):
-        if self.comment_bank_listwidget.selectedItems():
+        if self.comment_bank_listview.selectionModel().hasSelection():
             state = True
         else:
             state = False
@@ -266,25 +1048,40 @@ class EditCommentBankWindow(QMainWindow):
         self.update_comment_button.setEnabled(state)
         # Update the text in the update comment line edit
         self.update_comment_entry.clear()
-        if self.comment_bank_listwidget.currentItem():
-            self.update_comment_entry.insert(self.comment_bank_listwidget.currentItem().text())
+        if state and self.comment_bank_listview.currentIndex().isValid():
+            self.update_comment_entry.insert(self.comment_bank_model.get_text(self.current_comment_row()))
 
     @Slot()
     def do_update_comment(self):
-        if self.update_comment_entry.text():
-            self.comment_bank_listwidget.currentItem().setText(could_try_harder.do_style(self.update_comment_entry.text().strip()))
-            self.do_update_comment_bank_selection()
+        if self.update_comment_entry.text() and self.comment_bank_listview.currentIndex().isValid():
+            row = self.current_comment_row()
+            old_comment = self.comment_bank_model.comment_bank[row]
+
+            def update_comment(comment):
+                # Skip it if the comment was deleted or changed in the meantime
+                if row < len(self.comment_bank_model.comment_bank) and self.comment_bank_model.comment_bank[row] == old_comment:
+                    self.comment_bank_model.set_comment(row, comment)
+                    self.do_update_comment_bank_selection()
+
+            get_task_runner('edit').run(could_try_harder.do_style, self.update_comment_entry.text().strip(),
+                on_finished=update_comment)
 
     @Slot()
     def do_add_comment(self):
         if self.add_comment_entry.text():
-            self.comment_bank_listwidget.addItem(could_try_harder.do_style(self.add_comment_entry.text().strip()))
+            def add_comment(comment):
+                self.comment_bank_model.add_comment(comment)
+                self.comment_bank_listview.scrollToBottom()
+                self.do_update_comment_bank_selection()
+
+            get_task_runner('edit').run(could_try_harder.do_style, self.add_comment_entry.text().strip(),
+                on_finished=add_comment)
             self.add_comment_entry.clear()
-            self.do_update_comment_bank_selection()
 
     @Slot()
     def do_delete_comment(self):
-        self.comment_bank_listwidget.takeItem(self.comment_bank_listwidget.currentRow())
+        if self.comment_bank_listview.currentIndex().isValid():
+            self.comment_bank_model.remove_comment(self.current_comment_row())
         self.do_update_comment_bank_selection()
 
     @Slot()
@@ -293,15 +1090,41 @@ class EditCommentBankWindow(QMainWindow):
 
     @Slot()
     def do_save(self):
-        self.subject['intro_comment'] = could_try_harder.do_style(self.intro_comment_textedit.toPlainText().strip())
-        self.subject['comment_bank'] = []
-        for i in range(self.comment_bank_listwidget.count()):
-            self.subject['comment_bank'].append(self.comment_bank_listwidget.item(i).text())
-        if could_try_harder.save(self.subject):
-            self.close()
-        else:
-            # TODO better error handling here
-            print("Save failed.")
+        self.save_button.setEnabled(False)
+        # Wait for comments still being styled to be added to the comment bank
+        get_task_runner('edit').after_running_tasks(self.save_subject)
+
+    def save_subject(self):
+        """
+        Styles the intro comment and saves the subject in the background, closing the window once it's saved.
+        """
+        self.subject['comment_bank'] = list(self.comment_bank_model.comment_bank)
+        subject = copy_subject(self.subject)
+        intro_comment = self.intro_comment_textedit.toPlainText().strip()
+
+        def style_and_save():
+            subject['intro_comment'] = could_try_harder.do_style(intro_comment)
+            could_try_harder.invalidate_templates(subject['subject_name'])
+            return subject['intro_comment'], could_try_harder.save(subject)
+
+        def saved(result):
+            self.subject['intro_comment'], success = result
+            if success:
+                self.autosaver.discard()
+                self.close()
+            else:
+                # TODO better error handling here
+                print("Save failed.")
+                self.save_button.setEnabled(True)
+
+        get_task_runner('edit').run(style_and_save, on_finished=saved)
+
+    def closeEvent(self, event):
+        # Keeps changes made since the last draft, e.g. when cancelled
+        self.autosaver.flush()
+        # After any save still running
+        get_task_runner('edit').run(could_try_harder.release_subject, self.subject['subject_name'])
+        QMainWindow.closeEvent(self, event)
 
 class EditReportsWindow(QMainWindow):
 
@@ -312,7 +1135,16 @@ class EditReportsWindow(QMainWindow):
         self.setStyleSheet(config.STYLESHEET)
 
         self.subject = could_try_harder.load(subject_name)
+        saved_draft = self.draft()
+        restored = self.restore_draft(saved_draft)
         self.student = {}
+        self.templates = could_try_harder.compile_subject(self.subject)
+        self.intro_task = None
+        # Intro comments and comment banks rendered ahead of time for the students either side of the current one,
+        # and the tasks rendering them, by could_try_harder.get_render_key, so students with the same first name and
+        # pronouns share them
+        self.prefetched = {}
+        self.prefetch_tasks = {}
 
         # Used to keep track of current student
         self.s_index = 0
@@ -322,13 +1154,25 @@ class EditReportsWindow(QMainWindow):
         self.previous_student_button = QPushButton("Previous Student")
         self.student_name_label = QLabel()
         self.student_name_label.setProperty("styleClass", "title")
+        self.student_model = StudentListModel(self.subject['students'], self)
+        self.student_combo = QComboBox()
+        self.student_combo.setModel(self.student_model)
+        self.student_combo.setToolTip("Go to student (* report not written yet)")
         self.next_student_button = QPushButton("Next Student")
         self.intro_comment_label = QLabel("Introductory Comment")
         self.intro_comment_label.setProperty("styleClass", "heading")
         self.intro_comment = QLabel()
         self.comment_bank_label = QLabel("Comment Bank")
         self.comment_bank_label.setProperty("styleClass", "heading")
-        self.comment_bank_listwidget = QListWidget()
+        self.comment_bank_model = CommentBankModel(self.subject['comment_bank'], self)
+        self.comment_bank_listview = QListView()
+        # Lets the view work out its layout without asking for every row
+        self.comment_bank_listview.setUniformItemSizes(True)
+        self.comment_bank_filter = CommentFilterModel(self.comment_bank_model, self)
+        self.comment_bank_listview.setModel(self.comment_bank_filter)
+        self.comment_search_entry = QLineEdit()
+        self.comment_search_entry.setPlaceholderText("Search comments...")
+        self.comment_search_entry.setClearButtonEnabled(True)
         self.add_comment_button = QPushButton("Add Selected Comment")
         self.comment_label = QLabel("Student Comment")
         self.comment_label.setProperty("styleClass", "heading")
@@ -341,13 +1185,15 @@ class EditReportsWindow(QMainWindow):
         self.top_layout = QHBoxLayout()
         self.top_layout.addWidget(self.previous_student_button, 0, Qt.AlignLeft)
         self.top_layout.addWidget(self.student_name_label, 1, Qt.AlignCenter)
+        self.top_layout.addWidget(self.student_combo, 0, Qt.AlignRight)
         self.top_layout.addWidget(self.next_student_button, 0, Qt.AlignRight)
         self.layout.addLayout(self.top_layout)
         self.middle_layout = QVBoxLayout()
         self.middle_layout.addWidget(self.intro_comment_label)
         self.middle_layout.addWidget(self.intro_comment)
         self.middle_layout.addWidget(self.comment_bank_label)
-        self.middle_layout.addWidget(self.comment_bank_listwidget)
+        self.middle_layout.addWidget(self.comment_search_entry)
+        self.middle_layout.addWidget(self.comment_bank_listview)
         self.middle_layout.addWidget(self.add_comment_button)
         self.middle_layout.addWidget(self.comment_label)
         self.middle_layout.addWidget(self.comment_textedit)
@@ -360,18 +1206,68 @@ class EditReportsWindow(QMainWindow):
         # Slots
         self.previous_student_button.clicked.connect(self.do_previous_student)
         self.next_student_button.clicked.connect(self.do_next_student)
-        self.comment_bank_listwidget.itemSelectionChanged.connect(self.do_update_comment_bank_selection)
+        self.student_combo.activated.connect(self.do_go_to_student)
+        self.comment_bank_listview.selectionModel().selectionChanged.connect(self.do_update_comment_bank_selection)
+        self.comment_search_entry.textChanged.connect(self.comment_bank_filter.set_search)
         self.add_comment_button.clicked.connect(self.do_add_comment)
         self.cancel_button.clicked.connect(self.do_cancel)
         self.save_button.clicked.connect(self.do_save)
 
+        # Restored comments are styled again, as they may have been saved while being typed
+        for s_index in restored:
+            self.set_comment(s_index, self.subject['students'][s_index]['comment'])
+
         # Initial UI Update
         self.update_ui()
 
+        # Autosave, once the comment box has the first student's comment
+        self.autosaver = Autosaver(subject_name, 'reports', lambda: self.draft(self.comment_textedit.toPlainText()),
+            saved_draft, self)
+        self.comment_textedit.textChanged.connect(self.autosaver.changed)
+
         self.widget = QWidget()
         self.widget.setLayout(self.layout)
         self.setCentralWidget(self.widget)
 
+    def draft(self, comment=None):
+        """
+        Params:
+            comment: string or None - the current student's comment, if it has been edited
+
+        Returns:
+            dict - a draft of the students' comments for the autosaver
+        """
+        students = [[student['first_name'], student['last_name'], student['comment']] for student in self.subject['students']]
+        if comment is not None:
+            students[self.s_index][2] = comment
+        return {"students": students}
+
+    def restore_draft(self, saved_draft):
+        """
+        Offers to restore students' comments from a draft left by a window that wasn't saved. Comments are only
+        restored for students still in the same place in the subject.
+
+        Params:
+            saved_draft: dict - the draft of the subject as saved
+
+        Returns:
+            list of ints - indexes of the students whose comments were restored
+        """
+        subject_name = self.subject['subject_name']
+        draft = could_try_harder.load_draft(subject_name, 'reports')
+        if draft is None:
+            return []
+        students = self.subject['students']
+        restored = [index for index, (first_name, last_name, comment) in enumerate(draft.get('students', [])[:len(students)])
+                    if [first_name, last_name] == [students[index]['first_name'], students[index]['last_name']]
+                    and comment != students[index]['comment']]
+        if not restored or not ask_to_restore_draft(None, subject_name, draft):
+            could_try_harder.delete_draft(subject_name, 'reports')
+            return []
+        for index in restored:
+            students[index]['comment'] = draft['students'][index][2]
+        return restored
+
     def update_ui(self):
         # Page title
         self.student_name_label.setText(self.student['first_name'] + " " + self.student['last_name'])
@@ -386,20 +1282,86 @@ class EditReportsWindow(QMainWindow):
         else:
             self.next_student_button.setEnabled(False)
 
+        self.student_combo.setCurrentIndex(self.s_index)
+
         self.do_update_comment_bank_selection()
 
-        # Intro comment
-        self.intro_comment.setText(could_try_harder.do_placeholders(self.subject['intro_comment'], self.student['first_name'], self.student['pronouns']))
+        if self.intro_task is not None:
+            self.intro_task.cancel()
+            self.intro_task = None
+        prefetched = self.prefetched.get(could_try_harder.get_render_key(self.student))
+        if prefetched is not None:
+            # Intro comment and comment bank already rendered in the background
+            self.intro_comment.setText(prefetched['intro_comment'])
+            self.comment_bank_model.set_student(self.student, prefetched['comment_bank'])
+        else:
+            # Intro comment, rendered in the background. Shows the comment with its placeholders until then.
+            self.intro_comment.setText(self.templates.intro_comment)
+            self.intro_task = get_task_runner('render').run(
+                self.templates.render_intro, self.student['first_name'], self.student['pronouns'],
+                on_finished=self.intro_comment.setText)
+
+            # Comment Bank (only the visible comments are rendered)
+            self.comment_bank_model.set_student(self.student)
 
-        # Comment Bank
-        self.comment_bank_listwidget.clear()
-        for comment in self.subject['comment_bank']:
-            self.comment_bank_listwidget.addItem(could_try_harder.do_placeholders(comment, self.student['first_name'], self.student['pronouns']))
+        self.prefetch_students()
 
         # Student Comment
         self.comment_textedit.clear()
         self.comment_textedit.insertPlainText(self.student['comment'])
 
+    def prefetch_students(self):
+        """
+        Renders the intro comment and comment bank in the background for the config.PREFETCH_STUDENTS students
+        either side of the current one, so moving to them is instant. Results outside that window are dropped. The
+        current student is left to the comment bank model, which only renders the rows being shown.
+        """
+        students = self.subject['students']
+        wanted = []
+        for distance in range(1, config.PREFETCH_STUDENTS + 1):
+            wanted.extend(index for index in (self.s_index + distance, self.s_index - distance) if 0 <= index < len(students))
+        wanted_keys = {could_try_harder.get_render_key(students[index]) for index in wanted}
+        for key in list(self.prefetched):
+            if key not in wanted_keys:
+                del self.prefetched[key]
+        for key in list(self.prefetch_tasks):
+            if key not in wanted_keys:
+                task = self.prefetch_tasks.pop(key)
+                if task not in self.prefetch_tasks.values():
+                    task.cancel()
+
+        # Closest students first, rendered together so students with the same name and pronouns are only rendered once
+        batch = [students[index] for index in wanted
+                 if could_try_harder.get_render_key(students[index]) not in self.prefetched
+                 and could_try_harder.get_render_key(students[index]) not in self.prefetch_tasks]
+        if batch:
+            keys = [could_try_harder.get_render_key(student) for student in batch]
+            task = get_task_runner('render').run(
+                could_try_harder.render_students, self.templates, batch,
+                on_finished=functools.partial(self.prefetched_students, keys))
+            for key in keys:
+                self.prefetch_tasks[key] = task
+
+    def prefetched_students(self, keys, rendered):
+        """
+        Keeps the rendered intro comments and comment banks from prefetch_students.
+
+        Params:
+            keys: list of tuples from could_try_harder.get_render_key
+            rendered: list of dicts from could_try_harder.render_students
+        """
+        for key, result in zip(keys, rendered):
+            if self.prefetch_tasks.pop(key, None) is not None:
+                self.prefetched[key] = result
+        result = self.prefetched.get(could_try_harder.get_render_key(self.student))
+        if result is not None and not self.comment_bank_model.is_rendered():
+            # Finished before the visible rows did
+            if self.intro_task is not None:
+                self.intro_task.cancel()
+                self.intro_task = None
+            self.intro_comment.setText(result['intro_comment'])
+            self.comment_bank_model.set_student(self.student, result['comment_bank'])
+
     def load_student(self):
         """
         Loads student into the self.student dict temporarily
@@ -411,10 +1373,34 @@ class EditReportsWindow(QMainWindow):
         Saves student comment into the self.subject dict temporarily. Not saved into the save file.
         """
         comment = self.comment_textedit.toPlainText()
-        comment = could_try_harder.do_placeholders(comment, self.student['first_name'], self.student['pronouns'])
-        comment = could_try_harder.do_style(comment)
+        if comment != self.subject['students'][self.s_index]['comment']:
+            self.set_comment(self.s_index, comment)
+
+    def set_comment(self, s_index, comment):
+        """
+        Changes a student's comment in the self.subject dict.
+
+        The comment is stored as typed straight away, then replaced with the styled comment once that has been worked
+        out in the background (unless it has been edited again in the meantime).
+
+        Params:
+            s_index: int - index of the student
+            comment: string
+        """
+        student = self.subject['students'][s_index]
+        student['comment'] = comment
+        self.student_model.student_changed(s_index)
+
+        def styled(styled_comment):
+            if student['comment'] != comment:
+                return
+            student['comment'] = styled_comment
+            self.student_model.student_changed(s_index)
+            if s_index == self.s_index and self.comment_textedit.toPlainText() == comment:
+                self.comment_textedit.setPlainText(styled_comment)
+            self.autosaver.changed()
 
-        self.subject['students'][self.s_index]['comment'] = comment
+        get_task_runner('edit').run(style_comment, comment, student['first_name'], student['pronouns'], on_finished=styled)
 
     @Slot()
     def do_next_student(self):
@@ -432,37 +1418,119 @@ class EditReportsWindow(QMainWindow):
             self.load_student()
             self.update_ui()
 
+    @Slot(int)
+    def do_go_to_student(self, index):
+        if index != self.s_index:
+            self.save_comment()
+            self.s_index = index
+            self.load_student()
+            self.update_ui()
+
+    def current_comment_row(self):
+        """
+        Returns:
+            int - row in the comment bank of the selected comment
+        """
+        return self.comment_bank_filter.source_row(self.comment_bank_listview.currentIndex().row())
+
     @Slot()
     def do_update_comment_bank_selection(self):
         # Enable/Disable the Add Comment button
-        if self.comment_bank_listwidget.selectedItems():
+        if self.comment_bank_listview.selectionModel().hasSelection():
             self.add_comment_button.setEnabled(True)
         else:
             self.add_comment_button.setEnabled(False)
 
     @Slot()
     def do_add_comment(self):
+        if not self.comment_bank_listview.currentIndex().isValid():
+            return
         # Add a space if we need to.
         if not self.comment_textedit.textCursor().atStart() and not self.comment_textedit.textCursor().block().text().endswith(" "):
             self.comment_textedit.insertPlainText(" ")
-        self.comment_textedit.insertPlainText(self.comment_bank_listwidget.currentItem().text())
+        self.comment_textedit.insertPlainText(self.comment_bank_model.get_text(self.current_comment_row()))
 
     @Slot()
     def do_save(self):
         self.save_comment()
-        if could_try_harder.save(self.subject):
-            self.close()
-        else:
-            # TODO better error handling here
-            print("Save failed")
+        self.save_button.setEnabled(False)
+        # Saves once the comments still being styled are back
+        get_task_runner('edit').after_running_tasks(self.save_subject)
+
+    def save_subject(self):
+        """
+        Saves the subject in the background, closing the window once it's saved.
+        """
+        def saved(success):
+            if success:
+                self.autosaver.discard()
+                self.close()
+            else:
+                # TODO better error handling here
+                print("Save failed")
+                self.save_button.setEnabled(True)
+
+        get_task_runner('edit').run(could_try_harder.save, copy_subject(self.subject), on_finished=saved)
 
     @Slot()
     def do_cancel(self):
         self.close()
 
+    def closeEvent(self, event):
+        # Keeps changes made since the last draft, e.g. when cancelled
+        self.autosaver.flush()
+        # After any save still running
+        get_task_runner('edit').run(could_try_harder.release_subject, self.subject['subject_name'])
+        QMainWindow.closeEvent(self, event)
+
+
+# Methods timed when profiling is turned on (see profiling.py), as well as every do_ slot
+PROFILED_METHODS = ['update_ui', 'update_saved_list', 'update_comment_bank', 'save_comment', 'save_subject',
+                    'load_student', 'prefetch_students', 'render_pending', 'set_student', 'data', 'draft']
+
+def instrument_app():
+    """
+    Times could_try_harder's main functions and the windows' slots when profiling is turned on.
+    """
+    profiling.instrument(could_try_harder, could_try_harder.PROFILED_FUNCTIONS)
+    for owner in (MainWindow, EditCommentBankWindow, EditReportsWindow, CommentBankModel, CommentFilterModel, Autosaver):
+        profiling.instrument(owner, [name for name in vars(owner) if name.startswith('do_') or name in PROFILED_METHODS])
+
+def print_startup_report(timings):
+    """
+    Prints how long each stage of start up took, for the --profile-startup option.
+
+    Params:
+        timings: list of (stage name, time.perf_counter() value at the end of the stage) tuples
+    """
+    print("Startup profile:")
+    previous = STARTUP_TIME
+    for stage, finished in timings:
+        print("  {:<24}{:>8.1f} ms".format(stage, (finished - previous) * 1000))
+        previous = finished
+    print("  {:<24}{:>8.1f} ms".format("Time to first window", (previous - STARTUP_TIME) * 1000))
+    print("  TextBlob loaded: {}".format("yes" if 'textblob' in sys.modules else "no"))
+
 
 if __name__ == '__main__':
+    profile_startup = '--profile-startup' in sys.argv
+    if profile_startup:
+        sys.argv.remove('--profile-startup')
+    if profiling.enable():
+        instrument_app()
+    timings = [("Imports", time.perf_counter())]
     app = QApplication(sys.argv)
+    timings.append(("QApplication", time.perf_counter()))
     main = MainWindow()
+    timings.append(("MainWindow", time.perf_counter()))
     main.show()
-    sys.exit(app.exec_())
+    timings.append(("Show", time.perf_counter()))
+    if profile_startup:
+        # Runs once the event loop has started and the window has been drawn.
+        QTimer.singleShot(0, lambda: print_startup_report(timings + [("First event loop", time.perf_counter())]))
+    if config.WARM_UP_ON_STARTUP:
+        QTimer.singleShot(0, could_try_harder.warm_up_in_background)
+    exit_code = app.exec_()
+    # Let any saves still running finish
+    get_task_runner('edit').wait()
+    sys.exit(exit_code)
@@ -0,0 +1,74 @@
+# Could Try Harder - Simple report comment builder for teachers.
+# Copyright (C) 2020 Evan M. Sanders
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Replacing files atomically, so a crash part way through saving leaves
+# either the old file or the new one, never a mixture. Used by every storage
+# backend that writes files.
+
+import os
+import tempfile
+
+def write(filename, write_function, binary=False, sync=True, **open_options):
+    """
+    Writes a file by calling write_function() on a temporary file then renaming it over the original, so the
+    original is either left alone or completely replaced. The new file gets the same permissions as the original (or,
+    if there isn't one, the permissions a new file would normally get).
+
+    Params:
+        filename: string
+        write_function: function called with the temporary file, open for writing
+        binary: Boolean - open the temporary file in binary mode rather than text mode
+        sync: Boolean - wait for the file to reach the disk before renaming it
+        open_options: passed to open(), e.g. encoding
+
+    Returns:
+        os.stat_result of the new file
+    """
+    folder, basename = os.path.split(filename)
+    handle, temp_filename = tempfile.mkstemp(prefix='.' + basename + '.', suffix='.tmp', dir=folder or '.')
+    try:
+        # mkstemp makes files only the owner can read
+        os.chmod(temp_filename, get_file_mode(filename))
+        with os.fdopen(handle, 'wb' if binary else 'w', **open_options) as file_out:
+            write_function(file_out)
+            file_out.flush()
+            if sync:
+                os.fsync(file_out.fileno())
+            stat = os.fstat(file_out.fileno())
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+    return stat
+
+def get_file_mode(filename):
+    """
+    Returns:
+        int - the permissions of a file, or those a new file gets if it doesn't exist
+    """
+    try:
+        return os.stat(filename).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+def _get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+# Read once at import, since it can only be read by changing it, which isn't safe once other threads are running
+_UMASK = _get_umask()
@@ -0,0 +1,390 @@
+# Could Try Harder - Simple report comment builder for teachers.
+# Copyright (C) 2020 Evan M. Sanders
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Benchmarks for the text processing and storage code in could_try_harder,
+# using made up classes and comment banks. Doesn't need QT.
+#
+#   python benchmark.py --output results.json
+#   python benchmark.py --baseline results.json
+#
+# Comparing against a baseline flags any benchmark that has got slower by more
+# than --threshold, and exits with status 1 if there are any.
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import fnmatch
+import itertools
+import argparse
+import platform
+import tempfile
+import statistics
+import config
+import could_try_harder
+import binary_storage
+
+# Bump when benchmarks change in a way that makes older results incomparable
+RESULTS_VERSION = 1
+
+FIRST_NAMES = ["Samantha", "Oliver", "Aisha", "Jack", "Mei", "Noah", "Zoë", "Liam", "Priya", "Ethan", "Sofia", "Kai",
+               "Amelia", "Mateo", "Isla", "Arjun", "Grace", "Finn", "Leila", "Tom"]
+LAST_NAMES = ["O'Brien", "Smith", "Nguyen", "Patel", "Jones", "García", "Williams", "Chen", "Brown", "Taylor",
+              "Kowalski", "Murphy", "Singh", "Martin", "Walker", "Ahmed", "Clarke", "Evans", "Khan", "Wright"]
+PHRASES = [
+    "<name> has worked hard this term",
+    "<sp> always completes <pa> homework on time",
+    "i would encourage <op> to ask more questions in class",
+    "<name>'s writing has improved a lot , especially <pa> use of paragraphs",
+    "<sp> should be proud of <rp>",
+    "the project was entirely <pp>",
+    "<name> needs to focus on revision before the exam",
+    "group work is a strength and <sp> listens well to others",
+    "<sp> has shown real curiosity e.g. in the science fair",
+    "homework is sometimes late , which holds <op> back",
+    "<name> contributes thoughtfully to discussions",
+    "<pa> results in the mid-year test were excellent",
+]
+
+def make_students(count, rng):
+    """
+    Params:
+        count: int
+        rng: random.Random
+
+    Returns:
+        list of student dicts with random names and genders, and empty comments
+    """
+    students = []
+    for i in range(count):
+        gender = rng.choice(['Male', 'Female'])
+        students.append({
+            "first_name": rng.choice(FIRST_NAMES),
+            "last_name": rng.choice(LAST_NAMES),
+            "gender": gender,
+            "pronouns": list(config.PRONOUNS['male' if gender == 'Male' else 'female']),
+            "comment": ""
+        })
+    return students
+
+def make_comment(rng, sentences):
+    """
+    Returns:
+        string - a comment made of random phrases, unstyled and not capitalised
+    """
+    return " ".join(rng.choice(PHRASES) + rng.choice([".", ".", "!", "  ."]) for i in range(sentences))
+
+def make_comment_bank(count, rng, sentences=1):
+    """
+    Returns:
+        list of strings - comments with placeholders, with a number on the end so they are all different
+    """
+    return ["{} ({})".format(make_comment(rng, sentences), i) for i in range(count)]
+
+def make_subject(subject_name, students, bank, rng, comment_sentences=3):
+    """
+    Returns:
+        dict - a subject with every student's comment written
+    """
+    subject = {
+        "subject_name": subject_name,
+        "intro_comment": "<name> has studied english this year.",
+        "comment_bank": make_comment_bank(bank, rng),
+        "students": make_students(students, rng)
+    }
+    for student in subject['students']:
+        student['comment'] = could_try_harder._do_placeholders_uncompiled(
+            make_comment(rng, comment_sentences), student['first_name'], student['pronouns'])
+    return subject
+
+def write_class_list(filename, students, rng):
+    """
+    Writes a csv class list in the form import_class_list() reads.
+    """
+    with open(filename, 'w', newline='', encoding='utf-8') as csv_out:
+        writer = csv.writer(csv_out)
+        for student in make_students(students, rng):
+            writer.writerow([student['first_name'], student['last_name'], student['gender']])
+
+# (name, setup function, included in --quick runs)
+BENCHMARKS = []
+
+def benchmark(name, quick=True):
+    """
+    Registers a benchmark. The decorated function sets it up in a temporary data folder and returns the function to
+    time.
+
+    Params:
+        name: string
+        quick: Boolean - also run with --quick
+    """
+    def register(setup):
+        BENCHMARKS.append((name, setup, quick))
+        return setup
+    return register
+
+def _register_text_benchmarks():
+    for sentences, label in [(1, "short"), (12, "long")]:
+        @benchmark("do_style/{}".format(label))
+        def setup(rng, sentences=sentences):
+            comments = [make_comment(rng, sentences) for i in range(50)]
+            return lambda: [could_try_harder.do_style(comment) for comment in comments]
+
+        @benchmark("capitalise_sentences/{}".format(label))
+        def setup(rng, sentences=sentences):
+            comments = [make_comment(rng, sentences) for i in range(50)]
+            return lambda: [could_try_harder._capitalise_sentences(comment) for comment in comments]
+
+    @benchmark("style_student_comment/edit-long")
+    def setup(rng):
+        comment = make_comment(rng, 40)
+        student = make_students(1, rng)[0]
+        edits = itertools.count()
+
+        def run():
+            # Saving after typing one more sentence. This relies on the sentence cache, so it is always on.
+            cache_enabled = config.CACHE_ENABLED
+            config.CACHE_ENABLED = True
+            try:
+                edited = "{} and {} more.".format(comment, next(edits))
+                could_try_harder.style_student_comment(edited, student['first_name'], student['pronouns'])
+            finally:
+                config.CACHE_ENABLED = cache_enabled
+        return run
+
+    for bank in [10, 200, 2000]:
+        @benchmark("do_placeholders/bank-{}".format(bank), quick=bank <= 200)
+        def setup(rng, bank=bank):
+            comments = make_comment_bank(bank, rng)
+            student = make_students(1, rng)[0]
+            return lambda: [could_try_harder.do_placeholders(comment, student['first_name'], student['pronouns'])
+                            for comment in comments]
+
+    for students, bank in [(30, 10), (30, 200), (500, 2000)]:
+        @benchmark("render_subject/{}x{}".format(students, bank), quick=bank <= 200)
+        def setup(rng, students=students, bank=bank):
+            subject = make_subject("render", students, bank, rng, 1)
+
+            def run():
+                # Compiled templates are part of what's being timed
+                could_try_harder.invalidate_templates()
+                could_try_harder._template_cache.clear()
+                could_try_harder.render_subject(subject)
+            return run
+
+    @benchmark("comment_index/search-2000", quick=False)
+    def setup(rng):
+        index = could_try_harder.CommentIndex(make_comment_bank(2000, rng))
+        return lambda: [index.search(search) for search in ["h", "ha", "has", "has wor", "homework la", "exam"]]
+
+def _register_storage_benchmarks():
+    for students in [30, 5000]:
+        @benchmark("import_class_list/{}".format(students), quick=students <= 30)
+        def setup(rng, students=students):
+            filename = os.path.join(config.DATA_FOLDER, "class-{}.csv".format(students))
+            write_class_list(filename, students, rng)
+            return lambda: could_try_harder.import_class_list(filename, "imported")
+
+    for students, bank in [(30, 10), (30, 200), (5000, 2000)]:
+        quick = students <= 30
+        name = "{}x{}".format(students, bank)
+
+        @benchmark("save/" + name, quick)
+        def setup(rng, students=students, bank=bank):
+            subject = make_subject("save", students, bank, rng)
+            return lambda: could_try_harder.save(subject)
+
+        @benchmark("load/" + name, quick)
+        def setup(rng, students=students, bank=bank):
+            could_try_harder.save(make_subject("load", students, bank, rng))
+            return lambda: could_try_harder.load("load")
+
+        @benchmark("load-binary/" + name, quick)
+        def setup(rng, students=students, bank=bank):
+            binary_storage.save(make_subject("binary", students, bank, rng))
+            return lambda: binary_storage.load("binary")
+
+        @benchmark("load-binary-comment-bank/" + name, quick)
+        def setup(rng, students=students, bank=bank):
+            binary_storage.save(make_subject("binary", students, bank, rng))
+            return lambda: binary_storage.load_comment_bank("binary")
+
+        @benchmark("export-txt/" + name, quick)
+        def setup(rng, students=students, bank=bank):
+            could_try_harder.save(make_subject("export", students, bank, rng))
+            filename = os.path.join(config.DATA_FOLDER, "export.txt")
+            return lambda: could_try_harder.export("export", filename, 'txt')
+
+    @benchmark("get_subject_summaries/200", quick=False)
+    def setup(rng):
+        for i in range(200):
+            could_try_harder.save(make_subject("summary-{}".format(i), 30, 50, rng))
+        return could_try_harder.get_subject_summaries
+
+_register_text_benchmarks()
+_register_storage_benchmarks()
+
+def time_benchmark(function, repeat, min_time):
+    """
+    Times a function like timeit: each repeat calls it enough times to take at least min_time seconds.
+
+    Returns:
+        dict with the best and median seconds per call, and how many calls were made in each repeat
+    """
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for i in range(number):
+            function()
+        taken = time.perf_counter() - started
+        if taken >= min_time or number >= 1000000:
+            break
+        number *= 10 if taken < min_time / 10 else 2
+    timings = [taken / number]
+    for i in range(repeat - 1):
+        started = time.perf_counter()
+        for i in range(number):
+            function()
+        timings.append((time.perf_counter() - started) / number)
+    return {"best": min(timings), "median": statistics.median(timings), "number": number, "repeat": repeat}
+
+def run_benchmarks(patterns=None, quick=False, repeat=5, min_time=0.2, seed=1):
+    """
+    Runs the benchmarks, each in its own temporary data folder.
+
+    Params:
+        patterns: list of glob patterns for the benchmark names to run, or None for all of them
+        quick: Boolean - only run the smaller benchmarks
+        repeat: int - number of timings to take of each benchmark
+        min_time: float - seconds each timing should take at least
+        seed: int - for the random classes and comments
+
+    Returns:
+        dict of benchmark name: dict from time_benchmark
+    """
+    results = {}
+    data_folder = config.DATA_FOLDER
+    try:
+        for name, setup, in_quick in BENCHMARKS:
+            if quick and not in_quick:
+                continue
+            if patterns and not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                continue
+            with tempfile.TemporaryDirectory() as folder:
+                config.DATA_FOLDER = folder + os.sep
+                function = setup(random.Random(seed))
+                results[name] = time_benchmark(function, repeat, min_time)
+            print("{:<36}{:>12}".format(name, format_seconds(results[name]['best'])), flush=True)
+    finally:
+        config.DATA_FOLDER = data_folder
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Prints each benchmark's time next to the baseline's.
+
+    Params:
+        results: dict from run_benchmarks
+        baseline: dict from run_benchmarks
+        threshold: float - fraction slower than the baseline that counts as a regression
+
+    Returns:
+        list of strings - names of the benchmarks that regressed
+    """
+    regressions = []
+    print()
+    print("{:<36}{:>12}{:>12}{:>10}".format("Benchmark", "Baseline", "Now", "Change"))
+    for name, result in results.items():
+        if name not in baseline:
+            print("{:<36}{:>12}{:>12}".format(name, "-", format_seconds(result['best'])))
+            continue
+        change = result['best'] / baseline[name]['best'] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  SLOWER"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        print("{:<36}{:>12}{:>12}{:>+9.0%}{}".format(
+            name, format_seconds(baseline[name]['best']), format_seconds(result['best']), change, flag))
+    return regressions
+
+def format_seconds(seconds):
+    """
+    Returns:
+        string - a time in the most readable unit
+    """
+    for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+        if seconds >= scale:
+            return "{:.2f} {}".format(seconds / scale, unit)
+    return "{:.0f} ns".format(seconds / 1e-9)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark could_try_harder's text processing and storage.")
+    parser.add_argument("patterns", nargs="*", metavar="BENCHMARK", help="names or glob patterns of benchmarks to run")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    parser.add_argument("--quick", action="store_true", help="only run the smaller benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="timings to take of each benchmark (default 5)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds each timing takes at least (default 0.2)")
+    parser.add_argument("--cache", action="store_true", help="leave the caches on (they are off by default, so "
+                        "repeated calls aren't just cache lookups)")
+    parser.add_argument("--output", help="save the results to this json file")
+    parser.add_argument("--baseline", help="compare with results saved by --output")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fraction slower than the baseline that counts as a regression (default 0.2)")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, setup, quick in BENCHMARKS:
+            print(name + ("" if quick else "  (not in --quick)"))
+        return 0
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_in:
+            saved = json.load(baseline_in)
+        if saved.get('version') != RESULTS_VERSION:
+            print("{} was saved by a different version of the benchmarks.".format(args.baseline))
+            return 2
+        baseline = saved['results']
+
+    config.CACHE_ENABLED = args.cache
+    results = run_benchmarks(args.patterns, args.quick, args.repeat, args.min_time)
+
+    if args.output:
+        with open(args.output, 'w') as results_out:
+            json.dump({
+                "version": RESULTS_VERSION,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "app_version": config.APP_VERSION,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cache": args.cache,
+                "results": results
+            }, results_out, indent=4)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print()
+            print("{} benchmarks were more than {:.0%} slower than the baseline.".format(len(regressions), args.threshold))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
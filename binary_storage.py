@@ -0,0 +1,413 @@
+# Could Try Harder - Simple report comment builder for teachers.
+# Copyright (C) 2020 Evan M. Sanders
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Compact binary storage backend, used by could_try_harder when
+# config.STORAGE_BACKEND is 'binary'. Each subject is one file in
+# config.DATA_FOLDER which is memory-mapped when opened, so the subject's
+# details, its comment bank or a single student can be read without decoding
+# the rest of the file.
+#
+# File layout (integers are little-endian):
+#   header:  magic b'CTHS', version (uint16), number of sections (uint16)
+#   table:   for each section, its tag (4 bytes), offset and length (uint64)
+#   sections:
+#     INFO - json object with the order of the subject's keys, every key
+#            except the comment bank and students, and counts for summaries
+#     PRON - json list of the different sets of pronouns
+#     BANK - list of comments (see below), utf-8
+#     STUD - list of students, each a json object whose pronouns are a
+#            position in PRON
+# Lists are a count (uint32), count + 1 offsets (uint64) from the end of the
+# offsets, then the items one after the other, so any item can be found
+# without reading the others.
+
+import os
+import io
+import json
+import mmap
+import struct
+import config
+import atomic_files
+
+EXTENSION = '.cth'
+MAGIC = b'CTHS'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHH')
+_SECTION = struct.Struct('<4sQQ')
+_COUNT = struct.Struct('<I')
+_OFFSET = struct.Struct('<Q')
+
+# Subject keys with their own sections
+_LIST_KEYS = ('comment_bank', 'students')
+
+class SubjectFile:
+    """
+    A binary subject, decoding nothing until it is asked for. Files opened with open_subject() should be closed when
+    finished (or used as a context manager), since they stay open, and can't be replaced on some systems, until then.
+
+    Params:
+        data: bytes, or mmap of a file
+        file: the open file data is mapped from, or None
+    """
+
+    def __init__(self, data, file=None):
+        self.data = data
+        self.file = file
+        magic, version, count = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("not a {} subject file".format(config.APP_NAME))
+        if version > VERSION:
+            raise ValueError("saved by a newer version of {}".format(config.APP_NAME))
+        self.sections = {}
+        for index in range(count):
+            tag, offset, length = _SECTION.unpack_from(data, _HEADER.size + index * _SECTION.size)
+            self.sections[tag] = (offset, length)
+        self._info = None
+        self._pronouns = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.file is not None:
+            self.data.close()
+            self.file.close()
+            self.file = None
+
+    def info(self):
+        """
+        Returns:
+            dict with the subject's key 'order', 'values' of every key except the comment bank and students, and
+                'counts' of students, comment bank comments and completed report comments
+        """
+        if self._info is None:
+            self._info = json.loads(self._section(b'INFO').decode('utf-8'))
+        return self._info
+
+    def header(self):
+        """
+        Returns:
+            dict - the subject without its comment bank and students
+        """
+        return dict(self.info()['values'])
+
+    def comment_bank(self):
+        """
+        Returns:
+            list of strings
+        """
+        return [item.decode('utf-8') for item in self._list(b'BANK')]
+
+    def student_count(self):
+        return self._list_count(b'STUD')
+
+    def student(self, index):
+        """
+        Decodes one student.
+
+        Params:
+            index: int - position of the student in the subject
+
+        Returns:
+            dict in the same form as a student in a json save file
+        """
+        return self._decode_student(self._list_item(b'STUD', index))
+
+    def students(self):
+        """
+        Returns:
+            list of dicts
+        """
+        # Parsing them as one json list is much quicker than one at a time
+        students = json.loads(b"[" + b",".join(self._list(b'STUD')) + b"]")
+        for student in students:
+            self._decode_pronouns(student)
+        return students
+
+    def load(self):
+        """
+        Decodes the whole subject.
+
+        Returns:
+            dict in the same form as a json save file
+        """
+        values = self.info()['values']
+        subject = {}
+        for key in self.info()['order']:
+            if key == 'comment_bank':
+                subject[key] = self.comment_bank()
+            elif key == 'students':
+                subject[key] = self.students()
+            else:
+                subject[key] = values[key]
+        return subject
+
+    def _decode_student(self, item):
+        return self._decode_pronouns(json.loads(item.decode('utf-8')))
+
+    def _decode_pronouns(self, student):
+        if isinstance(student.get('pronouns'), int):
+            if self._pronouns is None:
+                self._pronouns = json.loads(self._section(b'PRON').decode('utf-8'))
+            student['pronouns'] = list(self._pronouns[student['pronouns']])
+        return student
+
+    def _section(self, tag):
+        offset, length = self.sections[tag]
+        return self.data[offset:offset + length]
+
+    def _list_count(self, tag):
+        return _COUNT.unpack_from(self.data, self.sections[tag][0])[0]
+
+    def _list_item(self, tag, index):
+        offset = self.sections[tag][0]
+        count = _COUNT.unpack_from(self.data, offset)[0]
+        if not 0 <= index < count:
+            raise IndexError(index)
+        start, end = struct.unpack_from('<2Q', self.data, offset + _COUNT.size + index * _OFFSET.size)
+        base = offset + _COUNT.size + (count + 1) * _OFFSET.size
+        return self.data[base + start:base + end]
+
+    def _list(self, tag):
+        offset = self.sections[tag][0]
+        count = _COUNT.unpack_from(self.data, offset)[0]
+        offsets = struct.unpack_from('<{}Q'.format(count + 1), self.data, offset + _COUNT.size)
+        base = offset + _COUNT.size + (count + 1) * _OFFSET.size
+        return [self.data[base + start:base + end] for start, end in zip(offsets, offsets[1:])]
+
+def dumps(subject):
+    """
+    Encodes a subject in the binary format. loads() gives back a subject equal to the original.
+
+    Params:
+        subject: dict
+
+    Returns:
+        bytes
+    """
+    pronoun_sets = {}
+    students = []
+    for student in subject['students']:
+        student = dict(student)
+        if 'pronouns' in student:
+            student['pronouns'] = pronoun_sets.setdefault(tuple(student['pronouns']), len(pronoun_sets))
+        students.append(json.dumps(student, separators=(',', ':')).encode('utf-8'))
+    info = {
+        "order": list(subject),
+        "values": {key: value for key, value in subject.items() if key not in _LIST_KEYS},
+        "counts": {
+            "students": len(subject['students']),
+            "comment_bank": len(subject['comment_bank']),
+            "completed": sum(1 for student in subject['students'] if student.get('comment', "").strip())
+        }
+    }
+    sections = [
+        (b'INFO', json.dumps(info, separators=(',', ':')).encode('utf-8')),
+        (b'PRON', json.dumps([list(pronouns) for pronouns in pronoun_sets], separators=(',', ':')).encode('utf-8')),
+        (b'BANK', _encode_list([comment.encode('utf-8') for comment in subject['comment_bank']])),
+        (b'STUD', _encode_list(students))
+    ]
+
+    output = io.BytesIO()
+    output.write(_HEADER.pack(MAGIC, VERSION, len(sections)))
+    offset = _HEADER.size + len(sections) * _SECTION.size
+    for tag, data in sections:
+        output.write(_SECTION.pack(tag, offset, len(data)))
+        offset += len(data)
+    for tag, data in sections:
+        output.write(data)
+    return output.getvalue()
+
+def _encode_list(items):
+    """
+    Params:
+        items: list of bytes
+
+    Returns:
+        bytes - a count, offsets and the items, as read by SubjectFile._list()
+    """
+    offsets = [0]
+    for item in items:
+        offsets.append(offsets[-1] + len(item))
+    return b"".join([_COUNT.pack(len(items)), struct.pack('<{}Q'.format(len(offsets)), *offsets)] + items)
+
+def loads(data):
+    """
+    Decodes a whole subject encoded by dumps().
+
+    Params:
+        data: bytes
+
+    Returns:
+        dict
+    """
+    return SubjectFile(data).load()
+
+def open_subject(filename):
+    """
+    Opens a binary subject file, memory-mapping it rather than reading it all in.
+
+    Params:
+        filename: string
+
+    Returns:
+        SubjectFile
+    """
+    subject_file = open(filename, 'rb')
+    try:
+        data = mmap.mmap(subject_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except BaseException:
+        subject_file.close()
+        raise
+    try:
+        return SubjectFile(data, subject_file)
+    except BaseException:
+        data.close()
+        subject_file.close()
+        raise
+
+def get_filename(subject_name):
+    """
+    Returns:
+        string - path of a subject's file in config.DATA_FOLDER
+    """
+    return config.DATA_FOLDER + subject_name + EXTENSION
+
+def get_saved_list():
+    """
+    Returns:
+        list of strings - names of the saved subjects
+    """
+    with os.scandir(config.DATA_FOLDER) as saved_files:
+        return sorted(saved_file.name[:-len(EXTENSION)] for saved_file in saved_files
+                      if saved_file.name.endswith(EXTENSION) and saved_file.is_file())
+
+def get_summaries():
+    """
+    Reads the counts of students, comment bank and completed report comments saved at the start of every subject
+    file, without decoding the rest.
+
+    Returns:
+        dict of subject name: dict in the form returned by could_try_harder.get_subject_summaries
+    """
+    summaries = {}
+    for subject_name in get_saved_list():
+        filename = get_filename(subject_name)
+        summary = {"students": None, "comment_bank": None, "completed": None, "modified": None, "size": None}
+        try:
+            stat = os.stat(filename)
+            summary['modified'] = stat.st_mtime
+            summary['size'] = stat.st_size
+            with open_subject(filename) as subject_file:
+                summary.update(subject_file.info()['counts'])
+        except Exception as err:
+            # TODO better error handling here
+            print(err)
+        summaries[subject_name] = summary
+    return summaries
+
+def load(subject_name):
+    """
+    Loads a whole subject.
+
+    Params:
+        subject_name: string
+
+    Returns:
+        dict in the same form as a json save file, or an empty dict if there is no such subject
+    """
+    if not os.path.exists(get_filename(subject_name)):
+        return {}
+    with open_subject(get_filename(subject_name)) as subject_file:
+        return subject_file.load()
+
+def load_header(subject_name):
+    """
+    Loads a subject without its comment bank or students.
+
+    Params:
+        subject_name: string
+
+    Returns:
+        dict, or None if there is no such subject
+    """
+    if not os.path.exists(get_filename(subject_name)):
+        return None
+    with open_subject(get_filename(subject_name)) as subject_file:
+        return subject_file.header()
+
+def load_comment_bank(subject_name):
+    """
+    Loads just a subject's comment bank.
+
+    Params:
+        subject_name: string
+
+    Returns:
+        list of strings, or None if there is no such subject
+    """
+    if not os.path.exists(get_filename(subject_name)):
+        return None
+    with open_subject(get_filename(subject_name)) as subject_file:
+        return subject_file.comment_bank()
+
+def load_student(subject_name, index):
+    """
+    Loads a single student without decoding the rest of the subject.
+
+    Params:
+        subject_name: string
+        index: int - position of the student in the subject
+
+    Returns:
+        dict, or None if there is no such student
+    """
+    if not os.path.exists(get_filename(subject_name)):
+        return None
+    with open_subject(get_filename(subject_name)) as subject_file:
+        if not 0 <= index < subject_file.student_count():
+            return None
+        return subject_file.student(index)
+
+def save(subject):
+    """
+    Saves a whole subject, replacing its file atomically.
+
+    Params:
+        subject: dict
+    """
+    atomic_files.write(get_filename(subject['subject_name']), lambda subject_out: subject_out.write(dumps(subject)),
+                       binary=True)
+
+def delete(subject_name):
+    """
+    Deletes a subject's file.
+
+    Params:
+        subject_name: string
+
+    Returns:
+        Boolean - False if there was no such subject
+    """
+    try:
+        os.remove(get_filename(subject_name))
+    except FileNotFoundError:
+        return False
+    return True
@@ -21,6 +21,41 @@ APP_VERSION = "1.0"
 # Location to store saved data
 DATA_FOLDER = "./data/"
 
+# Where subjects are saved:
+#   'json' - one json file per subject in DATA_FOLDER
+#   'sqlite' - one SQLite database (SQLITE_FILENAME) in DATA_FOLDER. Use
+#              "python -m could_try_harder migrate-sqlite" to copy existing
+#              json files into it.
+#   'binary' - one compact binary file per subject in DATA_FOLDER, which can
+#              be opened without reading all of it. Convert existing json
+#              files with "python -m could_try_harder convert --to binary"
+#              (and back with --to json).
+STORAGE_BACKEND = 'json'
+SQLITE_FILENAME = 'could-try-harder.sqlite3'
+
+# How subjects are saved with the json backend:
+#   'snapshot' - the whole json file is rewritten on every save
+#   'journal' - changes to comments and the comment bank are appended to a
+#               journal file next to the json file, which is rewritten once
+#               the journal has JOURNAL_COMPACT_ENTRIES entries
+STORAGE_MODE = 'snapshot'
+JOURNAL_COMPACT_ENTRIES = 500
+
+# Store comment banks in a library shared by every subject in DATA_FOLDER
+# (COMMENT_LIBRARY_FILENAME), so each comment is saved once however many
+# subjects use it, and subjects' json files just list the ids of their
+# comments. Subjects saved like this need the library to be copied with them,
+# and can't be opened by versions without the library. When this is False,
+# subjects saved with the library are still loaded from it, and get their
+# whole comment bank back when they are next saved.
+COMMENT_LIBRARY = False
+COMMENT_LIBRARY_FILENAME = '.comment-library'
+
+# File in DATA_FOLDER holding the number of students, comments and so on in
+# each json file, so the list of subjects doesn't need to open every file.
+# It is rebuilt automatically if deleted.
+MANIFEST_FILENAME = '.manifest'
+
 # Default window size
 DEFAULT_WINDOW_SIZE = "800x600"
 
@@ -74,6 +109,62 @@ STYLE_RULES = [
     ("exam(?!ination)", "examination")
 ]
 
+# How to capitalise the start of each sentence after placeholders and style
+# rules are applied:
+#   'builtin' - fast, keeps line breaks and spacing as they are. A line
+#               break on its own doesn't start a new sentence.
+#   'textblob' - uses TextBlob (requires textblob and its corpora to be
+#                installed). Joins sentences with single spaces.
+SENTENCE_CAPITALISER = 'builtin'
+
+# Style student comments one sentence at a time, caching each styled sentence,
+# so saving a long comment after a small edit only restyles the sentences that
+# changed. Only used with the 'builtin' capitaliser and style rules that can't
+# match the end of a sentence, otherwise whole comments are styled at once.
+INCREMENTAL_STYLE = True
+
+# Load TextBlob (if used) and compile style rules on a background thread once
+# the main window is showing, instead of when the first comment is processed.
+WARM_UP_ON_STARTUP = True
+
+# Number of students either side of the current one whose intro comment and
+# comment bank are rendered in the background on the Edit Reports window, so
+# moving to the next or previous student doesn't wait for them. 0 turns this
+# off.
+PREFETCH_STUDENTS = 2
+
+# Unsaved changes on the edit windows are saved in the background as drafts
+# in DATA_FOLDER, AUTOSAVE_DELAY milliseconds after the last change (or
+# AUTOSAVE_MAX_DELAY after the first one, if changes keep coming). Drafts
+# survive Cancel and crashes, and are offered back the next time the window is
+# opened. 0 turns this off.
+AUTOSAVE_DELAY = 2000
+AUTOSAVE_MAX_DELAY = 10000
+
+# Opt-in profiling (see profiling.py), a comma separated list of any of:
+#   'calls' - call counts and latency histograms for the main functions
+#   'cprofile' - cProfile of the whole session
+#   'tracemalloc' - what is using the most memory when the app exits
+# or None for no profiling. The COULD_TRY_HARDER_PROFILE environment variable
+# overrides this. Results are saved to PROFILE_FILE (or the
+# COULD_TRY_HARDER_PROFILE_FILE environment variable) on exit.
+PROFILE = None
+PROFILE_FILE = 'could-try-harder-profile.json'
+
+# Results of do_placeholders(), do_style() and sentence capitalisation are
+# cached so that rendering the same comment again is free. CACHE_SIZE is the
+# maximum number of results kept by each cache.
+CACHE_ENABLED = True
+CACHE_SIZE = 4096
+
+# Words that are followed by a full stop without ending the sentence (lower
+# case, without the final full stop). Initials (e.g. "J. Smith") don't need to
+# be listed: the name after them is already capitalised.
+ABBREVIATIONS = [
+    'mr', 'mrs', 'ms', 'mx', 'dr', 'prof', 'st', 'mt',
+    'e.g', 'i.e', 'eg', 'ie', 'cf', 'vs', 'approx', 'incl', 'esp'
+]
+
 PLACEHOLDER_INSTRUCTIONS = """
 Placeholders:
 <name> = Student name
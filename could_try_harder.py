@@ -17,256 +17,3498 @@
 import sys
 import os
 import csv
+import codecs
 import json
+import bisect
+import hashlib
+import unicodedata
 import re
-from textblob import TextBlob
+import io
+import time
+import uuid
+import glob
+import fnmatch
+import argparse
+import itertools
+import functools
+import threading
+import collections
+import collections.abc
+import contextlib
+import difflib
+import concurrent.futures
 import config
+import profiling
+import atomic_files
+import sqlite_storage
+import binary_storage
+
+try:
+    # Python 3.11+ keeps the regex parser private.
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+class LRUCache:
+    """
+    A size-bounded cache which throws away the least recently used entry when it is full. Counts hits, misses and
+    evictions so cache_info() can show how well it is working.
+
+    Params:
+        maxsize: int - maximum number of entries
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Params:
+            key: hashable
+            default: returned if the key isn't in the cache
+
+        Returns:
+            the cached value or default
+        """
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Params:
+            key: hashable
+            value: anything
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def resize(self, maxsize):
+        """
+        Params:
+            maxsize: int - new maximum number of entries
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all entries and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def info(self):
+        """
+        Returns:
+            dict with the cache's hits, misses, evictions, size and maxsize
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize
+            }
+
+# Caches used by the memoised functions below, by name.
+_caches = {}
+
+# Marks a cache miss, since None could be a cached value.
+_MISSING = object()
+
+def _memoised(name, make_key):
+    """
+    Decorator which caches a function's results in an LRUCache, unless config.CACHE_ENABLED is False.
+
+    Params:
+        name: string - name of the cache, for cache_info()
+        make_key: function taking the same arguments as the decorated function and returning a hashable key
+
+    Returns:
+        decorator
+    """
+    cache = LRUCache(config.CACHE_SIZE)
+    _caches[name] = cache
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args):
+            if not config.CACHE_ENABLED:
+                return function(*args)
+            key = make_key(*args)
+            result = cache.get(key, _MISSING)
+            if result is _MISSING:
+                result = function(*args)
+                cache.put(key, result)
+            return result
+        return wrapper
+    return decorator
+
+def cache_info():
+    """
+    Gets hit, miss and eviction counts for each of the text processing caches.
+
+    Returns:
+        dict of cache name: dict
+    """
+    return {name: cache.info() for name, cache in _caches.items()}
+
+def clear_caches():
+    """
+    Empties all of the text processing caches and resets their counters.
+    """
+    for cache in _caches.values():
+        cache.clear()
+
+def set_cache_size(maxsize):
+    """
+    Changes the maximum number of entries in each text processing cache.
+
+    Params:
+        maxsize: int
+    """
+    config.CACHE_SIZE = maxsize
+    for cache in _caches.values():
+        cache.resize(maxsize)
 
 def get_saved_list():
     """
     Get a list of saved class reports.
-    Scans the data folder defined in config.DATA_FOLDER for json files and returns a list of strings containing the file names (but not extensions).
+    Lists the json files in the data folder defined in config.DATA_FOLDER (using the manifest of saved subjects, see
+    get_subject_summaries) and returns a list of strings containing the file names (but not extensions).
+    If config.STORAGE_BACKEND is 'sqlite' or 'binary', lists the subjects saved that way instead.
+
+    Returns:
+        list of strings
+    """
+    storage = _get_storage()
+    if storage is not None:
+        try:
+            return storage.get_saved_list()
+        except Exception as err:
+            # TODO better error handling here
+            print(err)
+            return []
+    return sorted(get_subject_summaries())
+
+def _get_storage():
+    """
+    Returns:
+        the module saving subjects for config.STORAGE_BACKEND, or None if they are saved as json files
+    """
+    return _STORAGE_BACKENDS.get(config.STORAGE_BACKEND)
+
+# Storage backends other than json files. Each module has get_saved_list(), get_summaries(), load(), save(),
+# delete(), load_comment_bank() and load_student() functions.
+_STORAGE_BACKENDS = {
+    'sqlite': sqlite_storage,
+    'binary': binary_storage
+}
+
+def _get_saved_json_list():
+    """
+    Lists the subjects saved as json files in config.DATA_FOLDER.
 
     Returns:
         list of strings
     """
-    saved_list = []
+    return list(_get_saved_json_stamps())
+
+def _get_saved_json_stamps():
+    """
+    Scans config.DATA_FOLDER for json files and their journals.
+
+    Returns:
+        dict of subject name: list of the json file's modified time (in nanoseconds) and size, followed by the same for
+            its journal (or zeros if there is no journal)
+    """
+    stamps = {}
+    journals = {}
     with os.scandir(config.DATA_FOLDER) as saved_files:
         for saved_file in saved_files:
             if saved_file.name.endswith('.json') and saved_file.is_file():
-                # Append the filename without the extension
-                saved_list.append(saved_file.name[:-5])
-    return saved_list
+                stat = saved_file.stat()
+                # Key on the filename without the extension
+                stamps[saved_file.name[:-5]] = [stat.st_mtime_ns, stat.st_size]
+            elif saved_file.name.endswith('.journal') and saved_file.is_file():
+                stat = saved_file.stat()
+                journals[saved_file.name[:-8]] = [stat.st_mtime_ns, stat.st_size]
+    for subject_name, stamp in stamps.items():
+        stamp.extend(journals.get(subject_name, [0, 0]))
+    return stamps
 
-def import_class_list(filename, subject_name):
+def import_class_list(filename, subject_name, report=None):
     """
     Import a csv file of students and create a json save file.
 
+    The file is read a row at a time. Its encoding and delimiter are detected, and it may have a heading row (see
+    read_class_list). Rows that can't be imported are skipped and recorded in the report rather than stopping the
+    import.
+
     Params:
         filename: string containing the full path to the csv file
+        subject_name: string
+        report: ImportReport or None - collects the encoding, delimiter and any problems with the file
+    Returns:
+        Boolean - False if the file couldn't be read or had no students in it
     """
-    students = []
+    if report is None:
+        report = ImportReport(filename)
+    subject_name = clean_subject_name(subject_name)
 
-    # TODO: This should be handled by proper input validation in the GUI.
-    # Remove everything except a-z, A-Z, 0-9, - and _ and space from subject_name
-    subject_name = re.sub("[^a-zA-Z0-9-_\s]+", "", subject_name)
-    # Now remove leading or trailing spaces
-    # subject_name = re.sub("(?:^\s+)|(?:\s+$)", "", subject_name)
-    subject_name = subject_name.strip()
-    # Replace remaining spaces with -
-    subject_name = subject_name.replace(" ", "-")
+    students = [student for group, student in read_class_list(filename, report)]
+    if report.failed:
+        print(report)
+        return False
+    if not students:
+        report.add_problem(None, "no students found")
+        print(report)
+        return False
 
-    # TODO: check if file exists
+    # Create the json file for the subject
+    return save({
+        "subject_name": subject_name,
+        "intro_comment": "",
+        "comment_bank": [],
+        "students": students})
 
-    try:
-        with open(filename) as csvf:
-            reader = csv.reader(csvf)
-            for row in reader:
-                students.append({
-                    "first_name": row[0].strip(),
-                    "last_name": row[1].strip(),
-                    "gender": row[2].strip(),
-                    "pronouns": [],
-                    "comment": ""
-                })
-    except Exception as err:
-        # TODO: better error handling here
-        print(err)
-        return False
+def import_school_roll(filename, subject_column, prefix="", report=None):
+    """
+    Imports a csv file of students from several subjects (for example a whole school roll exported from a student
+    management system), creating a subject for each value in one of its columns. The file is only read once.
 
-    # Set up pronouns for each student
-    # TODO support for non-binary gender field
-    # support it.
-    for student in students:
-        if student['gender'] == 'Male':
-            student['pronouns'] = config.PRONOUNS['male']
-        else:
-            # Female pronouns as default
-            # TODO: gn pronouns as default
-            student['pronouns'] = config.PRONOUNS['female']
+    Params:
+        filename: string containing the full path to the csv file
+        subject_column: string - heading of the column holding the subject, or int - the column's position (starting
+            from 1) in files without headings
+        prefix: string - added to the start of each subject name
+        report: ImportReport or None - collects the encoding, delimiter and any problems with the file
+    Returns:
+        list of strings - names of the subjects saved
+    """
+    if report is None:
+        report = ImportReport(filename)
+    subjects = collections.OrderedDict()
+    for group, student in read_class_list(filename, report, subject_column):
+        subjects.setdefault(group, []).append(student)
+    if report.failed:
+        print(report)
+        return []
 
-    # Create the json file for the subject
-    with open(str(config.DATA_FOLDER + subject_name + '.json'), 'w') as json_out:
-        try:
-            json.dump({
+    saved = []
+    for group, students in subjects.items():
+        subject_name = clean_subject_name(prefix + group)
+        if subject_name in saved:
+            report.add_problem(None, "{} and another subject have the same name once cleaned up".format(group))
+            continue
+        if save({
                 "subject_name": subject_name,
                 "intro_comment": "",
                 "comment_bank": [],
-                "students": students},
-                json_out,
-                indent=4)
-        except Exception as err:
-            #TODO better error handling here
-            print(err)
-            return False
-    return True
+                "students": students}):
+            saved.append(subject_name)
+        else:
+            report.add_problem(None, "couldn't save " + subject_name)
+    return saved
 
-def load(subject_name):
+class ImportReport:
+    """
+    What happened when reading a csv class list: the encoding and delimiter detected, how many rows were imported,
+    and problems with particular rows.
+    """
+
+    # Stop listing individual problems after this many, so a completely wrong file doesn't flood the report.
+    MAX_PROBLEMS = 200
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.encoding = None
+        self.delimiter = None
+        self.has_headings = False
+        self.rows = 0
+        self.imported = 0
+        self.problems = []
+        self.problem_count = 0
+        # Set if the file couldn't be read at all
+        self.failed = False
+
+    def add_problem(self, line_number, message):
+        """
+        Params:
+            line_number: int or None if the problem isn't with a particular row
+            message: string
+        """
+        self.problem_count += 1
+        if len(self.problems) < self.MAX_PROBLEMS:
+            self.problems.append((line_number, message))
+
+    def __str__(self):
+        lines = ["{}: {} of {} rows imported (encoding {}, delimiter {!r})".format(
+            self.filename, self.imported, self.rows, self.encoding, self.delimiter)]
+        for line_number, message in self.problems:
+            if line_number is None:
+                lines.append("  " + message)
+            else:
+                lines.append("  line {}: {}".format(line_number, message))
+        if self.problem_count > len(self.problems):
+            lines.append("  ... and {} more problems".format(self.problem_count - len(self.problems)))
+        return "\n".join(lines)
+
+def read_class_list(filename, report, group_column=None):
     """
-    Loads comment banks, students and report comments from saved json file.
+    Reads students from a csv class list one row at a time.
+
+    The file should have the columns First Name, Last Name and Gender, in that order, unless it has a heading row
+    naming them (in which case they can be in any order and other columns are ignored). The encoding is worked out
+    from any byte order mark, trying UTF-8 and then Windows-1252 if there isn't one, and the delimiter can be a comma,
+    semicolon, tab or bar.
 
     Params:
-        subject_name: string - matching a saved json file
-    Returns:
-        dict
+        filename: string containing the full path to the csv file
+        report: ImportReport - gets the encoding, delimiter and any problems with the file
+        group_column: string - heading of a column to group the students by, or int - the column's position (starting
+            from 1), or None
+
+    Yields:
+        tuple of the value of the group column (or None) and the student dict
     """
-    class_reports = {}
-    # Load saved json file
     try:
-        with open(str(config.DATA_FOLDER + subject_name + '.json'), 'r') as json_in:
-            class_reports = json.load(json_in)
+        csvf, report.encoding = _open_csv(filename)
     except Exception as err:
-        # TODO better error handling here
-        print(err)
-    return class_reports
+        # TODO: better error handling here
+        report.failed = True
+        report.add_problem(None, str(err))
+        return
 
-def save(subject):
+    with csvf:
+        sample = csvf.read(_CSV_SAMPLE_SIZE)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=_CSV_DELIMITERS)
+        except csv.Error:
+            # The sniffer needs nearly every row to have the same number of columns, so one ragged row in a short
+            # file is enough to stop it working
+            dialect = _guess_dialect(sample)
+        report.delimiter = dialect.delimiter
+        # Reading the sample and then the rest of the file means the sample's last line is split in two, so join
+        # the text back up before parsing.
+        reader = csv.reader(_rejoin_lines(sample, csvf), dialect)
+
+        columns = None
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            if columns is None:
+                columns = _class_list_columns(row, group_column)
+                if columns is None:
+                    report.failed = True
+                    report.add_problem(reader.line_num, "the heading row needs First Name, Last Name and Gender columns"
+                        + ("" if group_column is None else " and a {} column".format(group_column)))
+                    return
+                if columns['headings']:
+                    report.has_headings = True
+                    continue
+            report.rows += 1
+            student, group, problem = _read_student(row, columns)
+            if problem:
+                report.add_problem(reader.line_num, problem)
+            if student is None:
+                continue
+            report.imported += 1
+            yield group, student
+
+def _guess_dialect(sample):
     """
-    Saves a subject dict to json file.
+    Works out the delimiter of a csv file from its first line, as whichever of _CSV_DELIMITERS is used most outside
+    quotes (or a comma if none of them are).
 
     Params:
-        subject: dict
+        sample: string - the start of the file
+
     Returns:
-        Boolean
+        csv.Dialect
     """
-    try:
-        with open(str(config.DATA_FOLDER + subject['subject_name'] + '.json'), 'w') as json_out:
-            json.dump(subject, json_out, indent=4)
-    except Exception as err:
-        # TODO better error handling here
-        print(err)
-        return False
-    return True
+    first_line = next((line for line in sample.splitlines() if line.strip()), "")
+    first_line = _CSV_QUOTED.sub("", first_line)
+    delimiter = max(_CSV_DELIMITERS, key=first_line.count)
 
-def export(subject_name, filename):
+    class dialect(csv.excel):
+        pass
+    dialect.delimiter = delimiter if delimiter in first_line else ','
+    return dialect
+
+def _open_csv(filename):
     """
-    Generates a text file of the report comments ready for transferring into student database or reporting system.
+    Opens a csv file as text, working out its encoding.
 
     Params:
-        subject_name: string that matches a json saved file in config.DATA_FOLDER
-        filename: file path for exported file
+        filename: string
+
     Returns:
-        Boolean
+        tuple of the open file and the name of its encoding
     """
-    output = []
-    subject = load(subject_name)
-    if not subject:
-        # TODO better error handling here
-        print("Export failed - got an empty save file.")
-        return False
+    with open(filename, 'rb') as csv_in:
+        start = csv_in.read(_CSV_SAMPLE_SIZE)
+    for bom, encoding in _CSV_BOMS:
+        if start.startswith(bom):
+            return open(filename, 'r', encoding=encoding, newline=''), encoding
+    try:
+        # Ignore a character cut off at the end of the sample
+        codecs.getincrementaldecoder('utf-8')().decode(start, final=False)
+    except UnicodeDecodeError:
+        # cp1252 leaves a few bytes undefined, so replace those rather than failing part way through.
+        return open(filename, 'r', encoding='cp1252', errors='replace', newline=''), 'cp1252'
+    # Anything after the sample which turns out not to be UTF-8 is read as cp1252, so the file only needs reading once.
+    return open(filename, 'r', encoding='utf-8', errors=_CP1252_FALLBACK, newline=''), 'utf-8'
 
-    # Heading
-    output.append("=" * 80)
-    output.append("Report Comments for: " + subject_name)
-    output.append("=" * 80)
-    output.append("\n")
+def _decode_cp1252(err):
+    """
+    Codec error handler decoding bytes which aren't valid UTF-8 as cp1252 instead.
+    """
+    return err.object[err.start:err.end].decode('cp1252', 'replace'), err.end
 
-    # Add student names and comments
-    for student in subject['students']:
-        output.append("-" * 80)
-        output.append(student['first_name'] + " " + student['last_name'])
-        output.append("-" * 80)
-        output.append(do_placeholders(subject['intro_comment'], student['first_name'], student['pronouns']) + " " + student['comment'])
-        output.append("\n")
+_CP1252_FALLBACK = 'could_try_harder.cp1252'
+codecs.register_error(_CP1252_FALLBACK, _decode_cp1252)
+
+def _rejoin_lines(sample, rest):
+    """
+    Yields the lines of an open text file whose first part has already been read into a sample.
+    """
+    lines = list(io.StringIO(sample, newline=''))
+    if lines and not lines[-1].endswith(('\n', '\r')):
+        lines[-1] += rest.readline()
+    yield from lines
+    yield from rest
 
-    # Collapse down to one string for export
-    output = "\n".join(output)
+def _class_list_columns(row, group_column):
+    """
+    Works out which columns hold what from the first row of a class list.
 
-    # TODO remove extra newlines?
+    Params:
+        row: list of strings
+        group_column: see read_class_list
 
-    # Write prepared reports to specified file
-    with open(str(filename), 'w') as txt_out:
-        try:
-            txt_out.write(output)
-        except Exception as err:
-            # TODO better error handling here
-            print(err)
-    return True
+    Returns:
+        dict of first_name, last_name, gender and group column positions (group is None if not grouping) and whether
+            the row is a heading row, or None if it is a heading row without the right columns
+    """
+    headings = [_CSV_HEADINGS.get(heading, heading) for heading in map(_normalise_heading, row)]
+    group = None
+    if isinstance(group_column, int):
+        group = group_column - 1
+    if 'first_name' not in headings and 'last_name' not in headings:
+        if group_column is not None and group is None:
+            # Grouping by a heading which isn't there
+            return None
+        return {"headings": False, "first_name": 0, "last_name": 1, "gender": 2, "group": group}
+    if not all(key in headings for key in ('first_name', 'last_name', 'gender')):
+        return None
+    if isinstance(group_column, str):
+        if _normalise_heading(group_column) not in headings:
+            return None
+        group = headings.index(_normalise_heading(group_column))
+    return {
+        "headings": True,
+        "first_name": headings.index('first_name'),
+        "last_name": headings.index('last_name'),
+        "gender": headings.index('gender'),
+        "group": group
+    }
 
-def delete(subject_name):
+def _normalise_heading(heading):
     """
-    Deletes a saved json file from the config.DATA directory.
+    Returns:
+        string - heading in lower case with runs of spaces and underscores replaced by one space
+    """
+    return re.sub(r"[\s_]+", " ", heading.strip().lower())
+
+def _read_student(row, columns):
+    """
+    Turns a row of a class list into a student.
 
     Params:
-        subject_name: string
+        row: list of strings
+        columns: dict from _class_list_columns
+
     Returns:
-        Boolean
+        tuple of the student dict (or None if the row can't be imported), the value of the group column, and a
+            problem with the row (or None)
     """
-    try:
-        os.remove(str(config.DATA_FOLDER + subject_name + '.json'))
-    except Exception as err:
-        # TODO better error handling here
-        print(err)
-        return False
-    return True
+    needed = max(position for key, position in columns.items() if key != 'headings' and position is not None)
+    if len(row) <= needed:
+        return None, None, "expected at least {} columns but found {}".format(needed + 1, len(row))
+    first_name = row[columns['first_name']].strip()
+    last_name = row[columns['last_name']].strip()
+    gender = row[columns['gender']].strip()
+    group = None
+    if columns['group'] is not None:
+        group = row[columns['group']].strip()
+        if not group:
+            return None, None, "no subject given for {} {}".format(first_name, last_name)
+    if not first_name:
+        return None, None, "no first name"
 
-def do_placeholders(text, name, pronouns):
+    problem = None
+    # Set up pronouns for the student
+    # TODO support for non-binary gender field
+    gender = _GENDERS.get(gender.lower(), gender)
+    if gender == 'Male':
+        pronouns = config.PRONOUNS['male']
+    else:
+        # Female pronouns as default
+        # TODO: gn pronouns as default
+        pronouns = config.PRONOUNS['female']
+        if gender != 'Female':
+            problem = "gender {!r} not recognised for {} {}, using female pronouns".format(gender, first_name, last_name)
+    return Student({
+        "first_name": first_name,
+        "last_name": last_name,
+        "gender": gender,
+        "pronouns": pronouns,
+        "comment": ""
+    }), group, problem
+
+# Bytes read to work out a csv file's encoding and delimiter
+_CSV_SAMPLE_SIZE = 64 * 1024
+
+_CSV_DELIMITERS = ",;\t|"
+
+# A quoted csv field, which may contain delimiters
+_CSV_QUOTED = re.compile(r'"(?:[^"]|"")*"')
+
+# Checked in order, since the UTF-32 little-endian mark starts with the UTF-16 one
+_CSV_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16')
+]
+
+# Headings recognised in class lists, lower case
+_CSV_HEADINGS = {
+    "first name": 'first_name',
+    "firstname": 'first_name',
+    "forename": 'first_name',
+    "given name": 'first_name',
+    "preferred name": 'first_name',
+    "last name": 'last_name',
+    "lastname": 'last_name',
+    "surname": 'last_name',
+    "family name": 'last_name',
+    "gender": 'gender',
+    "sex": 'gender'
+}
+
+# Other ways class lists write genders, lower case
+_GENDERS = {
+    "male": 'Male',
+    "m": 'Male',
+    "female": 'Female',
+    "f": 'Female'
+}
+
+class Student(collections.abc.MutableMapping):
     """
-    Replace placeholders in a given string. Also fixes sentence capitalisation problems cause as a result.
+    A student in a subject. Works like a dict with 'first_name', 'last_name', 'gender', 'pronouns' and 'comment' keys
+    (plus any others the student was saved with), but stores them in slots, and the pronouns are a tuple shared with
+    every other student with the same pronouns (see intern_pronouns). This takes a fraction of the memory of a dict
+    for each student, which adds up for large cohorts.
 
-    Pronoun codes are:
-        <sp> - subjective pronoun e.g. "He" or "She"
-        <op> - objective pronoun e.g. "Him" or "Her"
-        <pa> - possesive adjective e.g. "his" or "her" "project"
-        <pp> - possesive pronoun e.g. The project is his/hers.
-        <rp> - reflexive pronoun e.g. "himself" or "herself"
+    Params:
+        student: dict or Student to copy the keys from
+    """
+    __slots__ = ('first_name', 'last_name', 'gender', 'pronouns', 'comment', 'extra')
+
+    # Keys stored in their own slot, in the order they are saved. Anything else goes in the extra dict.
+    KEYS = ('first_name', 'last_name', 'gender', 'pronouns', 'comment')
+
+    def __init__(self, student=()):
+        self.extra = None
+        self.update(student)
+
+    def __getitem__(self, key):
+        if key in Student.KEYS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key == 'pronouns':
+            value = intern_pronouns(value)
+        if key in Student.KEYS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in Student.KEYS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self.extra is None:
+            raise KeyError(key)
+        else:
+            del self.extra[key]
+
+    def __iter__(self):
+        for key in Student.KEYS:
+            if hasattr(self, key):
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for key in Student.KEYS if hasattr(self, key)) + len(self.extra or ())
+
+    def __repr__(self):
+        return "Student({!r})".format(dict(self))
+
+    def copy(self):
+        """
+        Returns:
+            Student - a copy which can be edited separately (the pronouns are still shared)
+        """
+        return Student(self)
+
+def intern_pronouns(pronouns):
+    """
+    Gets the shared tuple for a set of pronouns, so students with the same pronouns don't each keep their own copy.
 
     Params:
-        text: a string containing pronoun codes to replace.
-        name: string - student name
-        pronouns: a list of custom pronouns in the form [subjective-pronoun, objective-pronoun, possesive-adjective, possesive-pronoun]
+        pronouns: list or tuple of strings
 
     Returns:
-        string
+        tuple of strings
     """
-    text = text.replace('<name>', name)
-    text = text.replace('<sp>', pronouns[0])
-    text = text.replace('<op>', pronouns[1])
-    text = text.replace('<pa>', pronouns[2])
-    text = text.replace('<pp>', pronouns[3])
-    text = text.replace('<rp>', pronouns[4])
+    pronouns = tuple(pronouns)
+    return _pronoun_sets.setdefault(pronouns, pronouns)
 
-    # TODO: add extra replacements for participles relating to "they" pronouns
-    # TODO: do this automatically with TextBlob?
+# Every set of pronouns seen so far, each mapped to itself
+_pronoun_sets = {}
 
-    text = _capitalise_sentences(text)
+def _encode_students(students):
+    """
+    Converts students to the form saved in json files: each different set of pronouns is stored once, in a table, and
+    students refer to it by its position.
 
-    return text
+    Params:
+        students: list of Students or dicts
 
-def do_style(text):
+    Returns:
+        tuple of the table (list of lists of strings) and a list of student dicts
     """
-    Apply replacement patterns defined in config. Also fixes an sentence capitalisation errors.
+    table = {}
+    encoded = []
+    for student in students:
+        student = dict(student)
+        if 'pronouns' in student:
+            student['pronouns'] = table.setdefault(tuple(student['pronouns']), len(table))
+        encoded.append(student)
+    return [list(pronouns) for pronouns in table], encoded
+
+def _decode_students(students, pronoun_sets):
+    """
+    Converts students loaded from a json file to Students. Files saved before pronoun tables were added have every
+    student's pronouns written out in full, and are read the same way.
 
     Params:
-        text: string
+        students: list of dicts
+        pronoun_sets: list of lists of strings, or None if the file doesn't have a pronoun table
 
     Returns:
-        string
+        list of Students
     """
-    for pattern, replacement in config.STYLE_RULES:
-        # Case insensitive to cover more possible errors.
-        text = re.sub(pattern, replacement, text, flags=re.I)
+    pronoun_sets = [intern_pronouns(pronouns) for pronouns in pronoun_sets or []]
+    decoded = []
+    for student in students:
+        pronouns = student.get('pronouns')
+        if isinstance(pronouns, int):
+            student = dict(student, pronouns=pronoun_sets[pronouns])
+        decoded.append(Student(student))
+    return decoded
 
-    # Recapitalise sentences to fix errors introduced.
-    text = _capitalise_sentences(text)
+def clean_subject_name(subject_name):
+    """
+    Turns a subject name into the form used for save file names.
 
-    return text
+    Params:
+        subject_name: string
 
-def _capitalise_sentences(text):
+    Returns:
+        string
+    """
+    # TODO: This should be handled by proper input validation in the GUI.
+    # Remove everything except a-z, A-Z, 0-9, - and _ and space from subject_name
+    subject_name = re.sub("[^a-zA-Z0-9-_\s]+", "", subject_name)
+    # Now remove leading or trailing spaces
+    # subject_name = re.sub("(?:^\s+)|(?:\s+$)", "", subject_name)
+    subject_name = subject_name.strip()
+    # Replace remaining spaces with -
+    subject_name = subject_name.replace(" ", "-")
+    return subject_name
+
+def load(subject_name):
     """
-    Uses TextBlob to capitalise sentences.
+    Loads comment banks, students and report comments from saved json file, replaying any changes saved to its journal
+    since the json file was last written. If config.STORAGE_BACKEND is 'sqlite' or 'binary', loads from there instead.
 
     Params:
-        text: string
-
+        subject_name: string - matching a saved json file
     Returns:
-        string: capitalised text
+        dict
     """
-    output = []
-    blob = TextBlob(text)
-    for sentence in blob.sentences:
-        # Using .capitalize() removes capitalisation elsewhere in the
+    storage = _get_storage()
+    if storage is not None:
+        try:
+            class_reports = storage.load(subject_name)
+        except Exception as err:
+            # TODO better error handling here
+            print(err)
+            return {}
+        if not class_reports:
+            print("No saved subject called " + subject_name)
+        else:
+            class_reports['students'] = [Student(student) for student in class_reports['students']]
+        return class_reports
+    return _load_json(subject_name)
+
+def load_comment_bank(subject_name):
+    """
+    Loads just a subject's comment bank. With the 'sqlite' and 'binary' backends the rest of the subject isn't read.
+
+    Params:
+        subject_name: string
+
+    Returns:
+        list of strings, or an empty list if the subject couldn't be loaded
+    """
+    storage = _get_storage()
+    if storage is None:
+        return load(subject_name).get('comment_bank', [])
+    try:
+        comment_bank = storage.load_comment_bank(subject_name)
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+        return []
+    if comment_bank is None:
+        print("No saved subject called " + subject_name)
+        return []
+    return comment_bank
+
+def load_student(subject_name, index):
+    """
+    Loads a single student. With the 'sqlite' and 'binary' backends the rest of the subject isn't read.
+
+    Params:
+        subject_name: string
+        index: int - position of the student in the subject
+
+    Returns:
+        Student, or None if there is no such student
+    """
+    storage = _get_storage()
+    try:
+        if storage is None:
+            students = load(subject_name).get('students', [])
+            return students[index] if 0 <= index < len(students) else None
+        student = storage.load_student(subject_name, index)
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+        return None
+    return None if student is None else Student(student)
+
+def _load_json(subject_name):
+    """
+    Loads a subject from its json file and journal.
+
+    Params:
+        subject_name: string - matching a saved json file
+    Returns:
+        dict
+    """
+    class_reports = {}
+    # Load saved json file
+    try:
+        with open(str(config.DATA_FOLDER + subject_name + '.json'), 'r') as json_in:
+            class_reports = json.load(json_in)
+            stamp = _get_file_stamp(os.fstat(json_in.fileno()))
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+        return class_reports
+
+    try:
+        if 'comment_bank_ids' in class_reports:
+            class_reports = {("comment_bank" if key == 'comment_bank_ids' else key):
+                             (get_library_comments(value) if key == 'comment_bank_ids' else value)
+                             for key, value in class_reports.items()}
+        class_reports['students'] = _decode_students(class_reports['students'], class_reports.pop('pronoun_sets', None))
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+        return {}
+    generation = class_reports.pop('journal_generation', None)
+    entries = 0
+    if generation is not None:
+        entries = _replay_journal(class_reports, generation)
+    _set_journal_baseline(class_reports, generation, entries, stamp)
+    return class_reports
+
+def save(subject):
+    """
+    Saves a subject dict to json file.
+
+    The json file is always replaced atomically, so a crash part way through saving can't leave a truncated file. If
+    config.STORAGE_MODE is 'journal', changes to student comments, the intro comment and the comment bank are
+    appended to a journal file instead, and the json file is only rewritten when the journal gets long or something
+    else (such as the list of students) has changed.
+
+    Params:
+        subject: dict
+    Returns:
+        Boolean
+    """
+    storage = _get_storage()
+    try:
+        if storage is not None:
+            storage.save(subject)
+        elif not (config.STORAGE_MODE == 'journal' and _append_journal(subject)):
+            _save_snapshot(subject)
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+        return False
+    if storage is None:
+        _update_manifest(subject)
+    return True
+
+def _save_snapshot(subject):
+    """
+    Writes the whole subject to its json file (with an atomic rename) and starts a new journal.
+
+    Params:
+        subject: dict
+    """
+    subject_name = subject['subject_name']
+    journal_filename = _journal_filename(subject_name)
+    generation = None
+    data = subject
+    if config.COMMENT_LIBRARY:
+        # Store the comment bank in the shared library, and just refer to the comments from the subject's file.
+        # The library is written first, so the subject never refers to comments that aren't saved.
+        comment_ids = add_to_comment_library(subject['comment_bank'])
+        data = {("comment_bank_ids" if key == 'comment_bank' else key): (comment_ids if key == 'comment_bank' else value)
+                for key, value in subject.items()}
+    # Each set of pronouns is saved once rather than for every student
+    pronoun_sets, students = _encode_students(subject['students'])
+    data = {key: value for key, value in data.items() if key != 'students'}
+    data['pronoun_sets'] = pronoun_sets
+    data['students'] = students
+    if config.STORAGE_MODE == 'journal' or os.path.exists(journal_filename):
+        # A new generation means any journal entries left over from before this save are ignored.
+        generation = uuid.uuid4().hex
+        data = dict(data, journal_generation=generation)
+    stat = _write_json_atomic(config.DATA_FOLDER + subject_name + '.json', data)
+    if os.path.exists(journal_filename):
+        os.remove(journal_filename)
+    _set_journal_baseline(subject, generation, 0, _get_file_stamp(stat))
+
+def _write_json_atomic(filename, data, indent=4, sync=True):
+    """
+    Writes json to a temporary file then renames it over the original, so the original is either left alone or
+    completely replaced.
+
+    Params:
+        filename: string
+        data: anything that can be converted to json
+        indent: int or None - passed to json.dump
+        sync: Boolean - wait for the file to reach the disk before renaming it
+
+    Returns:
+        os.stat_result of the new file
+    """
+    return atomic_files.write(filename, lambda json_out: json.dump(data, json_out, indent=indent), sync=sync)
+
+def _get_file_stamp(stat):
+    """
+    Params:
+        stat: os.stat_result
+
+    Returns:
+        tuple - changes whenever the file is replaced or written to
+    """
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+def _get_json_stamp(subject_name):
+    """
+    Returns:
+        tuple from _get_file_stamp for a subject's json file, or None if it doesn't exist
+    """
+    try:
+        return _get_file_stamp(os.stat(config.DATA_FOLDER + subject_name + '.json'))
+    except FileNotFoundError:
+        return None
+
+def _journal_filename(subject_name):
+    """
+    Returns:
+        string - path of the journal file for a subject
+    """
+    return config.DATA_FOLDER + subject_name + '.journal'
+
+# What each subject looked like when it was last loaded or saved, by subject
+# name, so save() can work out which changes to add to the journal. Only kept
+# when config.STORAGE_MODE is 'journal', until release_subject() is called.
+_journal_baselines = {}
+
+def _set_journal_baseline(subject, generation, entries, stamp):
+    """
+    Records what a subject looks like in its saved file.
+
+    Params:
+        subject: dict
+        generation: string identifying the json file the journal belongs to, or None if it has no journal
+        entries: int - number of entries in the journal
+        stamp: tuple from _get_file_stamp for the json file
+    """
+    if config.STORAGE_MODE != 'journal':
+        _journal_baselines.pop(subject['subject_name'], None)
+        return
+    _journal_baselines[subject['subject_name']] = {
+        "generation": generation,
+        "entries": entries,
+        "stamp": stamp,
+        "intro_comment": subject['intro_comment'],
+        "comment_bank": list(subject['comment_bank']),
+        "students": [dict(student) for student in subject['students']],
+        "other": {key: value for key, value in subject.items() if key not in _JOURNALED_KEYS}
+    }
+
+def release_subject(subject_name):
+    """
+    Forgets what was remembered about a subject when it was loaded for editing, e.g. once its edit window closes. If
+    it is saved again afterwards, the whole file is rewritten.
+
+    Params:
+        subject_name: string
+    """
+    _journal_baselines.pop(subject_name, None)
+
+# Subject keys that save() knows how to journal
+_JOURNALED_KEYS = ('subject_name', 'intro_comment', 'comment_bank', 'students')
+
+def _append_journal(subject):
+    """
+    Appends changes since the subject was last loaded or saved to its journal.
+
+    Params:
+        subject: dict
+
+    Returns:
+        Boolean - False if the changes can't be journaled and the whole file needs saving instead
+    """
+    baseline = _journal_baselines.get(subject['subject_name'])
+    if (baseline is None or baseline['generation'] is None
+            or len(baseline['students']) != len(subject['students'])
+            or baseline['other'] != {key: value for key, value in subject.items() if key not in _JOURNALED_KEYS}):
+        return False
+    if _get_json_stamp(subject['subject_name']) != baseline['stamp']:
+        # Saved by another copy of the app (or the command line) since it was loaded here. That started a new
+        # generation, so entries for this one would be ignored when the subject is next loaded.
+        return False
+
+    entries = []
+    if subject['intro_comment'] != baseline['intro_comment']:
+        entries.append({"op": "intro_comment", "value": subject['intro_comment']})
+    if len(subject['comment_bank']) != len(baseline['comment_bank']):
+        entries.append({"op": "comment_bank", "value": subject['comment_bank']})
+    else:
+        for index, (comment, saved_comment) in enumerate(zip(subject['comment_bank'], baseline['comment_bank'])):
+            if comment != saved_comment:
+                entries.append({"op": "bank_comment", "index": index, "value": comment})
+    for index, (student, saved_student) in enumerate(zip(subject['students'], baseline['students'])):
+        if student == saved_student:
+            continue
+        if {key: value for key, value in student.items() if key != 'comment'} != {key: value for key, value in saved_student.items() if key != 'comment'}:
+            # Anything other than the comment changed.
+            return False
+        entries.append({"op": "student_comment", "index": index, "value": student['comment']})
+
+    if baseline['entries'] + len(entries) > config.JOURNAL_COMPACT_ENTRIES:
+        # Compact the journal into a new json file.
+        return False
+    if entries:
+        with open(_journal_filename(subject['subject_name']), 'a') as journal_out:
+            journal_out.write("".join(json.dumps(dict(entry, generation=baseline['generation'])) + "\n" for entry in entries))
+            journal_out.flush()
+            os.fsync(journal_out.fileno())
+        if _get_json_stamp(subject['subject_name']) != baseline['stamp']:
+            # Saved somewhere else while the entries were being written, which may have thrown them away
+            return False
+    _set_journal_baseline(subject, baseline['generation'], baseline['entries'] + len(entries), baseline['stamp'])
+    return True
+
+def _replay_journal(subject, generation):
+    """
+    Applies journal entries written since the subject's json file was saved.
+
+    Params:
+        subject: dict loaded from the json file
+        generation: string from the json file. Entries from other generations are left over from before the json
+            file was last written, so are skipped.
+
+    Returns:
+        int - number of entries applied
+    """
+    applied = 0
+    try:
+        with open(_journal_filename(subject['subject_name']), 'r') as journal_in:
+            for line in journal_in:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Probably cut off by a crash while it was being written.
+                    continue
+                if entry.get('generation') != generation:
+                    continue
+                if entry['op'] == 'intro_comment':
+                    subject['intro_comment'] = entry['value']
+                elif entry['op'] == 'comment_bank':
+                    subject['comment_bank'] = entry['value']
+                elif entry['op'] == 'bank_comment':
+                    subject['comment_bank'][entry['index']] = entry['value']
+                elif entry['op'] == 'student_comment':
+                    subject['students'][entry['index']]['comment'] = entry['value']
+                applied += 1
+    except FileNotFoundError:
+        pass
+    return applied
+
+def normalise_comment(comment):
+    """
+    Tidies a comment so that copies differing only in spacing (or in how accented letters are encoded) are the same.
+
+    Params:
+        comment: string
+
+    Returns:
+        string
+    """
+    return " ".join(unicodedata.normalize('NFC', comment).split())
+
+def get_comment_id(comment):
+    """
+    Returns:
+        string - the id of a comment in the comment library, made from a hash of the normalised comment
+    """
+    return hashlib.blake2b(normalise_comment(comment).encode('utf-8'), digest_size=8).hexdigest()
+
+def add_to_comment_library(comments):
+    """
+    Adds comments to the comment library shared by every subject in config.DATA_FOLDER. Each comment is only stored
+    once, however many subjects use it. Copies differing only in spacing share an id (see get_comment_id), and the
+    library keeps the text of whichever was added first.
+
+    The library is a file of json lines which is only ever appended to (apart from prune_comment_library), so
+    several copies of the app can add to it at the same time without losing comments.
+
+    Params:
+        comments: list of strings
+
+    Returns:
+        list of strings - the comments' ids
+    """
+    comment_ids = [get_comment_id(comment) for comment in comments]
+    with _comment_library_lock:
+        library = _get_comment_library()
+        new_comments = {}
+        for comment_id, comment in zip(comment_ids, comments):
+            if comment_id not in library['comments'] and comment_id not in new_comments:
+                new_comments[comment_id] = comment
+        if new_comments:
+            _read_comment_library(library)
+            lines = "".join(json.dumps({"id": comment_id, "text": comment}) + "\n"
+                            for comment_id, comment in new_comments.items() if comment_id not in library['comments'])
+            if lines:
+                with open(library['filename'], 'a+b') as library_out:
+                    library_out.seek(0, os.SEEK_END)
+                    if library_out.tell():
+                        library_out.seek(-1, os.SEEK_END)
+                        if library_out.read(1) != b'\n':
+                            # Finish off a line cut short by a crash, so it doesn't swallow the next comment.
+                            lines = "\n" + lines
+                    library_out.write(lines.encode('utf-8'))
+                    library_out.flush()
+                    os.fsync(library_out.fileno())
+                _read_comment_library(library)
+    return comment_ids
+
+def get_library_comments(comment_ids):
+    """
+    Looks up comments in the comment library.
+
+    Params:
+        comment_ids: list of strings
+
+    Returns:
+        list of strings
+
+    Raises:
+        LookupError if any of the comments are missing from the library
+    """
+    with _comment_library_lock:
+        library = _get_comment_library()
+        if any(comment_id not in library['comments'] for comment_id in comment_ids):
+            # Maybe added by another copy of the app
+            _read_comment_library(library)
+        missing = [comment_id for comment_id in comment_ids if comment_id not in library['comments']]
+        if missing:
+            # Leaving them out would move the comments after them, which the journal refers to by position
+            raise LookupError("Comments missing from the comment library {}: {}".format(
+                library['filename'], ", ".join(missing)))
+        return [library['comments'][comment_id] for comment_id in comment_ids]
+
+def prune_comment_library():
+    """
+    Removes comments no subject uses any more from the comment library. Only run this while nothing else is saving
+    subjects.
+
+    Returns:
+        int - number of comments removed
+    """
+    used = set()
+    for subject_name in _get_saved_json_list():
+        subject = _load_json(subject_name)
+        if not subject:
+            # The comments it uses can't be told apart from unused ones
+            print("Comment library not pruned, since {} couldn't be loaded".format(subject_name))
+            return 0
+        used.update(get_comment_id(comment) for comment in subject['comment_bank'])
+    with _comment_library_lock:
+        library = _get_comment_library()
+        _read_comment_library(library)
+        unused = [comment_id for comment_id in library['comments'] if comment_id not in used]
+        if unused:
+            for comment_id in unused:
+                del library['comments'][comment_id]
+
+            def write_library(library_out):
+                for comment_id, comment in library['comments'].items():
+                    library_out.write(json.dumps({"id": comment_id, "text": comment}) + "\n")
+
+            library['offset'] = atomic_files.write(library['filename'], write_library, encoding='utf-8').st_size
+    return len(unused)
+
+def _get_comment_library():
+    """
+    Gets the comment library for config.DATA_FOLDER, reading it the first time. Call with _comment_library_lock held.
+
+    Returns:
+        dict with the library's filename, its comments by id, and how far through the file has been read
+    """
+    filename = config.DATA_FOLDER + config.COMMENT_LIBRARY_FILENAME
+    library = _comment_libraries.get(filename)
+    if library is None:
+        library = _comment_libraries[filename] = {"filename": filename, "comments": {}, "offset": 0}
+        _read_comment_library(library)
+    return library
+
+def _read_comment_library(library):
+    """
+    Reads comments added to the library file since it was last read.
+
+    Params:
+        library: dict from _get_comment_library
+    """
+    try:
+        with open(library['filename'], 'rb') as library_in:
+            if os.fstat(library_in.fileno()).st_size < library['offset']:
+                # Rewritten by prune_comment_library
+                library['offset'] = 0
+            library_in.seek(library['offset'])
+            data = library_in.read()
+    except FileNotFoundError:
+        return
+    # Leave any line still being written for next time
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].splitlines():
+        try:
+            entry = json.loads(line.decode('utf-8'))
+        except ValueError:
+            # Cut off by a crash
+            continue
+        library['comments'][entry['id']] = entry['text']
+    library['offset'] += end
+
+def merge_comment_banks(comment_bank, new_comments):
+    """
+    Works out which comments to add to a comment bank, skipping ones already in it (allowing for differences in
+    spacing) and repeats.
+
+    Params:
+        comment_bank: list of strings
+        new_comments: list of strings
+
+    Returns:
+        list of strings - the new comments to add
+    """
+    existing = set(map(normalise_comment, comment_bank))
+    added = []
+    for comment in new_comments:
+        normalised = normalise_comment(comment)
+        if normalised and normalised not in existing:
+            existing.add(normalised)
+            added.append(comment)
+    return added
+
+# Comment libraries read from disk, by filename
+_comment_libraries = {}
+_comment_library_lock = threading.RLock()
+
+def get_subject_summaries():
+    """
+    Gets the size and progress of every saved subject without loading them all.
+
+    Summaries of json files are kept in a manifest file in config.DATA_FOLDER, which is updated whenever a subject is
+    saved or deleted. Each summary records the modified time and size of the subject's files, and only subjects whose
+    files have changed since (for example, copied in from elsewhere) are loaded again.
+
+    Returns:
+        dict of subject name: dict with keys
+            students: int - number of students, or None if the subject couldn't be loaded
+            comment_bank: int - number of comments in the comment bank, or None
+            completed: int - number of students with a report comment, or None
+            modified: float - when the subject was last saved, in seconds since the epoch
+            size: int - bytes on disk, or None if not known
+    """
+    storage = _get_storage()
+    if storage is not None:
+        try:
+            return storage.get_summaries()
+        except Exception as err:
+            # TODO better error handling here
+            print(err)
+            return {}
+
+    with _manifest_lock:
+        manifest = _get_manifest()
+        stamps = _get_saved_json_stamps()
+        changed = False
+        for subject_name in list(manifest):
+            if subject_name not in stamps:
+                del manifest[subject_name]
+                changed = True
+        for subject_name, stamp in stamps.items():
+            entry = manifest.get(subject_name)
+            if entry is None or entry['stamp'] != stamp:
+                manifest[subject_name] = _manifest_entry(_load_json(subject_name), stamp)
+                changed = True
+        if changed:
+            _write_manifest(manifest)
+        return {subject_name: _manifest_summary(entry) for subject_name, entry in manifest.items()}
+
+def _get_manifest():
+    """
+    Gets the manifest of json files in config.DATA_FOLDER, reading it from disk the first time. Call with
+    _manifest_lock held.
+
+    Returns:
+        dict of subject name: manifest entry
+    """
+    filename = config.DATA_FOLDER + config.MANIFEST_FILENAME
+    manifest = _manifests.get(filename)
+    if manifest is None:
+        manifest = {}
+        try:
+            with open(filename, 'r') as manifest_in:
+                saved = json.load(manifest_in)
+            if saved.get('version') == _MANIFEST_VERSION:
+                manifest = saved['subjects']
+        except FileNotFoundError:
+            pass
+        except Exception as err:
+            # The manifest can always be rebuilt from the json files.
+            print(err)
+        _manifests[filename] = manifest
+    return manifest
+
+def _write_manifest(manifest):
+    """
+    Saves the manifest of json files. Call with _manifest_lock held.
+
+    Params:
+        manifest: dict of subject name: manifest entry
+    """
+    try:
+        # Not synced to disk, since anything lost in a crash is picked up by checking the modified times.
+        _write_json_atomic(config.DATA_FOLDER + config.MANIFEST_FILENAME,
+            {"version": _MANIFEST_VERSION, "subjects": manifest}, indent=None, sync=False)
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+
+def _update_manifest(subject):
+    """
+    Updates the manifest entry for a subject that has just been saved.
+
+    Params:
+        subject: dict
+    """
+    subject_name = subject['subject_name']
+    with _manifest_lock:
+        try:
+            stamp = _get_saved_json_stamps_for(subject_name)
+        except OSError as err:
+            # TODO better error handling here
+            print(err)
+            return
+        manifest = _get_manifest()
+        manifest[subject_name] = _manifest_entry(subject, stamp)
+        _write_manifest(manifest)
+
+def _remove_from_manifest(subject_name):
+    """
+    Removes the manifest entry for a subject that has just been deleted.
+
+    Params:
+        subject_name: string
+    """
+    with _manifest_lock:
+        manifest = _get_manifest()
+        if manifest.pop(subject_name, None) is not None:
+            _write_manifest(manifest)
+
+def _get_saved_json_stamps_for(subject_name):
+    """
+    Returns:
+        list - the same as one subject's value from _get_saved_json_stamps
+    """
+    stat = os.stat(config.DATA_FOLDER + subject_name + '.json')
+    stamp = [stat.st_mtime_ns, stat.st_size]
+    try:
+        stat = os.stat(_journal_filename(subject_name))
+        stamp.extend([stat.st_mtime_ns, stat.st_size])
+    except FileNotFoundError:
+        stamp.extend([0, 0])
+    return stamp
+
+def _manifest_entry(subject, stamp):
+    """
+    Params:
+        subject: dict, or an empty dict if the subject couldn't be loaded
+        subject_name: string
+        stamp: list from _get_saved_json_stamps
+
+    Returns:
+        dict to store in the manifest
+    """
+    entry = {
+        "stamp": stamp,
+        "students": None,
+        "comment_bank": None,
+        "completed": None
+    }
+    if subject:
+        entry['students'] = len(subject['students'])
+        entry['comment_bank'] = len(subject['comment_bank'])
+        entry['completed'] = sum(1 for student in subject['students'] if student.get('comment', "").strip())
+    return entry
+
+def _manifest_summary(entry):
+    """
+    Params:
+        entry: dict from the manifest
+
+    Returns:
+        dict in the form returned by get_subject_summaries
+    """
+    json_modified, json_size, journal_modified, journal_size = entry['stamp']
+    return {
+        "students": entry['students'],
+        "comment_bank": entry['comment_bank'],
+        "completed": entry['completed'],
+        "modified": max(json_modified, journal_modified) / 1e9,
+        "size": json_size + journal_size
+    }
+
+# Bump when the form of manifest entries changes, so old manifests are rebuilt
+_MANIFEST_VERSION = 1
+
+# Manifests read from disk, by filename
+_manifests = {}
+_manifest_lock = threading.RLock()
+
+def export(subject_name, filename, export_format=None, progress=None):
+    """
+    Generates a file of the report comments ready for transferring into student database or reporting system.
+
+    Comments are rendered and written one student at a time through a buffered file, so memory use doesn't grow with
+    the size of the class.
+
+    Params:
+        subject_name: string that matches a json saved file in config.DATA_FOLDER
+        filename: file path for exported file
+        export_format: one of EXPORT_FORMATS - 'txt' (plain text), 'csv' or 'jsonl' (JSON Lines). If not given it is
+            worked out from the file extension.
+        progress: optional function called as progress(students_done, total_students) after each student
+    Returns:
+        Boolean
+    """
+    if export_format is None:
+        export_format = get_export_format(filename)
+    if export_format not in EXPORT_FORMATS:
+        # TODO better error handling here
+        print("Export failed - unknown format: " + str(export_format))
+        return False
+    writer, open_options = EXPORT_FORMATS[export_format]
+
+    subject = load(subject_name)
+    if not subject:
+        # TODO better error handling here
+        print("Export failed - got an empty save file.")
+        return False
+
+    try:
+        with open(str(filename), 'w', buffering=_EXPORT_BUFFER_SIZE, **open_options) as export_out:
+            writer(export_out, subject_name, _export_comments(subject, progress))
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+        return False
+    return True
+
+def export_many(subject_names, folder, export_format='txt', combined_filename=None, processes=None, progress=None):
+    """
+    Exports several subjects at once, one file per subject, spreading the subjects across a pool of processes.
+
+    Params:
+        subject_names: list of strings matching json saved files in config.DATA_FOLDER
+        folder: folder to write the exported files to. Each is named after its subject.
+        export_format: one of EXPORT_FORMATS
+        combined_filename: optional file path for a single file containing every subject that exported successfully
+        processes: number of worker processes, defaults to the number of CPUs. Use 1 to export in this process.
+        progress: optional function called as progress(result, subjects_done, total_subjects) as each subject
+            finishes, where result is that subject's result dict
+
+    Returns:
+        list of dicts, one for each subject in the order given, with 'subject_name', 'filename', 'success', 'seconds'
+        and 'error' keys
+    """
+    if export_format not in EXPORT_FORMATS:
+        # TODO better error handling here
+        print("Export failed - unknown format: " + str(export_format))
+        return []
+    subject_names = list(dict.fromkeys(subject_names))
+    jobs = [(subject_name, os.path.join(folder, subject_name + '.' + export_format)) for subject_name in subject_names]
+    settings = _get_worker_settings()
+    results = {}
+
+    if processes == 1 or len(jobs) <= 1:
+        for done, (subject_name, filename) in enumerate(jobs, 1):
+            results[subject_name] = _export_job(subject_name, filename, export_format, settings)
+            if progress:
+                progress(results[subject_name], done, len(jobs))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {}
+            for subject_name, filename in jobs:
+                future = executor.submit(_export_job, subject_name, filename, export_format, settings)
+                futures[future] = (subject_name, filename)
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                subject_name, filename = futures[future]
+                try:
+                    result = future.result()
+                except Exception as err:
+                    # e.g. the worker process died
+                    result = _export_result(subject_name, filename, False, 0, str(err))
+                results[subject_name] = result
+                if progress:
+                    progress(result, done, len(jobs))
+
+    results = [results[subject_name] for subject_name in subject_names]
+    if combined_filename:
+        _combine_exports(results, combined_filename, export_format)
+    return results
+
+def _export_job(subject_name, filename, export_format, settings):
+    """
+    Exports a single subject for export_many(). Runs in a worker process.
+
+    Params:
+        subject_name: string
+        filename: string
+        export_format: string
+        settings: dict from _get_worker_settings()
+
+    Returns:
+        dict - see export_many()
+    """
+    _apply_worker_settings(settings)
+    start = time.perf_counter()
+    # export() reports problems by printing them, so keep what it prints as the error message.
+    messages = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(messages):
+            success = export(subject_name, filename, export_format)
+    except Exception as err:
+        success = False
+        messages.write(str(err))
+    error = None if success else (messages.getvalue().strip() or "Export failed.")
+    return _export_result(subject_name, filename, success, time.perf_counter() - start, error)
+
+def _export_result(subject_name, filename, success, seconds, error):
+    """
+    Returns:
+        dict - a result for export_many()
+    """
+    return {
+        "subject_name": subject_name,
+        "filename": filename,
+        "success": success,
+        "seconds": seconds,
+        "error": error
+    }
+
+def _combine_exports(results, combined_filename, export_format):
+    """
+    Joins the files from a successful export_many() into one file. CSV files get an extra Subject column.
+
+    Params:
+        results: list of result dicts from export_many()
+        combined_filename: file path for the combined file
+        export_format: one of EXPORT_FORMATS
+
+    Returns:
+        Boolean
+    """
+    writer, open_options = EXPORT_FORMATS[export_format]
+    try:
+        with open(str(combined_filename), 'w', buffering=_EXPORT_BUFFER_SIZE, **open_options) as combined_out:
+            csv_writer = csv.writer(combined_out) if export_format == 'csv' else None
+            first = True
+            for result in results:
+                if not result['success']:
+                    continue
+                with open(result['filename'], 'r', **open_options) as export_in:
+                    if csv_writer:
+                        reader = csv.reader(export_in)
+                        heading = next(reader, None)
+                        if first and heading:
+                            csv_writer.writerow(["Subject"] + heading)
+                        for row in reader:
+                            csv_writer.writerow([result['subject_name']] + row)
+                    else:
+                        if not first and export_format == 'txt':
+                            combined_out.write("\n\n")
+                        for chunk in iter(lambda: export_in.read(_EXPORT_BUFFER_SIZE), ''):
+                            combined_out.write(chunk)
+                first = False
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+        return False
+    return True
+
+def _get_worker_settings():
+    """
+    Gets the config settings which worker processes need to match this process, in case they have been changed
+    since config was imported.
+
+    Returns:
+        dict
+    """
+    return {name: getattr(config, name) for name in _WORKER_SETTINGS}
+
+def _apply_worker_settings(settings):
+    """
+    Copies settings from _get_worker_settings() into config in a worker process.
+
+    Params:
+        settings: dict
+    """
+    for name, value in settings.items():
+        setattr(config, name, value)
+
+# Config settings copied to worker processes
+_WORKER_SETTINGS = ['DATA_FOLDER', 'STORAGE_BACKEND', 'SQLITE_FILENAME', 'MANIFEST_FILENAME', 'COMMENT_LIBRARY',
+                    'COMMENT_LIBRARY_FILENAME', 'STORAGE_MODE', 'JOURNAL_COMPACT_ENTRIES', 'STYLE_RULES',
+                    'SENTENCE_CAPITALISER', 'ABBREVIATIONS', 'CACHE_ENABLED', 'CACHE_SIZE']
+
+def get_export_format(filename):
+    """
+    Works out the export format from a file name, defaulting to plain text.
+
+    Params:
+        filename: string
+
+    Returns:
+        string - one of EXPORT_FORMATS
+    """
+    extension = os.path.splitext(str(filename))[1].lower().lstrip('.')
+    if extension in EXPORT_FORMATS:
+        return extension
+    return 'txt'
+
+def _export_comments(subject, progress=None):
+    """
+    Generates each student's full report comment (rendered intro comment and their own comment) in order.
+
+    Params:
+        subject: dict
+        progress: optional function called as progress(students_done, total_students) after each student
+
+    Yields:
+        (student dict, comment string) tuples
+    """
+    rendered = render_subject(subject, include_bank=False)
+    total = len(subject['students'])
+    for done, (student, result) in enumerate(zip(subject['students'], rendered), 1):
+        yield student, result['intro_comment'] + " " + student['comment']
+        if progress:
+            progress(done, total)
+
+def _write_txt_export(export_out, subject_name, comments):
+    """
+    Writes report comments in the plain text layout.
+
+    Params:
+        export_out: file opened for writing
+        subject_name: string
+        comments: iterable of (student dict, comment string) tuples
+    """
+    # Heading
+    export_out.write("=" * 80)
+    for line in ("Report Comments for: " + subject_name, "=" * 80, "\n"):
+        export_out.write("\n" + line)
+
+    # Add student names and comments
+    # TODO remove extra newlines?
+    for student, comment in comments:
+        for line in ("-" * 80, student['first_name'] + " " + student['last_name'], "-" * 80, comment, "\n"):
+            export_out.write("\n" + line)
+
+def _write_csv_export(export_out, subject_name, comments):
+    """
+    Writes report comments as a CSV file with a heading row, one student per row.
+
+    Params:
+        export_out: file opened for writing with newline=''
+        subject_name: string
+        comments: iterable of (student dict, comment string) tuples
+    """
+    writer = csv.writer(export_out)
+    writer.writerow(["First Name", "Last Name", "Comment"])
+    for student, comment in comments:
+        writer.writerow([student['first_name'], student['last_name'], comment])
+
+def _write_jsonl_export(export_out, subject_name, comments):
+    """
+    Writes report comments as JSON Lines, one JSON object per student.
+
+    Params:
+        export_out: file opened for writing
+        subject_name: string
+        comments: iterable of (student dict, comment string) tuples
+    """
+    for student, comment in comments:
+        export_out.write(json.dumps({
+            "subject_name": subject_name,
+            "first_name": student['first_name'],
+            "last_name": student['last_name'],
+            "comment": comment}))
+        export_out.write("\n")
+
+# Export formats: writer function and extra options for open()
+EXPORT_FORMATS = {
+    'txt': (_write_txt_export, {}),
+    'csv': (_write_csv_export, {'newline': '', 'encoding': 'utf-8-sig'}),
+    'jsonl': (_write_jsonl_export, {'encoding': 'utf-8'})
+}
+
+_EXPORT_BUFFER_SIZE = 64 * 1024
+
+def delete(subject_name):
+    """
+    Deletes a saved json file from the config.DATA directory.
+
+    Params:
+        subject_name: string
+    Returns:
+        Boolean
+    """
+    storage = _get_storage()
+    if storage is not None:
+        try:
+            if not storage.delete(subject_name):
+                print("No saved subject called " + subject_name)
+                return False
+        except Exception as err:
+            # TODO better error handling here
+            print(err)
+            return False
+        delete_draft(subject_name)
+        return True
+    try:
+        os.remove(str(config.DATA_FOLDER + subject_name + '.json'))
+        if os.path.exists(_journal_filename(subject_name)):
+            os.remove(_journal_filename(subject_name))
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+        return False
+    _journal_baselines.pop(subject_name, None)
+    _remove_from_manifest(subject_name)
+    delete_draft(subject_name)
+    return True
+
+def save_draft(subject_name, kind, draft):
+    """
+    Saves unsaved changes to a subject as a draft in config.DATA_FOLDER, so they can be restored with load_draft()
+    after the window is cancelled or the app crashes. The subject's save file isn't touched.
+
+    Params:
+        subject_name: string
+        kind: string - what the draft holds, e.g. 'reports', so each window has its own draft
+        draft: dict that can be converted to json
+
+    Returns:
+        Boolean
+    """
+    try:
+        _write_json_atomic(_draft_filename(subject_name, kind), dict(draft, draft_saved=time.time()), indent=None)
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+        return False
+    return True
+
+def load_draft(subject_name, kind):
+    """
+    Loads a draft saved by save_draft().
+
+    Params:
+        subject_name: string
+        kind: string
+
+    Returns:
+        dict with the time the draft was saved under 'draft_saved', or None if there isn't a draft
+    """
+    filename = _draft_filename(subject_name, kind)
+    if not os.path.exists(filename):
+        return None
+    try:
+        with open(filename, 'r') as draft_in:
+            return json.load(draft_in)
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+        return None
+
+def delete_draft(subject_name, kind=None):
+    """
+    Deletes a subject's draft, e.g. once the subject has been saved.
+
+    Params:
+        subject_name: string
+        kind: string, or None to delete every draft for the subject
+    """
+    kinds = DRAFT_KINDS if kind is None else [kind]
+    for kind in kinds:
+        filename = _draft_filename(subject_name, kind)
+        try:
+            if os.path.exists(filename):
+                os.remove(filename)
+        except Exception as err:
+            # TODO better error handling here
+            print(err)
+
+def _draft_filename(subject_name, kind):
+    """
+    Returns:
+        string - path of a subject's draft file
+    """
+    return config.DATA_FOLDER + subject_name + '.' + kind + '.draft'
+
+# Drafts kept for each subject: unsaved student comments from the reports window and the intro comment and comment
+# bank from the comment bank window.
+DRAFT_KINDS = ['reports', 'comment-bank']
+
+def migrate_to_sqlite(overwrite=False):
+    """
+    Copies every subject saved as a json file in config.DATA_FOLDER into the SQLite database. The json files are left
+    where they are.
+
+    Params:
+        overwrite: Boolean - replace subjects which are already in the database
+
+    Returns:
+        list of strings - names of the subjects copied
+    """
+    migrated = []
+    existing = set(sqlite_storage.get_saved_list())
+    for subject_name in sorted(_get_saved_json_list()):
+        if subject_name in existing and not overwrite:
+            print("Skipping {} - already in the database".format(subject_name))
+            continue
+        subject = _load_json(subject_name)
+        if not subject:
+            continue
+        try:
+            sqlite_storage.save(subject)
+        except Exception as err:
+            # TODO better error handling here
+            print(err)
+            continue
+        migrated.append(subject_name)
+    return migrated
+
+def convert_subjects(to_format, overwrite=False):
+    """
+    Converts every subject saved as a json file in config.DATA_FOLDER to the binary format, or every binary file back
+    to json. Nothing is lost either way, and the original files are left where they are.
+
+    Params:
+        to_format: 'binary' or 'json'
+        overwrite: Boolean - replace subjects which are already saved in to_format
+
+    Returns:
+        list of strings - names of the subjects converted
+    """
+    if to_format == 'binary':
+        subject_names, existing = _get_saved_json_list(), binary_storage.get_saved_list()
+    else:
+        subject_names, existing = binary_storage.get_saved_list(), _get_saved_json_list()
+    converted = []
+    for subject_name in sorted(subject_names):
+        if subject_name in existing and not overwrite:
+            print("Skipping {} - already saved as {}".format(subject_name, to_format))
+            continue
+        try:
+            if to_format == 'binary':
+                subject = _load_json(subject_name)
+                if not subject:
+                    continue
+                binary_storage.save(subject)
+            else:
+                subject = binary_storage.load(subject_name)
+                _save_snapshot(subject)
+                _update_manifest(subject)
+        except Exception as err:
+            # TODO better error handling here
+            print(err)
+            continue
+        converted.append(subject_name)
+    return converted
+
+def import_comment_bank(subject, comment_bank, intro_comment=None, merge=False):
+    """
+    Puts a comment bank (and optionally an intro comment) into a subject dict. Doesn't save the subject.
+
+    Params:
+        subject: dict
+        comment_bank: list of strings
+        intro_comment: string, or None to leave the intro comment as it is
+        merge: Boolean - add comments which aren't already in the bank (allowing for differences in spacing)
+            instead of replacing it
+
+    Returns:
+        dict - the subject
+    """
+    if merge:
+        subject['comment_bank'].extend(merge_comment_banks(subject['comment_bank'], comment_bank))
+    else:
+        subject['comment_bank'] = list(comment_bank)
+    if intro_comment is not None:
+        subject['intro_comment'] = intro_comment
+    # The comments may have been styled with different rules
+    forget_style_fingerprints(subject, ['comment_bank'] if intro_comment is None else ['comment_bank', 'intro_comment'])
+    return subject
+
+class CommentIndex:
+    """
+    Inverted index over a comment bank for searching as you type.
+
+    Each word maps to the comments containing it, and the words are also kept sorted so the last (partly typed) word
+    of a search can be looked up as a prefix. Comments can be added, updated and removed without rebuilding the index.
+
+    Params:
+        comments: list of strings
+    """
+
+    def __init__(self, comments=()):
+        # Comment ids by row. Ids stay the same when earlier comments are removed.
+        self.ids = []
+        self.next_id = 0
+        # Word: {comment id: number of times the word appears in the comment}
+        self.postings = {}
+        self.words = []
+        # Prefix: {comment id: number of longer words in the comment starting with the prefix}
+        self.prefix_postings = {}
+        # Words in each comment, by id
+        self.comment_words = {}
+        # Row of each comment id, worked out again after a comment is removed
+        self.rows = {}
+        for comment in comments:
+            self.add(comment)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, comment):
+        """
+        Adds a comment to the end of the bank.
+        """
+        comment_id = self.next_id
+        self.next_id += 1
+        if self.rows is not None:
+            self.rows[comment_id] = len(self.ids)
+        self.ids.append(comment_id)
+        self._index(comment_id, comment)
+
+    def update(self, row, comment):
+        """
+        Replaces the comment at row.
+        """
+        comment_id = self.ids[row]
+        self._unindex(comment_id)
+        self._index(comment_id, comment)
+
+    def remove(self, row):
+        """
+        Removes the comment at row. Later comments move up a row.
+        """
+        comment_id = self.ids.pop(row)
+        self._unindex(comment_id)
+        self.rows = None
+
+    def search(self, text, limit=None):
+        """
+        Finds comments containing every word in text. The last word also matches longer words starting with it,
+        since it may not have been finished yet.
+
+        Comments are ranked by how many times they contain the words, with whole words counting more than words
+        which only start with the last word, then by their order in the bank.
+
+        Params:
+            text: string
+            limit: int or None - most results to return
+
+        Returns:
+            list of ints - rows of the matching comments, best first
+        """
+        query = _comment_words(text)
+        if not query:
+            return list(range(len(self.ids)))[:limit]
+        scores = None
+        for position, word in enumerate(query):
+            matches = {}
+            for comment_id, count in self.postings.get(word, {}).items():
+                matches[comment_id] = count * 2
+            if position == len(query) - 1 and len(word) <= _SHORT_PREFIX:
+                # Short prefixes match lots of words, so they have their own postings
+                for comment_id, count in self.prefix_postings.get(word, {}).items():
+                    matches[comment_id] = matches.get(comment_id, 0) + count
+            elif position == len(query) - 1:
+                start = bisect.bisect_right(self.words, word)
+                end = bisect.bisect_left(self.words, word + '\uffff', start)
+                for longer_word in self.words[start:end]:
+                    for comment_id, count in self.postings[longer_word].items():
+                        matches[comment_id] = matches.get(comment_id, 0) + count
+            if scores is None:
+                scores = matches
+            else:
+                scores = {comment_id: score + matches[comment_id] for comment_id, score in scores.items() if comment_id in matches}
+            if not scores:
+                return []
+        rows = self._get_rows()
+        ranked = sorted((-score, rows[comment_id]) for comment_id, score in scores.items())
+        return [row for score, row in ranked[:limit]]
+
+    def _index(self, comment_id, comment):
+        words = collections.Counter(_comment_words(comment))
+        self.comment_words[comment_id] = words
+        for word, count in words.items():
+            posting = self.postings.get(word)
+            if posting is None:
+                posting = self.postings[word] = {}
+                bisect.insort(self.words, word)
+            posting[comment_id] = count
+        for prefix, count in self._short_prefixes(words).items():
+            self.prefix_postings.setdefault(prefix, {})[comment_id] = count
+
+    def _unindex(self, comment_id):
+        words = self.comment_words.pop(comment_id)
+        for word in words:
+            posting = self.postings[word]
+            del posting[comment_id]
+            if not posting:
+                del self.postings[word]
+                del self.words[bisect.bisect_left(self.words, word)]
+        for prefix in self._short_prefixes(words):
+            posting = self.prefix_postings[prefix]
+            del posting[comment_id]
+            if not posting:
+                del self.prefix_postings[prefix]
+
+    def _short_prefixes(self, words):
+        """
+        Params:
+            words: collections.Counter of the words in a comment
+
+        Returns:
+            collections.Counter - how many times each prefix up to _SHORT_PREFIX characters long starts a longer word
+        """
+        prefixes = collections.Counter()
+        for word, count in words.items():
+            for length in range(1, min(len(word) - 1, _SHORT_PREFIX) + 1):
+                prefixes[word[:length]] += count
+        return prefixes
+
+    def _get_rows(self):
+        if self.rows is None:
+            self.rows = {comment_id: row for row, comment_id in enumerate(self.ids)}
+        return self.rows
+
+def _comment_words(text):
+    """
+    Splits a comment (or search) into lower case words for CommentIndex, leaving out placeholder codes.
+
+    Returns:
+        list of strings
+    """
+    return _WORD_PATTERN.findall(_PLACEHOLDER_PATTERN.sub(" ", text).lower())
+
+# Prefixes up to this long get their own postings in CommentIndex
+_SHORT_PREFIX = 2
+
+_WORD_PATTERN = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+
+def get_style_fingerprint():
+    """
+    Identifies the settings comments are styled with, so comments styled before the style rules changed can be found.
+
+    Returns:
+        string - changes whenever config.STYLE_RULES, config.SENTENCE_CAPITALISER or config.ABBREVIATIONS do
+    """
+    settings = [_STYLE_VERSION, config.STYLE_RULES, config.SENTENCE_CAPITALISER, sorted(config.ABBREVIATIONS)]
+    return hashlib.sha1(json.dumps(settings).encode('utf-8')).hexdigest()[:16]
+
+# Change this when do_style() itself changes what it does to comments, so every subject is restyled.
+_STYLE_VERSION = 1
+
+# Parts of a subject restyled by restyle_subject(), which each remember the fingerprint of the style rules they were
+# last restyled with in the subject's 'style_fingerprints'.
+STYLED_FIELDS = ('intro_comment', 'comment_bank', 'students')
+
+def get_stale_style_fields(subject, fingerprint=None):
+    """
+    Finds the parts of a subject which haven't been restyled with the current style rules. Subjects saved before
+    fingerprints were recorded have none, so every part of them is stale.
+
+    Params:
+        subject: dict
+        fingerprint: string from get_style_fingerprint(), or None to work it out
+
+    Returns:
+        list of strings from STYLED_FIELDS
+    """
+    if fingerprint is None:
+        fingerprint = get_style_fingerprint()
+    fingerprints = subject.get('style_fingerprints') or {}
+    return [field for field in STYLED_FIELDS if fingerprints.get(field) != fingerprint]
+
+def forget_style_fingerprints(subject, fields):
+    """
+    Marks parts of a subject as needing to be restyled, e.g. when comments are copied in from another subject.
+
+    Params:
+        subject: dict
+        fields: list of strings from STYLED_FIELDS
+    """
+    if 'style_fingerprints' in subject:
+        # A new dict, so the journal notices the change (see _set_journal_baseline)
+        subject['style_fingerprints'] = {field: fingerprint for field, fingerprint in subject['style_fingerprints'].items()
+                                         if field not in fields}
+
+def restyle_subject(subject, force=False, changes=None):
+    """
+    Applies the style rules to a subject's intro comment, comment bank and every student comment, e.g. after
+    config.STYLE_RULES has changed. Doesn't save the subject.
+
+    Only the parts of the subject which weren't last restyled with the current rules are restyled (see
+    get_stale_style_fields), and the subject records that every part now has been.
+
+    Params:
+        subject: dict
+        force: Boolean - restyle every part of the subject, even if it is up to date
+        changes: optional list which gets a (field, index, old comment, new comment) tuple appended for each comment
+            that changed. index is None for the intro comment.
+
+    Returns:
+        int - number of comments that changed
+    """
+    fingerprint = get_style_fingerprint()
+    fields = STYLED_FIELDS if force else get_stale_style_fields(subject, fingerprint)
+    if changes is None:
+        changes = []
+    start = len(changes)
+    if 'intro_comment' in fields:
+        intro_comment = do_style(subject['intro_comment'])
+        if intro_comment != subject['intro_comment']:
+            changes.append(('intro_comment', None, subject['intro_comment'], intro_comment))
+            subject['intro_comment'] = intro_comment
+    if 'comment_bank' in fields:
+        for index, comment in enumerate(subject['comment_bank']):
+            styled = do_style(comment)
+            if styled != comment:
+                changes.append(('comment_bank', index, comment, styled))
+                subject['comment_bank'][index] = styled
+    if 'students' in fields:
+        for index, student in enumerate(subject['students']):
+            styled = do_style(student['comment'])
+            if styled != student['comment']:
+                changes.append(('students', index, student['comment'], styled))
+                student['comment'] = styled
+    if fields:
+        subject['style_fingerprints'] = dict(subject.get('style_fingerprints') or {}, **dict.fromkeys(fields, fingerprint))
+    return len(changes) - start
+
+def restyle_many(subject_names, dry_run=False, force=False, processes=None, progress=None):
+    """
+    Restyles several saved subjects at once (see restyle_subject), spreading the subjects across a pool of processes.
+    Subjects already restyled with the current style rules are loaded but not saved again.
+
+    Params:
+        subject_names: list of strings
+        dry_run: Boolean - work out what would change and report it in each result's 'diff', without saving anything
+        force: Boolean - restyle every comment, even in subjects that are up to date
+        processes: number of worker processes, defaults to the number of CPUs. Use 1 to restyle in this process.
+        progress: optional function called as progress(result, subjects_done, total_subjects) as each subject
+            finishes, where result is that subject's result dict
+
+    Returns:
+        list of dicts, one for each subject in the order given, with 'subject_name', 'fields' (the parts of the
+        subject restyled), 'changed' (number of comments changed), 'diff' (a unified diff of the changes, for a dry
+        run, otherwise None), 'success', 'seconds' and 'error' keys
+    """
+    subject_names = list(dict.fromkeys(subject_names))
+    settings = _get_worker_settings()
+    results = {}
+
+    if processes == 1 or len(subject_names) <= 1:
+        for done, subject_name in enumerate(subject_names, 1):
+            results[subject_name] = _restyle_job(subject_name, dry_run, force, settings)
+            if progress:
+                progress(results[subject_name], done, len(subject_names))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {executor.submit(_restyle_job, subject_name, dry_run, force, settings): subject_name
+                       for subject_name in subject_names}
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                subject_name = futures[future]
+                try:
+                    result = future.result()
+                except Exception as err:
+                    # e.g. the worker process died
+                    result = _restyle_result(subject_name, [], 0, None, False, 0, str(err))
+                results[subject_name] = result
+                if progress:
+                    progress(result, done, len(subject_names))
+
+    return [results[subject_name] for subject_name in subject_names]
+
+def _restyle_job(subject_name, dry_run, force, settings):
+    """
+    Restyles a single subject for restyle_many(). Runs in a worker process.
+
+    Params:
+        subject_name: string
+        dry_run: Boolean
+        force: Boolean
+        settings: dict from _get_worker_settings()
+
+    Returns:
+        dict - see restyle_many()
+    """
+    _apply_worker_settings(settings)
+    start = time.perf_counter()
+    # load() and save() report problems by printing them, so keep what they print as the error message.
+    messages = io.StringIO()
+    fields = []
+    changes = []
+    diff = None
+    try:
+        with contextlib.redirect_stdout(messages):
+            subject = load(subject_name)
+            if not subject:
+                success = False
+            else:
+                fields = list(STYLED_FIELDS) if force else get_stale_style_fields(subject)
+                restyle_subject(subject, force, changes)
+                if dry_run:
+                    diff = _restyle_diff(subject, changes)
+                    success = True
+                else:
+                    success = not fields or save(subject)
+    except Exception as err:
+        success = False
+        messages.write(str(err))
+    error = None if success else (messages.getvalue().strip() or "Restyle failed.")
+    return _restyle_result(subject_name, fields, len(changes), diff, success, time.perf_counter() - start, error)
+
+def _restyle_result(subject_name, fields, changed, diff, success, seconds, error):
+    """
+    Returns:
+        dict - a result for restyle_many()
+    """
+    return {
+        "subject_name": subject_name,
+        "fields": fields,
+        "changed": changed,
+        "diff": diff,
+        "success": success,
+        "seconds": seconds,
+        "error": error
+    }
+
+def _restyle_diff(subject, changes):
+    """
+    Params:
+        subject: dict
+        changes: list of tuples from restyle_subject()
+
+    Returns:
+        string - a unified diff of each comment that changed
+    """
+    lines = []
+    for field, index, old, new in changes:
+        if field == 'intro_comment':
+            label = "intro comment"
+        elif field == 'comment_bank':
+            label = "comment bank {}".format(index + 1)
+        else:
+            student = subject['students'][index]
+            label = "{} {}".format(student['first_name'], student['last_name'])
+        name = "{}: {}".format(subject['subject_name'], label)
+        lines.extend(difflib.unified_diff(old.splitlines(), new.splitlines(), name, name + " (restyled)", lineterm=""))
+    return "\n".join(lines)
+
+def render_subject(subject, include_bank=True):
+    """
+    Renders the intro comment and comment bank for every student in a subject at once (see render_students).
+
+    Params:
+        subject: dict
+        include_bank: Boolean - set to False if only the intro comments are needed
+
+    Returns:
+        list of dicts with 'intro_comment' and 'comment_bank' keys, one for each student in subject['students'].
+        Students with the same name and pronouns share the same dict, so don't modify them.
+    """
+    return render_students(compile_subject(subject), subject['students'], include_bank)
+
+def render_students(templates, students, include_bank=True):
+    """
+    Renders the intro comment and comment bank for several students at once. Safe to run in the background.
+
+    Students with the same first name and pronouns get exactly the same text, so each (first name, pronouns)
+    combination (see get_render_key) is only rendered once and shared between those students.
+
+    Params:
+        templates: CompiledSubject
+        students: list of student dicts
+        include_bank: Boolean - set to False if only the intro comments are needed
+
+    Returns:
+        list of dicts with 'intro_comment' and 'comment_bank' keys, one for each student. Students with the same name
+        and pronouns share the same dict, so don't modify them.
+    """
+    rendered = {}
+    output = []
+    for student in students:
+        key = get_render_key(student)
+        result = rendered.get(key)
+        if result is None:
+            result = {
+                'intro_comment': templates.render_intro(student['first_name'], student['pronouns']),
+                'comment_bank': templates.render_bank(student['first_name'], student['pronouns']) if include_bank else []
+            }
+            rendered[key] = result
+        output.append(result)
+    return output
+
+def get_render_key(student):
+    """
+    Returns:
+        tuple - the same for any two students whose intro comment and comment bank render the same way
+    """
+    return (student['first_name'], tuple(student['pronouns']))
+
+@_memoised('do_placeholders', lambda text, name, pronouns: (
+    text, name, tuple(pronouns), config.SENTENCE_CAPITALISER, _get_abbreviations()))
+def do_placeholders(text, name, pronouns):
+    """
+    Replace placeholders in a given string. Also fixes sentence capitalisation problems cause as a result.
+
+    The text is compiled into a CommentTemplate (and cached) the first time it is used, so rendering the same comment
+    for another student doesn't need to scan it again.
+
+    Pronoun codes are:
+        <sp> - subjective pronoun e.g. "He" or "She"
+        <op> - objective pronoun e.g. "Him" or "Her"
+        <pa> - possesive adjective e.g. "his" or "her" "project"
+        <pp> - possesive pronoun e.g. The project is his/hers.
+        <rp> - reflexive pronoun e.g. "himself" or "herself"
+
+    Params:
+        text: a string containing pronoun codes to replace.
+        name: string - student name
+        pronouns: a list of custom pronouns in the form [subjective-pronoun, objective-pronoun, possesive-adjective, possesive-pronoun]
+
+    Returns:
+        string
+    """
+    return compile_template(text).render(name, pronouns)
+
+def _do_placeholders_uncompiled(text, name, pronouns):
+    """
+    Replace placeholders without compiling the text first. Used by CommentTemplate when a name or pronoun could
+    change where sentences start.
+
+    Params:
+        text: a string containing pronoun codes to replace.
+        name: string - student name
+        pronouns: list of pronouns, as for do_placeholders()
+
+    Returns:
+        string
+    """
+    text = text.replace('<name>', name)
+    text = text.replace('<sp>', pronouns[0])
+    text = text.replace('<op>', pronouns[1])
+    text = text.replace('<pa>', pronouns[2])
+    text = text.replace('<pp>', pronouns[3])
+    text = text.replace('<rp>', pronouns[4])
+
+    # TODO: add extra replacements for participles relating to "they" pronouns
+    # TODO: do this automatically with TextBlob?
+
+    text = _capitalise_sentences(text)
+
+    return text
+
+@_memoised('do_style', lambda text: (text, config.SENTENCE_CAPITALISER, _get_style_engine(), _get_abbreviations()))
+def do_style(text):
+    """
+    Apply replacement patterns defined in config. Also fixes an sentence capitalisation errors.
+
+    The rules are applied by a StyleRuleEngine compiled from config.STYLE_RULES, which gives the same result as running
+    each rule through re.sub() in order.
+
+    Params:
+        text: string
+
+    Returns:
+        string
+    """
+    text = _get_style_engine().apply(text)
+
+    # Recapitalise sentences to fix errors introduced.
+    text = _capitalise_sentences(text)
+
+    return text
+
+def style_student_comment(text, name, pronouns):
+    """
+    Fills in placeholders and applies the style rules to a student comment. Gives the same result as
+    do_style(do_placeholders(text, name, pronouns)).
+
+    With config.INCREMENTAL_STYLE the comment is split into sentences which are styled and cached separately, so saving
+    a long comment after a small edit only restyles the sentences that changed. The whole comment is styled in one go
+    instead if splitting it could change the result, e.g. when a style rule could match across the end of a sentence.
+
+    Params:
+        text: string
+        name: string - student name
+        pronouns: list of pronouns, as for do_placeholders()
+
+    Returns:
+        string
+    """
+    if config.INCREMENTAL_STYLE and config.SENTENCE_CAPITALISER == 'builtin' and _get_style_engine().splits_sentences:
+        sentences = _split_sentences(text)
+        if len(sentences) > 1:
+            styled = [_style_sentence(sentence, name, pronouns) for sentence in sentences]
+            # A style rule could have changed the end of a sentence, e.g. into an abbreviation
+            if all(_ends_sentence(styled[index]) and styled[index + 1][:1].isspace()
+                   for index in range(len(styled) - 1)):
+                return "".join(styled)
+    return do_style(do_placeholders(text, name, pronouns))
+
+@_memoised('style_sentence', lambda sentence, name, pronouns: (
+    sentence, name, tuple(pronouns), config.SENTENCE_CAPITALISER, _get_style_engine(), _get_abbreviations()))
+def _style_sentence(sentence, name, pronouns):
+    """
+    Styles one sentence for style_student_comment(). Cached by the sentence's text and the style rules, without also
+    filling the do_placeholders() and do_style() caches with every sentence.
+
+    Returns:
+        string
+    """
+    text = _get_style_engine().apply(_do_placeholders_uncompiled(sentence, name, pronouns))
+    return _capitalise_sentences_builtin(text)
+
+def _split_sentences(text):
+    """
+    Splits text where the builtin capitaliser would start a new sentence. Each piece after the first starts with the
+    whitespace following the previous sentence. Full stops after abbreviations or placeholders (which could be filled
+    in with an abbreviation) aren't treated as the end of a sentence.
+
+    Params:
+        text: string
+
+    Returns:
+        list of strings which join back into text
+    """
+    sentences = []
+    position = 0
+    for match in _SENTENCE_END.finditer(text):
+        word = match.group('word')
+        if '<' in word or '>' in word:
+            continue
+        if match.group('stop') == '.' and _is_abbreviation(word):
+            continue
+        sentences.append(text[position:match.end()])
+        position = match.end()
+    sentences.append(text[position:])
+    return sentences
+
+def _ends_sentence(text):
+    """
+    Checks whether text ends in a full stop, question mark or exclamation mark (and any closing quotes or brackets)
+    which ends a sentence.
+
+    Returns:
+        Boolean
+    """
+    match = _SENTENCE_END_AT_END.search(text)
+    if match is None:
+        return False
+    return match.group('stop') != '.' or not _is_abbreviation(match.group('word'))
+
+# The end of a sentence as _SENTENCE_START sees it, without the whitespace after it.
+_SENTENCE_END = re.compile(r"""(?<!\S)(?P<word>\S*?)(?P<stop>[.!?])["')\]]*(?=\s)""")
+_SENTENCE_END_AT_END = re.compile(r"""(?<!\S)(?P<word>\S*?)(?P<stop>[.!?])["')\]]*\Z""")
+
+# Characters that end a sentence. Style rules that could match one of them might change where sentences end.
+_SENTENCE_END_CHARS = '.!?"\')]'
+
+@_memoised('capitalise_sentences', lambda text: (text, config.SENTENCE_CAPITALISER, _get_abbreviations()))
+def _capitalise_sentences(text):
+    """
+    Capitalises the first letter of each sentence, using the method set in config.SENTENCE_CAPITALISER.
+
+    Params:
+        text: string
+
+    Returns:
+        string: capitalised text
+    """
+    if config.SENTENCE_CAPITALISER == 'textblob':
+        return _capitalise_sentences_textblob(text)
+    return _capitalise_sentences_builtin(text)
+
+# Matches the start of the text or the end of a sentence (a full stop, question
+# mark or exclamation mark, then any closing quotes or brackets, then
+# whitespace), followed by the letter which starts the next sentence. The
+# letter is inside a lookahead so it can also be the start of the next match.
+_SENTENCE_START = re.compile(r"""
+    (?:
+        ^\s*
+        |
+        (?<!\S)(?P<word>\S*?)(?P<stop>[.!?])["')\]]*\s+
+    )
+    (?=["'(\[]*(?P<letter>[^\W\d_]))
+    """, re.X)
+
+def _capitalise_sentences_builtin(text):
+    """
+    Capitalises sentences without needing TextBlob. Whitespace (including new lines) is left as it is, and full stops
+    after abbreviations in config.ABBREVIATIONS don't count as the end of a sentence. Initials need no special case:
+    the word after one is already capitalised, while a single letter followed by a lower case word ("got an A. she")
+    ends a sentence. Only a full stop, question mark or exclamation mark ends a sentence, so a line that doesn't end in
+    one runs on into the next line without capitalising it.
+
+    Params:
+        text: string
+
+    Returns:
+        string: capitalised text
+    """
+    output = []
+    position = 0
+    for match in _SENTENCE_START.finditer(text):
+        if match.group('stop') == '.' and _is_abbreviation(match.group('word')):
+            continue
+        index = match.start('letter')
+        letter = text[index]
+        if letter.isupper():
+            continue
+        output.append(text[position:index])
+        output.append(letter.upper())
+        position = index + 1
+    if not output:
+        return text
+    output.append(text[position:])
+    return "".join(output)
+
+def _is_abbreviation(word):
+    """
+    Checks whether a word ending in a full stop is an abbreviation (e.g. "Mr" or "e.g"), rather than the end of a
+    sentence.
+
+    Params:
+        word: string - the text before the full stop
+
+    Returns:
+        Boolean
+    """
+    return word.lstrip("\"'([").lower() in _get_abbreviations()
+
+def _get_abbreviations():
+    """
+    Returns config.ABBREVIATIONS as a set, rebuilding it if they have changed. Cached results which depend on the
+    abbreviations include it in their keys, so they aren't used once the abbreviations change.
+
+    Returns:
+        frozenset of strings
+    """
+    global _abbreviations
+    if _abbreviations is None or _abbreviations[0] != config.ABBREVIATIONS:
+        _abbreviations = (list(config.ABBREVIATIONS), frozenset(config.ABBREVIATIONS))
+    return _abbreviations[1]
+
+# config.ABBREVIATIONS as a list, to notice when they change, and as a set
+_abbreviations = None
+
+def _capitalise_sentences_textblob(text):
+    """
+    Uses TextBlob to capitalise sentences. Sentences are joined back together with single spaces.
+
+    Params:
+        text: string
+
+    Returns:
+        string: capitalised text
+    """
+    output = []
+    blob = _get_textblob()(text)
+    for sentence in blob.sentences:
+        # Using .capitalize() removes capitalisation elsewhere in the
         # sentence, so instead capitalise the first letter only and then
         # append the rest of the sentence.
         output.append(str(sentence[:1].upper() + sentence[1:]))
     return " ".join(output)
+
+# Placeholder codes, in the order do_placeholders() replaces them. The position
+# in this list is the index of the value in (name, *pronouns).
+_PLACEHOLDERS = ['<name>', '<sp>', '<op>', '<pa>', '<pp>', '<rp>']
+_PLACEHOLDER_PATTERN = re.compile('|'.join(re.escape(code) for code in _PLACEHOLDERS))
+
+# Names and pronouns which start with a letter and contain nothing that could
+# change where sentences start (spaces, sentence endings, quotes, brackets or
+# anything that could make another placeholder). These can go straight into a
+# compiled template. Anything else falls back to the full replace-and-capitalise
+# path so the result is always the same.
+_SIMPLE_VALUE = re.compile(r"""[^\W\d_][^\s.!?"'()\[\]<>]*\Z""")
+
+# Stand-in value used to work out where sentences start when compiling a
+# template. Any simple value behaves the same way.
+_PROBE_VALUE = 'xq'
+
+class CommentTemplate:
+    """
+    A comment (or intro comment) compiled for fast placeholder replacement.
+
+    The text is split into literal and placeholder segments once, and the sentence starts are worked out once, so
+    rendering for a student is a single join. Sentence starts that depend on the student's values (e.g. whether a
+    name before a full stop is an abbreviation) are checked when rendering without rescanning the text.
+
+    Params:
+        text: string containing placeholder codes
+    """
+
+    __slots__ = ['text', 'segments']
+
+    def __init__(self, text):
+        self.text = text
+        # None means this template always uses the slow path.
+        self.segments = _compile_segments(text)
+
+    def render(self, name, pronouns):
+        """
+        Replace placeholders and capitalise sentences, giving the same result as do_placeholders().
+
+        Params:
+            name: string - student name
+            pronouns: list of pronouns, as for do_placeholders()
+
+        Returns:
+            string
+        """
+        values = (name, pronouns[0], pronouns[1], pronouns[2], pronouns[3], pronouns[4])
+        if self.segments is None or config.SENTENCE_CAPITALISER != 'builtin' or not _simple_values(values):
+            return _do_placeholders_uncompiled(self.text, name, pronouns)
+        output = []
+        for segment in self.segments:
+            if segment.__class__ is str:
+                output.append(segment)
+            elif segment.__class__ is int:
+                output.append(values[segment])
+            else:
+                output.append(segment.render(values))
+        return "".join(output)
+
+class _CapitalisedSegment:
+    """
+    A segment of a compiled template which starts a sentence.
+
+    Params:
+        value: string for literal text, or int index of a placeholder value
+        word: None if the segment is always capitalised, otherwise a list of strings and value indexes making up the
+            word before the full stop, which decides whether it is really the end of a sentence
+    """
+
+    __slots__ = ['value', 'capitalised', 'word']
+
+    def __init__(self, value, word):
+        self.value = value
+        self.capitalised = None if isinstance(value, int) else _capitalise_first(value)
+        self.word = word
+
+    def render(self, values):
+        """
+        Params:
+            values: tuple of the student's name and pronouns
+
+        Returns:
+            string
+        """
+        if self.word is not None:
+            word = "".join(part if isinstance(part, str) else values[part] for part in self.word)
+            if _is_abbreviation(word):
+                return values[self.value] if self.capitalised is None else self.value
+        if self.capitalised is None:
+            return _capitalise_first(values[self.value])
+        return self.capitalised
+
+class CompiledSubject:
+    """
+    Compiled templates for a subject's intro comment and comment bank.
+
+    Params:
+        intro_comment: string
+        comment_bank: list of strings
+    """
+
+    def __init__(self, intro_comment, comment_bank):
+        self.intro_comment = intro_comment
+        self.comment_bank = tuple(comment_bank)
+        self.abbreviations = _get_abbreviations()
+        self.intro_template = compile_template(intro_comment)
+        self.bank_templates = [compile_template(comment) for comment in self.comment_bank]
+
+    def render_intro(self, name, pronouns):
+        """
+        Returns:
+            string - the intro comment for a student
+        """
+        return self.intro_template.render(name, pronouns)
+
+    def render_bank(self, name, pronouns):
+        """
+        Returns:
+            list of strings - the comment bank for a student
+        """
+        return [template.render(name, pronouns) for template in self.bank_templates]
+
+def compile_template(text):
+    """
+    Compiles a comment into a CommentTemplate. Templates are cached by their text and config.ABBREVIATIONS (whether or
+    not config.CACHE_ENABLED is set), so compiling the same comment again is just a lookup.
+
+    Params:
+        text: string
+
+    Returns:
+        CommentTemplate
+    """
+    key = (text, _get_abbreviations())
+    template = _template_cache.get(key)
+    if template is None:
+        template = CommentTemplate(text)
+        _template_cache.put(key, template)
+    return template
+
+def compile_subject(subject):
+    """
+    Gets the compiled intro comment and comment bank for a loaded subject.
+
+    The compiled form is kept until the intro comment, comment bank or config.ABBREVIATIONS change (or
+    invalidate_templates() is called), so it is only rebuilt after the bank is edited.
+
+    Params:
+        subject: dict
+
+    Returns:
+        CompiledSubject
+    """
+    subject_name = subject['subject_name']
+    compiled = _compiled_subjects.get(subject_name)
+    if (compiled is None or compiled.intro_comment != subject['intro_comment']
+            or compiled.comment_bank != tuple(subject['comment_bank'])
+            or compiled.abbreviations is not _get_abbreviations()):
+        compiled = CompiledSubject(subject['intro_comment'], subject['comment_bank'])
+        _compiled_subjects[subject_name] = compiled
+    return compiled
+
+def invalidate_templates(subject_name=None):
+    """
+    Throws away compiled templates for a subject, or for all subjects if no name is given.
+
+    Params:
+        subject_name: string or None
+    """
+    if subject_name is None:
+        _compiled_subjects.clear()
+    else:
+        _compiled_subjects.pop(subject_name, None)
+
+_template_cache = LRUCache(config.CACHE_SIZE)
+_caches['templates'] = _template_cache
+_compiled_subjects = {}
+
+def _compile_segments(text):
+    """
+    Splits a comment into segments for CommentTemplate.
+
+    Params:
+        text: string
+
+    Returns:
+        list of segments (string, int value index or _CapitalisedSegment), or None if the text can't be compiled
+    """
+    parts = []
+    position = 0
+    for match in _PLACEHOLDER_PATTERN.finditer(text):
+        parts.append(text[position:match.start()])
+        parts.append(_PLACEHOLDERS.index(match.group()))
+        position = match.end()
+    parts.append(text[position:])
+    if any(isinstance(part, str) and ('<' in part or '>' in part) for part in parts):
+        # Replacing placeholders one after another could join up stray brackets into another placeholder.
+        return None
+
+    # Map each position in a probe rendering back to the part it came from.
+    probe = []
+    owners = []
+    for index, part in enumerate(parts):
+        piece = _PROBE_VALUE if isinstance(part, int) else part
+        probe.append(piece)
+        owners.extend((index, offset) for offset in range(len(piece)))
+    probe = "".join(probe)
+
+    # Work out where each sentence starts and what decides it.
+    starts = {}
+    for match in _SENTENCE_START.finditer(probe):
+        word = None
+        if match.group('stop') == '.':
+            word_parts = []
+            previous = None
+            for index in range(match.start('word'), match.end('word')):
+                part_index, offset = owners[index]
+                part = parts[part_index]
+                if isinstance(part, int):
+                    if part_index != previous:
+                        word_parts.append(part)
+                elif word_parts and isinstance(word_parts[-1], str):
+                    word_parts[-1] += part[offset]
+                else:
+                    word_parts.append(part[offset])
+                previous = part_index
+            if any(isinstance(part, int) for part in word_parts):
+                word = word_parts
+            elif _is_abbreviation("".join(word_parts)):
+                continue
+        part_index, offset = owners[match.start('letter')]
+        starts[(part_index, offset)] = word
+
+    segments = []
+    for index, part in enumerate(parts):
+        if isinstance(part, int):
+            if (index, 0) in starts:
+                segments.append(_CapitalisedSegment(part, starts[(index, 0)]))
+            else:
+                segments.append(part)
+            continue
+        # Split literal text so each sentence start begins a segment.
+        offsets = sorted(offset for part_index, offset in starts if part_index == index)
+        if not offsets or offsets[0] > 0:
+            offsets.insert(0, 0)
+        for start, end in zip(offsets, offsets[1:] + [len(part)]):
+            piece = part[start:end]
+            if (index, start) not in starts:
+                if piece:
+                    segments.append(piece)
+            elif starts[(index, start)] is None:
+                segments.append(_capitalise_first(piece))
+            else:
+                segments.append(_CapitalisedSegment(piece, starts[(index, start)]))
+    return segments
+
+def _capitalise_first(text):
+    """
+    Capitalises the first character of a string in the same way as _capitalise_sentences_builtin().
+
+    Params:
+        text: string
+
+    Returns:
+        string
+    """
+    if not text or text[0].isupper():
+        return text
+    return text[0].upper() + text[1:]
+
+@functools.lru_cache(maxsize=1024)
+def _simple_values(values):
+    """
+    Checks whether a student's name and pronouns can be used with compiled templates.
+
+    Params:
+        values: tuple of strings
+
+    Returns:
+        Boolean
+    """
+    for value in values:
+        if not _SIMPLE_VALUE.match(value):
+            return False
+    return True
+
+_textblob = None
+_textblob_lock = threading.Lock()
+
+def _get_textblob():
+    """
+    Imports TextBlob the first time it is needed. Importing it also loads NLTK, which is slow, so this is kept off the
+    start up path.
+
+    Returns:
+        the TextBlob class
+    """
+    global _textblob
+    if _textblob is None:
+        with _textblob_lock:
+            if _textblob is None:
+                from textblob import TextBlob
+                _textblob = TextBlob
+    return _textblob
+
+def warm_up():
+    """
+    Does the slow one-off setup work (compiling style rules and, if it is being used, loading TextBlob and its sentence
+    tokeniser) so that the first comment processed doesn't have to wait for it.
+    """
+    try:
+        _get_style_engine()
+        if config.SENTENCE_CAPITALISER == 'textblob':
+            _capitalise_sentences_textblob("Warm up. Sentence tokeniser.")
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+
+def warm_up_in_background():
+    """
+    Runs warm_up() on a background thread.
+
+    Returns:
+        threading.Thread
+    """
+    thread = threading.Thread(target=warm_up, name="could-try-harder-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+# Maximum number of sample strings generated for a single style rule before it
+# is treated as too complex to merge with other rules.
+_STYLE_SAMPLE_LIMIT = 512
+
+class StyleRuleEngine:
+    """
+    Compiled form of a list of style rules.
+
+    Applying style rules one at a time means one full scan of the text per rule. The engine instead groups rules that
+    cannot affect each other into combined regular expressions, so the whole rule list usually takes one or two scans.
+    Rules are only merged (or moved ahead of earlier rules) when it can be shown that this gives exactly the same
+    output as applying every rule in order. Anything that can't be analysed gets a pass of its own.
+
+    Params:
+        rules: list of (pattern, replacement) tuples, as in config.STYLE_RULES
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.passes = []
+        # Whether styling sentences one at a time gives the same result as styling the whole text, i.e. no rule can
+        # match (or look at) the end of a sentence
+        self.splits_sentences = True
+        for group in _group_style_rules(self.rules):
+            self.passes.extend(_compile_style_pass(group))
+            for rule in group:
+                if rule.samples is None or any(char in sample for sample in rule.samples for char in _SENTENCE_END_CHARS):
+                    self.splits_sentences = False
+
+    def apply(self, text):
+        """
+        Apply all of the style rules to a string.
+
+        Params:
+            text: string
+
+        Returns:
+            string
+        """
+        for regex, replacement in self.passes:
+            text = regex.sub(replacement, text)
+        return text
+
+class _StyleRule:
+    """
+    A single style rule along with the information needed to decide which other rules it can be merged with.
+    """
+
+    def __init__(self, pattern, replacement):
+        self.pattern = pattern
+        self.replacement = replacement
+        # Case insensitive to cover more possible errors.
+        self.regex = re.compile(pattern, re.I)
+        self.samples = None
+        # Lookbehind (or leading lookahead) text is checked but not replaced, so it can't be treated like the rest of
+        # a match.
+        self.has_context = _has_leading_context(pattern)
+        # Replacements with escapes or group references need re.sub() to expand them, so they can't share a pass.
+        if '\\' not in replacement:
+            self.samples = _pattern_samples(pattern)
+
+    def conflicts_with(self, later):
+        """
+        Checks whether this rule and a rule that comes after it could give a different result if they were applied in
+        the same pass instead of one after the other.
+
+        In a combined pass the leftmost match wins and ties go to this rule, so problems only come from the later rule
+        seeing text this rule has changed, or from a match of the later rule starting before one of this rule.
+
+        Params:
+            later: _StyleRule
+
+        Returns:
+            Boolean - True if the later rule must be applied in a later pass
+        """
+        if self.samples is None or later.samples is None:
+            return True
+        replacement = self.replacement.lower()
+        # The replacement text must not form part of a match for the later rule.
+        if later.regex.search(replacement):
+            return True
+        for later_text in later.samples:
+            if _strings_overlap(replacement, later_text):
+                return True
+            for text in self.samples:
+                if later.has_context:
+                    # The later rule's lookahead or lookbehind could see text this rule has already changed.
+                    if _strings_overlap(text, later_text):
+                        return True
+                    continue
+                if text in later_text:
+                    return True
+                for length in range(1, min(len(text), len(later_text))):
+                    if later_text.endswith(text[:length]):
+                        return True
+        return False
+
+def _pattern_samples(pattern):
+    """
+    Builds a set of lower case sample strings covering every way a simple pattern can match.
+
+    Only literals, character sets, groups, alternation and repeats are supported. Lookahead and lookbehind text is
+    included in the samples as optional context, since a rule depends on it even though it doesn't replace it.
+
+    Params:
+        pattern: string - regular expression
+
+    Returns:
+        set of strings, or None if the pattern is too complex to analyse
+    """
+    try:
+        parsed = sre_parse.parse(pattern, re.I)
+    except re.error:
+        return None
+    samples = _parsed_samples(parsed)
+    if not samples or '' in samples:
+        # Patterns that can match an empty string interact with everything.
+        return None
+    return {sample.lower() for sample in samples}
+
+def _parsed_samples(items):
+    """
+    Recursive helper for _pattern_samples().
+
+    Params:
+        items: parsed regular expression items from sre_parse
+
+    Returns:
+        set of strings, or None if the pattern is too complex to analyse
+    """
+    samples = {''}
+    for op, av in items:
+        op = str(op)
+        if op == 'LITERAL':
+            options = {chr(av)}
+        elif op == 'IN':
+            options = set()
+            for set_op, set_av in av:
+                set_op = str(set_op)
+                if set_op == 'LITERAL':
+                    options.add(chr(set_av))
+                elif set_op == 'RANGE' and set_av[1] - set_av[0] < 64:
+                    options.update(chr(code) for code in range(set_av[0], set_av[1] + 1))
+                else:
+                    return None
+        elif op == 'BRANCH':
+            options = set()
+            for branch in av[1]:
+                branch_samples = _parsed_samples(branch)
+                if branch_samples is None:
+                    return None
+                options |= branch_samples
+        elif op == 'SUBPATTERN':
+            group, add_flags, del_flags, sub_pattern = av
+            if add_flags or del_flags:
+                return None
+            options = _parsed_samples(sub_pattern)
+        elif op in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            low, high, sub_pattern = av
+            repeated = _parsed_samples(sub_pattern)
+            if repeated is None:
+                return None
+            # A couple of extra repeats is enough to show how the repeated text lines up with other rules.
+            options = set()
+            for count in range(low, min(high, low + 2) + 1):
+                options.update(''.join(parts) for parts in itertools.product(repeated, repeat=count))
+        elif op in ('ASSERT', 'ASSERT_NOT'):
+            context = _parsed_samples(av[1])
+            if context is None:
+                return None
+            options = {''} | context
+        else:
+            # Anchors, word boundaries, wildcards, back references etc.
+            return None
+        if options is None:
+            return None
+        samples = {sample + option for sample in samples for option in options}
+        if len(samples) > _STYLE_SAMPLE_LIMIT:
+            return None
+    return samples
+
+def _has_leading_context(pattern):
+    """
+    Checks whether a pattern looks at text before the end of its match without replacing it, i.e. it has a lookbehind
+    or a lookahead anywhere except at the very end.
+
+    Params:
+        pattern: string - regular expression
+
+    Returns:
+        Boolean
+    """
+    lookarounds = len(re.findall(r'\(\?(?:=|!|<=|<!)', pattern))
+    if not lookarounds:
+        return False
+    try:
+        items = list(sre_parse.parse(pattern, re.I))
+    except re.error:
+        return True
+    op, av = items[-1]
+    trailing = str(op) in ('ASSERT', 'ASSERT_NOT') and av[0] == 1
+    return lookarounds > (1 if trailing else 0)
+
+def _strings_overlap(first, second):
+    """
+    Checks whether two strings could share characters if they appeared next to or inside each other in a text.
+
+    Params:
+        first: string
+        second: string
+
+    Returns:
+        Boolean
+    """
+    if first in second or second in first:
+        return True
+    for length in range(1, min(len(first), len(second))):
+        if first.endswith(second[:length]) or second.endswith(first[:length]):
+            return True
+    return False
+
+def _group_style_rules(rules):
+    """
+    Sorts style rules into groups which can each be applied in a single pass.
+
+    Each rule joins the earliest group it can without changing the result. It may be moved ahead of the rules in later
+    groups only if it doesn't conflict with them in either order, which means the two rules give the same result
+    whichever one is applied first.
+
+    Params:
+        rules: list of (pattern, replacement) tuples
+
+    Returns:
+        list of lists of _StyleRule
+    """
+    groups = []
+    for pattern, replacement in rules:
+        rule = _StyleRule(pattern, replacement)
+        target = len(groups)
+        for index in range(len(groups) - 1, -1, -1):
+            if any(other.conflicts_with(rule) for other in groups[index]):
+                break
+            target = index
+            if any(rule.conflicts_with(other) for other in groups[index]):
+                break
+        if target == len(groups):
+            groups.append([rule])
+        else:
+            groups[target].append(rule)
+    return groups
+
+def _compile_style_pass(group):
+    """
+    Compiles a group of style rules into (regex, replacement) passes for StyleRuleEngine.apply().
+
+    Params:
+        group: list of _StyleRule which don't conflict with each other
+
+    Returns:
+        list of (compiled regex, replacement string or function) tuples
+    """
+    if len(group) == 1:
+        return [(group[0].regex, group[0].replacement)]
+
+    replacements = {}
+    alternatives = []
+    first_chars = set()
+    for index, rule in enumerate(group):
+        name = '_rule{}'.format(index)
+        replacements[name] = rule.replacement
+        alternatives.append('(?P<{}>{})'.format(name, rule.pattern))
+        first_chars.update(sample[0] for sample in rule.samples)
+    # Starting with a lookahead for the possible first characters lets the regex engine skip quickly over positions
+    # where none of the rules can match, instead of trying every alternative at every position.
+    prefix = '(?=[{}])'.format(''.join(re.escape(char) for char in sorted(first_chars)))
+    try:
+        regex = re.compile('{}(?:{})'.format(prefix, '|'.join(alternatives)), re.I)
+    except re.error:
+        # e.g. clashing group names - the rules don't conflict, so they can still be run one after the other.
+        return [(rule.regex, rule.replacement) for rule in group]
+
+    def replace(match):
+        # The named group wrapping each rule is the last group to close, so it identifies which rule matched.
+        return replacements[match.lastgroup]
+
+    return [(regex, replace)]
+
+_style_engine = None
+
+def _get_style_engine():
+    """
+    Returns the StyleRuleEngine for config.STYLE_RULES, rebuilding it if the rules have changed.
+
+    Returns:
+        StyleRuleEngine
+    """
+    global _style_engine
+    if _style_engine is None or _style_engine.rules != config.STYLE_RULES:
+        _style_engine = StyleRuleEngine(config.STYLE_RULES)
+    return _style_engine
+
+# Functions timed when profiling is turned on (see profiling.py)
+PROFILED_FUNCTIONS = [
+    'get_saved_list', 'get_subject_summaries', 'import_class_list', 'import_school_roll', 'load', 'save', 'delete',
+    'export', 'export_many', 'import_comment_bank', 'restyle_subject', 'restyle_many', 'render_subject',
+    'render_students', 'do_placeholders', 'do_style', 'style_student_comment', 'compile_template', 'compile_subject',
+    'add_to_comment_library', 'get_library_comments', 'migrate_to_sqlite', 'convert_subjects', 'load_comment_bank',
+    'load_student', '_capitalise_sentences', '_load_json', '_save_snapshot', '_append_journal'
+]
+
+def main(argv=None):
+    """
+    Command line interface for importing, restyling and exporting subjects without the GUI, e.g.
+
+        python -m could_try_harder import classes/*.csv
+        python -m could_try_harder import-bank --from-subject 9ENG-A "9ENG-*"
+        python -m could_try_harder restyle "*"
+        python -m could_try_harder export "*" --output-dir reports --format csv
+
+    Subject arguments accept glob patterns matched against saved subjects.
+
+    Params:
+        argv: list of command line arguments, defaults to sys.argv[1:]
+
+    Returns:
+        int - exit status
+    """
+    parser = argparse.ArgumentParser(prog="could_try_harder", description="{} {}".format(config.APP_NAME, config.APP_VERSION))
+    parser.add_argument("--data-folder", help="folder containing saved subjects (default: {})".format(config.DATA_FOLDER))
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    list_parser = commands.add_parser("list", help="list saved subjects")
+    list_parser.add_argument("-l", "--long", action="store_true",
+        help="also show the number of students, completed reports and bank comments")
+    list_parser.set_defaults(handler=_cli_list)
+
+    import_parser = commands.add_parser("import", help="import csv class lists as new subjects")
+    import_parser.add_argument("csv_files", nargs="+", metavar="CSV", help="csv files or glob patterns")
+    import_parser.add_argument("--subject", help="subject name (only for a single csv file, default: the file name)")
+    import_parser.add_argument("--split-by", metavar="COLUMN",
+        help="create a subject for each value in this column (a heading, or a number counting from 1)")
+    import_parser.add_argument("--prefix", default="", help="added to the start of subject names made by --split-by")
+    import_parser.set_defaults(handler=_cli_import)
+
+    bank_parser = commands.add_parser("import-bank", help="copy a comment bank into subjects")
+    bank_source = bank_parser.add_mutually_exclusive_group(required=True)
+    bank_source.add_argument("--from-subject", help="saved subject to copy the comment bank from")
+    bank_source.add_argument("--from-file", help="text file with one comment per line")
+    bank_parser.add_argument("subjects", nargs="+", metavar="SUBJECT", help="subject names or glob patterns")
+    bank_parser.add_argument("--intro", action="store_true", help="also copy the intro comment (--from-subject only)")
+    bank_parser.add_argument("--merge", action="store_true", help="add to the existing comment banks instead of replacing them")
+    bank_parser.set_defaults(handler=_cli_import_bank)
+
+    restyle_parser = commands.add_parser("restyle", help="apply the style rules to saved subjects")
+    restyle_parser.add_argument("subjects", nargs="+", metavar="SUBJECT", help="subject names or glob patterns")
+    restyle_parser.add_argument("--dry-run", action="store_true", help="show what would change without saving anything")
+    restyle_parser.add_argument("--force", action="store_true",
+        help="restyle every comment, even in subjects already restyled with the current rules")
+    restyle_parser.add_argument("--jobs", type=int, help="number of worker processes (default: number of CPUs)")
+    restyle_parser.set_defaults(handler=_cli_restyle)
+
+    export_parser = commands.add_parser("export", help="export report comments")
+    export_parser.add_argument("subjects", nargs="+", metavar="SUBJECT", help="subject names or glob patterns")
+    export_parser.add_argument("--output-dir", default=".", help="folder to write exported files to (default: current folder)")
+    export_parser.add_argument("--format", default="txt", choices=sorted(EXPORT_FORMATS), help="export format (default: txt)")
+    export_parser.add_argument("--combined", help="also write every subject into this file")
+    export_parser.add_argument("--jobs", type=int, help="number of worker processes (default: number of CPUs)")
+    export_parser.set_defaults(handler=_cli_export)
+
+    prune_parser = commands.add_parser("prune-library", help="remove comments no subject uses from the comment library")
+    prune_parser.set_defaults(handler=_cli_prune_library)
+
+    migrate_parser = commands.add_parser("migrate-sqlite", help="copy json saved subjects into the SQLite database")
+    migrate_parser.add_argument("--overwrite", action="store_true", help="replace subjects already in the database")
+    migrate_parser.set_defaults(handler=_cli_migrate_sqlite)
+
+    convert_parser = commands.add_parser("convert", help="convert json saved subjects to the binary format, or back")
+    convert_parser.add_argument("--to", required=True, choices=["binary", "json"], help="format to convert to")
+    convert_parser.add_argument("--overwrite", action="store_true", help="replace subjects already saved in that format")
+    convert_parser.set_defaults(handler=_cli_convert)
+
+    args = parser.parse_args(argv)
+    if args.data_folder:
+        config.DATA_FOLDER = os.path.join(args.data_folder, '')
+    if profiling.enable():
+        profiling.instrument(sys.modules[__name__], PROFILED_FUNCTIONS, 'could_try_harder')
+    return args.handler(args)
+
+def _match_subjects(patterns):
+    """
+    Finds saved subjects matching command line arguments.
+
+    Params:
+        patterns: list of subject names or glob patterns
+
+    Returns:
+        list of strings - matching subject names
+    """
+    saved_list = sorted(get_saved_list())
+    subject_names = []
+    for pattern in patterns:
+        matches = fnmatch.filter(saved_list, pattern)
+        if not matches:
+            print("No saved subjects match: " + pattern)
+        subject_names.extend(matches)
+    return list(dict.fromkeys(subject_names))
+
+def _cli_list(args):
+    if not args.long:
+        for subject_name in sorted(get_saved_list()):
+            print(subject_name)
+        return 0
+    summaries = get_subject_summaries()
+    for subject_name in sorted(summaries):
+        summary = summaries[subject_name]
+        if summary['students'] is None:
+            print("{}  (could not be loaded)".format(subject_name))
+            continue
+        modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(summary['modified'])) if summary['modified'] else "-"
+        print("{}  {}/{} reports  {} bank comments  {}".format(
+            subject_name, summary['completed'], summary['students'], summary['comment_bank'], modified))
+    return 0
+
+def _cli_import(args):
+    filenames = []
+    for pattern in args.csv_files:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            print("No files match: " + pattern)
+        filenames.extend(matches)
+    if args.subject and len(filenames) != 1:
+        print("--subject can only be used with a single csv file.")
+        return 2
+    if args.subject and args.split_by:
+        print("--subject can't be used with --split-by.")
+        return 2
+    failed = 0
+    for filename in filenames:
+        report = ImportReport(filename)
+        if args.split_by:
+            split_by = int(args.split_by) if args.split_by.isdigit() else args.split_by
+            subject_names = import_school_roll(filename, split_by, args.prefix, report)
+            if subject_names:
+                print("Imported {} as {}".format(filename, ", ".join(subject_names)))
+        else:
+            subject_name = args.subject or os.path.splitext(os.path.basename(filename))[0]
+            subject_names = [clean_subject_name(subject_name)] if import_class_list(filename, subject_name, report) else []
+            if subject_names:
+                print("Imported {} as {}".format(filename, subject_names[0]))
+        if not subject_names:
+            print("Import failed: " + filename)
+            failed += 1
+        elif report.problems:
+            print(report)
+    return 1 if failed or not filenames else 0
+
+def _cli_import_bank(args):
+    intro_comment = None
+    if args.from_subject:
+        source = load(args.from_subject)
+        if not source:
+            return 1
+        comment_bank = source['comment_bank']
+        if args.intro:
+            intro_comment = source['intro_comment']
+    else:
+        try:
+            with open(args.from_file, encoding='utf-8') as bank_in:
+                comment_bank = [do_style(line.strip()) for line in bank_in if line.strip()]
+        except Exception as err:
+            print(err)
+            return 1
+    failed = 0
+    subject_names = _match_subjects(args.subjects)
+    for subject_name in subject_names:
+        if subject_name == args.from_subject:
+            continue
+        subject = load(subject_name)
+        if subject and save(import_comment_bank(subject, comment_bank, intro_comment, args.merge)):
+            print("Updated comment bank for " + subject_name)
+        else:
+            print("Failed to update " + subject_name)
+            failed += 1
+    return 1 if failed or not subject_names else 0
+
+def _cli_restyle(args):
+    subject_names = _match_subjects(args.subjects)
+    if not subject_names:
+        return 1
+
+    def show_progress(result, done, total):
+        if not result['success']:
+            print("[{}/{}] {} FAILED: {}".format(done, total, result['subject_name'], result['error']))
+        elif args.dry_run:
+            if result['diff']:
+                print(result['diff'])
+            print("{}: {} comments would be restyled".format(result['subject_name'], result['changed']))
+        elif result['fields']:
+            print("{}: {} comments restyled".format(result['subject_name'], result['changed']))
+        else:
+            print("{}: already up to date".format(result['subject_name']))
+
+    results = restyle_many(subject_names, args.dry_run, args.force, args.jobs, show_progress)
+    return 0 if all(result['success'] for result in results) else 1
+
+def _cli_export(args):
+    subject_names = _match_subjects(args.subjects)
+    if not subject_names:
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    def show_progress(result, done, total):
+        if result['success']:
+            print("[{}/{}] {} -> {} ({:.2f}s)".format(done, total, result['subject_name'], result['filename'], result['seconds']))
+        else:
+            print("[{}/{}] {} FAILED: {}".format(done, total, result['subject_name'], result['error']))
+
+    results = export_many(subject_names, args.output_dir, args.format, args.combined, args.jobs, show_progress)
+    return 0 if all(result['success'] for result in results) else 1
+
+def _cli_prune_library(args):
+    print("{} unused comments removed from the comment library".format(prune_comment_library()))
+    return 0
+
+def _cli_migrate_sqlite(args):
+    migrated = migrate_to_sqlite(args.overwrite)
+    for subject_name in migrated:
+        print("Copied " + subject_name)
+    print("{} subjects copied to {}".format(len(migrated), sqlite_storage.get_database_filename()))
+    return 0
+
+def _cli_convert(args):
+    converted = convert_subjects(args.to, args.overwrite)
+    for subject_name in converted:
+        print("Converted " + subject_name)
+    print("{} subjects converted to {}".format(len(converted), args.to))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
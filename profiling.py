@@ -0,0 +1,292 @@
+# Could Try Harder - Simple report comment builder for teachers.
+# Copyright (C) 2020 Evan M. Sanders
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Opt-in instrumentation for finding out what is slow on a real machine. Turn
+# it on with config.PROFILE or the COULD_TRY_HARDER_PROFILE environment
+# variable, e.g.
+#
+#   COULD_TRY_HARDER_PROFILE=calls,cprofile python app.py
+#
+# and when the app exits the results are saved to config.PROFILE_FILE (or
+# COULD_TRY_HARDER_PROFILE_FILE). Print a summary with:
+#
+#   python profiling.py report could-try-harder-profile.json
+
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import functools
+import threading
+import config
+
+# What can be turned on:
+#   'calls' - call counts and latency histograms for instrumented functions
+#   'cprofile' - cProfile of the whole session, saved next to the results as .prof
+#   'tracemalloc' - the lines that allocated the most memory still in use at exit
+PROFILE_MODES = ('calls', 'cprofile', 'tracemalloc')
+
+# Latency histogram buckets: bucket n holds calls taking less than 2**n microseconds (and at least 2**(n-1)).
+_BUCKETS = 32
+
+_stats = {}
+_stats_lock = threading.Lock()
+_modes = set()
+_profiler = None
+_started = None
+
+def get_modes():
+    """
+    Works out what to turn on from the environment or config.PROFILE.
+
+    Returns:
+        set of strings from PROFILE_MODES
+    """
+    setting = os.environ.get('COULD_TRY_HARDER_PROFILE', config.PROFILE) or ""
+    if isinstance(setting, str):
+        setting = [mode.strip().lower() for mode in setting.split(",")]
+    modes = set()
+    for mode in setting:
+        if mode in ('1', 'yes', 'true', 'on'):
+            modes.add('calls')
+        elif mode == 'all':
+            modes.update(PROFILE_MODES)
+        elif mode in PROFILE_MODES:
+            modes.add(mode)
+        elif mode:
+            print("Unknown profile mode: " + mode)
+    return modes
+
+def is_enabled():
+    return bool(_modes)
+
+def enable(modes=None):
+    """
+    Starts profiling, saving the results when the program exits. Does nothing if no modes are turned on.
+
+    Params:
+        modes: set of strings from PROFILE_MODES, or None to use get_modes()
+
+    Returns:
+        Boolean - True if anything was turned on
+    """
+    global _profiler, _started
+    if _modes:
+        return True
+    _modes.update(get_modes() if modes is None else modes)
+    if not _modes:
+        return False
+    _started = time.time()
+    if 'tracemalloc' in _modes:
+        import tracemalloc
+        tracemalloc.start()
+    if 'cprofile' in _modes:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(dump)
+    return True
+
+def instrument(owner, names, prefix=None):
+    """
+    Wraps functions of a module, or methods of a class, to count their calls and time them. Does nothing unless
+    'calls' profiling is turned on.
+
+    Functions in a module are looked up each time they are called, so calls from inside the module are counted too.
+    Methods of a class must be instrumented before any signals are connected to them.
+
+    Params:
+        owner: module or class
+        names: list of attribute names
+        prefix: string to put before the names in the results, or None to use the module or class name
+    """
+    if 'calls' not in _modes:
+        return
+    if prefix is None:
+        prefix = owner.__name__
+    for name in names:
+        function = getattr(owner, name)
+        if getattr(function, '_profiled', False):
+            continue
+        setattr(owner, name, _timed(function, prefix + "." + name))
+
+def _timed(function, name):
+    """
+    Returns:
+        function - calls function, recording how long it takes under name
+    """
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter() - started)
+    timed._profiled = True
+    return timed
+
+def record(name, seconds):
+    """
+    Records one call taking seconds.
+    """
+    bucket = min(int(seconds * 1e6).bit_length(), _BUCKETS - 1)
+    with _stats_lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = {"calls": 0, "total": 0.0, "max": 0.0, "histogram": [0] * _BUCKETS}
+        stats['calls'] += 1
+        stats['total'] += seconds
+        if seconds > stats['max']:
+            stats['max'] = seconds
+        stats['histogram'][bucket] += 1
+
+def get_filename():
+    """
+    Returns:
+        string - where the results are saved
+    """
+    return os.environ.get('COULD_TRY_HARDER_PROFILE_FILE', config.PROFILE_FILE)
+
+def dump(filename=None):
+    """
+    Saves the results so far. Called automatically when the program exits.
+
+    Params:
+        filename: string or None to use get_filename()
+    """
+    if filename is None:
+        filename = get_filename()
+    results = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_started)) if _started else None,
+        "seconds": time.time() - _started if _started else None,
+        "app_version": config.APP_VERSION,
+        "argv": sys.argv,
+        "modes": sorted(_modes)
+    }
+    with _stats_lock:
+        results['calls'] = {name: dict(stats, histogram=list(stats['histogram'])) for name, stats in _stats.items()}
+
+    if 'tracemalloc' in _modes:
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            results['memory'] = {
+                "current": current,
+                "peak": peak,
+                "top": [{"line": str(stat.traceback), "size": stat.size, "count": stat.count}
+                        for stat in snapshot.statistics('lineno')[:25]]
+            }
+
+    try:
+        if _profiler is not None:
+            _profiler.disable()
+            results['cprofile'] = os.path.splitext(filename)[0] + ".prof"
+            _profiler.dump_stats(results['cprofile'])
+            _profiler.enable()
+        with open(filename, 'w') as results_out:
+            json.dump(results, results_out, indent=4)
+    except Exception as err:
+        # TODO better error handling here
+        print(err)
+
+def percentile(histogram, fraction):
+    """
+    Estimates a percentile from a latency histogram.
+
+    Params:
+        histogram: list of call counts per bucket
+        fraction: float between 0 and 1
+
+    Returns:
+        float - seconds, the upper edge of the bucket the percentile falls in
+    """
+    target = fraction * sum(histogram)
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if count and seen >= target:
+            return (1 << bucket) / 1e6
+    return 0.0
+
+def report(results, limit=None, sort='total'):
+    """
+    Prints the call counts and latencies saved by dump().
+
+    Params:
+        results: dict loaded from the results file
+        limit: int or None - most functions to show
+        sort: 'total', 'calls', 'mean' or 'max'
+    """
+    print("Profile from {} ({:.0f} s, modes: {})".format(
+        results.get('started'), results.get('seconds') or 0, ", ".join(results.get('modes', []))))
+    calls = results.get('calls', {})
+    if calls:
+        print()
+        print("{:<48}{:>8}{:>11}{:>11}{:>11}{:>11}{:>11}".format("Function", "Calls", "Total", "Mean", "p50", "p95", "Max"))
+        keys = {
+            "total": lambda name: calls[name]['total'],
+            "calls": lambda name: calls[name]['calls'],
+            "mean": lambda name: calls[name]['total'] / calls[name]['calls'],
+            "max": lambda name: calls[name]['max']
+        }
+        for name in sorted(calls, key=keys[sort], reverse=True)[:limit]:
+            stats = calls[name]
+            print("{:<48}{:>8}{:>11}{:>11}{:>11}{:>11}{:>11}".format(
+                name, stats['calls'], _format_seconds(stats['total']), _format_seconds(stats['total'] / stats['calls']),
+                "<" + _format_seconds(percentile(stats['histogram'], 0.5)),
+                "<" + _format_seconds(percentile(stats['histogram'], 0.95)), _format_seconds(stats['max'])))
+    memory = results.get('memory')
+    if memory:
+        print()
+        print("Memory: {:.1f} MB in use at exit, {:.1f} MB peak".format(memory['current'] / 1e6, memory['peak'] / 1e6))
+        for stat in memory['top'][:limit or 10]:
+            print("  {:>10.1f} KB  {}".format(stat['size'] / 1e3, stat['line']))
+    if results.get('cprofile'):
+        print()
+        print("cProfile saved to {} (python -m pstats {})".format(results['cprofile'], results['cprofile']))
+
+def _format_seconds(seconds):
+    if seconds >= 1:
+        return "{:.2f} s".format(seconds)
+    if seconds >= 0.9995e-3:
+        return "{:.1f} ms".format(seconds * 1e3)
+    return "{:.0f} us".format(seconds * 1e6)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show profiling results saved by Could Try Harder.")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+    report_parser = commands.add_parser("report", help="summarise a results file")
+    report_parser.add_argument("filename", nargs="?", help="results file (default: {})".format(config.PROFILE_FILE))
+    report_parser.add_argument("--limit", type=int, help="most functions to show")
+    report_parser.add_argument("--sort", choices=["total", "calls", "mean", "max"], default="total")
+    args = parser.parse_args(argv)
+
+    filename = args.filename or get_filename()
+    try:
+        with open(filename, 'r') as results_in:
+            results = json.load(results_in)
+    except Exception as err:
+        print(err)
+        return 1
+    report(results, args.limit, args.sort)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
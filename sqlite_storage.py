@@ -0,0 +1,319 @@
+# Could Try Harder - Simple report comment builder for teachers.
+# Copyright (C) 2020 Evan M. Sanders
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# SQLite storage backend, used by could_try_harder when config.STORAGE_BACKEND
+# is 'sqlite'. Subjects are stored in one database file in config.DATA_FOLDER,
+# with tables for subjects, students, comment banks and student comments.
+# Whole subjects load and save the same way as with json files, and single
+# students or comment banks can also be read without loading the whole subject.
+
+import time
+import json
+import sqlite3
+import threading
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subjects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    intro_comment TEXT NOT NULL DEFAULT '',
+    -- Any other subject keys, as json
+    extra TEXT NOT NULL DEFAULT '{}',
+    -- Seconds since the epoch
+    modified REAL
+);
+
+CREATE TABLE IF NOT EXISTS students (
+    id INTEGER PRIMARY KEY,
+    subject_id INTEGER NOT NULL REFERENCES subjects(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    gender TEXT NOT NULL DEFAULT '',
+    -- json list
+    pronouns TEXT NOT NULL,
+    -- Any other student keys, as json
+    extra TEXT NOT NULL DEFAULT '{}',
+    UNIQUE (subject_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS comment_banks (
+    subject_id INTEGER NOT NULL REFERENCES subjects(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    comment TEXT NOT NULL,
+    PRIMARY KEY (subject_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS comments (
+    student_id INTEGER PRIMARY KEY REFERENCES students(id) ON DELETE CASCADE,
+    comment TEXT NOT NULL
+);
+"""
+
+# Student keys with their own columns (or table, for the comment)
+_STUDENT_COLUMNS = ('first_name', 'last_name', 'gender', 'pronouns', 'comment')
+
+# Subject keys with their own columns or tables
+_SUBJECT_COLUMNS = ('subject_name', 'intro_comment', 'comment_bank', 'students')
+
+# SQLite connections can't be shared between threads, so each thread gets its
+# own connection to each database file.
+_connections = threading.local()
+
+def get_database_filename():
+    """
+    Returns:
+        string - path of the database file in config.DATA_FOLDER
+    """
+    return config.DATA_FOLDER + config.SQLITE_FILENAME
+
+def connect():
+    """
+    Gets this thread's connection to the database, creating the database if needed.
+
+    Returns:
+        sqlite3.Connection
+    """
+    filename = get_database_filename()
+    connections = getattr(_connections, 'by_filename', None)
+    if connections is None:
+        connections = _connections.by_filename = {}
+    connection = connections.get(filename)
+    if connection is None:
+        connection = sqlite3.connect(filename, timeout=30)
+        connection.row_factory = sqlite3.Row
+        # Write-ahead logging lets readers carry on while another process is saving.
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.executescript(SCHEMA)
+        _upgrade(connection)
+        connections[filename] = connection
+    return connection
+
+def _upgrade(connection):
+    """
+    Adds columns missing from databases created by earlier versions.
+
+    Params:
+        connection: sqlite3.Connection
+    """
+    columns = [row['name'] for row in connection.execute("PRAGMA table_info(subjects)")]
+    if 'modified' not in columns:
+        with connection:
+            connection.execute("ALTER TABLE subjects ADD COLUMN modified REAL")
+
+def close():
+    """
+    Closes this thread's database connections.
+    """
+    connections = getattr(_connections, 'by_filename', {})
+    for connection in connections.values():
+        connection.close()
+    connections.clear()
+
+def get_saved_list():
+    """
+    Returns:
+        list of strings - names of the saved subjects
+    """
+    return [row['name'] for row in connect().execute("SELECT name FROM subjects ORDER BY name")]
+
+def get_summaries():
+    """
+    Counts the students, comment bank and completed report comments in every subject.
+
+    Returns:
+        dict of subject name: dict in the form returned by could_try_harder.get_subject_summaries
+    """
+    rows = connect().execute(
+        "SELECT name, modified, "
+        "(SELECT COUNT(*) FROM students WHERE subject_id = subjects.id) AS students, "
+        "(SELECT COUNT(*) FROM comment_banks WHERE subject_id = subjects.id) AS comment_bank, "
+        "(SELECT COUNT(*) FROM students JOIN comments ON comments.student_id = students.id "
+        "WHERE subject_id = subjects.id AND TRIM(comments.comment) != '') AS completed "
+        "FROM subjects ORDER BY name")
+    return {row['name']: {
+        "students": row['students'],
+        "comment_bank": row['comment_bank'],
+        "completed": row['completed'],
+        "modified": row['modified'],
+        "size": None
+    } for row in rows}
+
+def load(subject_name):
+    """
+    Loads a whole subject.
+
+    Params:
+        subject_name: string
+
+    Returns:
+        dict in the same form as a json save file, or an empty dict if there is no such subject
+    """
+    connection = connect()
+    row = connection.execute("SELECT * FROM subjects WHERE name = ?", (subject_name,)).fetchone()
+    if row is None:
+        return {}
+    subject = {
+        "subject_name": row['name'],
+        "intro_comment": row['intro_comment'],
+        "comment_bank": [bank_row['comment'] for bank_row in connection.execute(
+            "SELECT comment FROM comment_banks WHERE subject_id = ? ORDER BY position", (row['id'],))],
+        "students": [_student_from_row(student_row) for student_row in connection.execute(
+            "SELECT students.*, comments.comment FROM students LEFT JOIN comments ON comments.student_id = students.id "
+            "WHERE subject_id = ? ORDER BY position", (row['id'],))]
+    }
+    subject.update(json.loads(row['extra']))
+    return subject
+
+def save(subject):
+    """
+    Saves a whole subject, only writing the rows which have changed.
+
+    Params:
+        subject: dict
+    """
+    connection = connect()
+    with connection:
+        extra = json.dumps({key: value for key, value in subject.items() if key not in _SUBJECT_COLUMNS})
+        row = connection.execute("SELECT id FROM subjects WHERE name = ?", (subject['subject_name'],)).fetchone()
+        if row is None:
+            subject_id = connection.execute(
+                "INSERT INTO subjects (name, intro_comment, extra, modified) VALUES (?, ?, ?, ?)",
+                (subject['subject_name'], subject['intro_comment'], extra, time.time())).lastrowid
+        else:
+            subject_id = row['id']
+            connection.execute(
+                "UPDATE subjects SET intro_comment = ?, extra = ?, modified = ? WHERE id = ?",
+                (subject['intro_comment'], extra, time.time(), subject_id))
+
+        # Comment bank
+        saved_bank = [bank_row['comment'] for bank_row in connection.execute(
+            "SELECT comment FROM comment_banks WHERE subject_id = ? ORDER BY position", (subject_id,))]
+        if saved_bank != subject['comment_bank']:
+            connection.execute("DELETE FROM comment_banks WHERE subject_id = ?", (subject_id,))
+            connection.executemany(
+                "INSERT INTO comment_banks (subject_id, position, comment) VALUES (?, ?, ?)",
+                [(subject_id, position, comment) for position, comment in enumerate(subject['comment_bank'])])
+
+        # Students
+        saved_students = {student_row['position']: student_row for student_row in connection.execute(
+            "SELECT students.*, comments.comment FROM students LEFT JOIN comments ON comments.student_id = students.id "
+            "WHERE subject_id = ?", (subject_id,))}
+        for position, student in enumerate(subject['students']):
+            saved = saved_students.get(position)
+            values = _student_values(student)
+            if saved is None:
+                student_id = connection.execute(
+                    "INSERT INTO students (subject_id, position, first_name, last_name, gender, pronouns, extra) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", (subject_id, position) + values).lastrowid
+            else:
+                student_id = saved['id']
+                if tuple(saved[column] for column in ('first_name', 'last_name', 'gender', 'pronouns', 'extra')) != values:
+                    connection.execute(
+                        "UPDATE students SET first_name = ?, last_name = ?, gender = ?, pronouns = ?, extra = ? "
+                        "WHERE id = ?", values + (student_id,))
+                if saved['comment'] == student.get('comment', ""):
+                    continue
+            connection.execute(
+                "INSERT OR REPLACE INTO comments (student_id, comment) VALUES (?, ?)",
+                (student_id, student.get('comment', "")))
+        connection.execute(
+            "DELETE FROM students WHERE subject_id = ? AND position >= ?", (subject_id, len(subject['students'])))
+
+def delete(subject_name):
+    """
+    Deletes a subject and everything in it.
+
+    Params:
+        subject_name: string
+
+    Returns:
+        Boolean - False if there was no such subject
+    """
+    connection = connect()
+    with connection:
+        return connection.execute("DELETE FROM subjects WHERE name = ?", (subject_name,)).rowcount > 0
+
+def load_student(subject_name, index):
+    """
+    Loads a single student without loading the rest of the subject.
+
+    Params:
+        subject_name: string
+        index: int - position of the student in the subject
+
+    Returns:
+        dict, or None if there is no such student
+    """
+    row = connect().execute(
+        "SELECT students.*, comments.comment FROM students JOIN subjects ON subjects.id = students.subject_id "
+        "LEFT JOIN comments ON comments.student_id = students.id WHERE subjects.name = ? AND students.position = ?",
+        (subject_name, index)).fetchone()
+    if row is None:
+        return None
+    return _student_from_row(row)
+
+def load_comment_bank(subject_name):
+    """
+    Loads a subject's comment bank without loading the rest of the subject.
+
+    Params:
+        subject_name: string
+
+    Returns:
+        list of strings, or None if there is no such subject
+    """
+    connection = connect()
+    row = connection.execute("SELECT id FROM subjects WHERE name = ?", (subject_name,)).fetchone()
+    if row is None:
+        return None
+    return [bank_row['comment'] for bank_row in connection.execute(
+        "SELECT comment FROM comment_banks WHERE subject_id = ? ORDER BY position", (row['id'],))]
+
+def _student_from_row(row):
+    """
+    Params:
+        row: sqlite3.Row from the students table joined with comments
+
+    Returns:
+        dict in the same form as a student in a json save file
+    """
+    student = {
+        "first_name": row['first_name'],
+        "last_name": row['last_name'],
+        "gender": row['gender'],
+        "pronouns": json.loads(row['pronouns']),
+        "comment": row['comment'] or ""
+    }
+    student.update(json.loads(row['extra']))
+    return student
+
+def _student_values(student):
+    """
+    Params:
+        student: dict
+
+    Returns:
+        tuple of values for the first_name, last_name, gender, pronouns and extra columns
+    """
+    return (
+        student['first_name'],
+        student['last_name'],
+        student.get('gender', ""),
+        json.dumps(list(student['pronouns'])),
+        json.dumps({key: value for key, value in student.items() if key not in _STUDENT_COLUMNS}))
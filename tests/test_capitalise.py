@@ -0,0 +1,61 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import could_try_harder
+
+try:
+    import textblob
+except ImportError:
+    textblob = None
+
+class CapitaliseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.capitaliser = config.SENTENCE_CAPITALISER
+        config.SENTENCE_CAPITALISER = 'builtin'
+
+    def tearDown(self):
+        config.SENTENCE_CAPITALISER = self.capitaliser
+
+    def capitalise(self, text):
+        return could_try_harder._capitalise_sentences(text)
+
+    def test_sentences(self):
+        self.assertEqual(self.capitalise("good work. keep it up! well done? yes."),
+                         "Good work. Keep it up! Well done? Yes.")
+
+    def test_grade_letters(self):
+        self.assertEqual(self.capitalise("she got an A. she should be proud."), "She got an A. She should be proud.")
+        self.assertEqual(self.capitalise("grade: B. needs work."), "Grade: B. Needs work.")
+
+    def test_initials(self):
+        self.assertEqual(self.capitalise("read J. R. R. Tolkien. then rest."), "Read J. R. R. Tolkien. Then rest.")
+
+    def test_abbreviations(self):
+        self.assertEqual(self.capitalise("ask mr. smith, e.g. today. then go."), "Ask mr. smith, e.g. today. Then go.")
+
+    def test_quotes_and_brackets(self):
+        self.assertEqual(self.capitalise('she said "well done." (and again.) "yes."'),
+                         'She said "well done." (And again.) "Yes."')
+
+    def test_whitespace_kept(self):
+        self.assertEqual(self.capitalise("one.\n\ntwo.  three."), "One.\n\nTwo.  Three.")
+
+    def test_line_break_without_stop(self):
+        # A line break on its own doesn't end a sentence
+        self.assertEqual(self.capitalise("first line\nsecond line."), "First line\nsecond line.")
+
+    @unittest.skipUnless(textblob, "TextBlob isn't installed")
+    def test_same_as_textblob(self):
+        for text in ["good work. keep it up!", "she tried hard. well done? yes."]:
+            builtin = self.capitalise(text)
+            config.SENTENCE_CAPITALISER = 'textblob'
+            self.assertEqual(self.capitalise(text), builtin)
+            config.SENTENCE_CAPITALISER = 'builtin'
+
+if __name__ == '__main__':
+    unittest.main()
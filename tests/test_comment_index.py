@@ -0,0 +1,73 @@
+import os
+import sys
+import random
+import unittest
+import collections
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import could_try_harder
+
+WORDS = ["work", "worked", "working", "hard", "har", "homework", "<name>", "<sp>", "isn't", "is", "a", "an", "w", "wo",
+         "Work", "well", "done!", "h"]
+
+def search_every_comment(comments, text, limit=None):
+    """
+    What CommentIndex.search() should return, worked out by checking every comment.
+    """
+    query = could_try_harder._comment_words(text)
+    if not query:
+        return list(range(len(comments)))[:limit]
+    ranked = []
+    for row, comment in enumerate(comments):
+        counts = collections.Counter(could_try_harder._comment_words(comment))
+        score = 0
+        for position, word in enumerate(query):
+            matches = counts[word] * 2
+            if position == len(query) - 1:
+                matches += sum(count for other, count in counts.items() if other.startswith(word) and other != word)
+            if not matches:
+                break
+            score += matches
+        else:
+            ranked.append((-score, row))
+    return [row for score, row in sorted(ranked)[:limit]]
+
+class CommentIndexTest(unittest.TestCase):
+
+    def test_examples(self):
+        comments = ["<name> worked hard.", "<name> works hard at homework.", "Hard work isn't everything.", "Well done!"]
+        index = could_try_harder.CommentIndex(comments)
+        self.assertEqual(index.search("hard"), [0, 1, 2])
+        self.assertEqual(index.search("work"), [2, 0, 1])
+        self.assertEqual(index.search("hard wor"), [0, 1, 2])
+        self.assertEqual(index.search("isn't"), [2])
+        self.assertEqual(index.search("name"), [])
+        self.assertEqual(index.search("  "), [0, 1, 2, 3])
+        self.assertEqual(index.search("w", limit=2), [0, 1])
+
+    def test_random_changes(self):
+        rng = random.Random(5)
+        comments = []
+        index = could_try_harder.CommentIndex()
+        for i in range(1500):
+            comment = " ".join(rng.choice(WORDS) for j in range(rng.randint(0, 6)))
+            change = rng.random()
+            if change < 0.4 or not comments:
+                comments.append(comment)
+                index.add(comment)
+            elif change < 0.7:
+                row = rng.randrange(len(comments))
+                comments[row] = comment
+                index.update(row, comment)
+            else:
+                row = rng.randrange(len(comments))
+                del comments[row]
+                index.remove(row)
+            self.assertEqual(len(index), len(comments))
+            text = " ".join(rng.choice(WORDS) for j in range(rng.randint(0, 3)))
+            limit = rng.choice([None, 1, 5])
+            self.assertEqual(index.search(text, limit), search_every_comment(comments, text, limit), text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import could_try_harder
+
+def make_subject(subject_name, comment_bank):
+    return {
+        "subject_name": subject_name,
+        "intro_comment": "",
+        "comment_bank": comment_bank,
+        "students": [could_try_harder.Student({"first_name": "Jo", "last_name": "Bloggs", "gender": "female",
+                                               "pronouns": config.PRONOUNS['female'], "comment": ""})]
+    }
+
+class CommentLibraryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp() + os.sep
+        self.settings = {name: getattr(config, name)
+                         for name in ('DATA_FOLDER', 'STORAGE_MODE', 'STORAGE_BACKEND', 'COMMENT_LIBRARY')}
+        config.DATA_FOLDER = self.folder
+        config.STORAGE_MODE = 'snapshot'
+        config.STORAGE_BACKEND = 'json'
+        config.COMMENT_LIBRARY = True
+        self.library_filename = self.folder + config.COMMENT_LIBRARY_FILENAME
+
+    def tearDown(self):
+        could_try_harder._comment_libraries.pop(self.library_filename, None)
+        for name, value in self.settings.items():
+            setattr(config, name, value)
+        shutil.rmtree(self.folder)
+
+    def read_library(self):
+        with open(self.library_filename, encoding='utf-8') as library_in:
+            return [json.loads(line) for line in library_in]
+
+    def test_ids(self):
+        comment_id = could_try_harder.get_comment_id("Good work.")
+        self.assertEqual(could_try_harder.get_comment_id("  Good \n work. "), comment_id)
+        self.assertEqual(could_try_harder.get_comment_id("Cafe\u0301"), could_try_harder.get_comment_id("Caf\u00e9"))
+        self.assertNotEqual(could_try_harder.get_comment_id("good work."), comment_id)
+
+    def test_round_trip(self):
+        comment_bank = ["<name> worked hard.", "Keep  it up!\n", "Zoë's work.", ""]
+        self.assertTrue(could_try_harder.save(make_subject("9A", comment_bank)))
+        could_try_harder._comment_libraries.clear()
+        self.assertEqual(could_try_harder.load('9A')['comment_bank'], comment_bank)
+        with open(self.folder + "9A.json") as json_in:
+            self.assertNotIn('comment_bank', json.load(json_in))
+
+    def test_shared_between_subjects(self):
+        self.assertTrue(could_try_harder.save(make_subject("9A", ["Good work.", "Well done."])))
+        self.assertTrue(could_try_harder.save(make_subject("9B", ["Well  done.", "Try harder."])))
+        self.assertEqual([entry['text'] for entry in self.read_library()], ["Good work.", "Well done.", "Try harder."])
+        # Copies differing in spacing get the first copy's text
+        self.assertEqual(could_try_harder.load('9B')['comment_bank'], ["Well done.", "Try harder."])
+
+    def test_missing_comment(self):
+        self.assertTrue(could_try_harder.save(make_subject("9A", ["Good work."])))
+        with self.assertRaises(LookupError):
+            could_try_harder.get_library_comments([could_try_harder.get_comment_id("Not saved.")])
+        os.remove(self.library_filename)
+        could_try_harder._comment_libraries.clear()
+        self.assertEqual(could_try_harder.load('9A'), {})
+
+    def test_line_cut_short(self):
+        self.assertTrue(could_try_harder.save(make_subject("9A", ["Good work."])))
+        with open(self.library_filename, 'ab') as library_out:
+            library_out.write(b'{"id": "12')
+        could_try_harder._comment_libraries.clear()
+        self.assertTrue(could_try_harder.save(make_subject("9B", ["Try harder."])))
+        could_try_harder._comment_libraries.clear()
+        self.assertEqual(could_try_harder.load('9B')['comment_bank'], ["Try harder."])
+
+    def test_prune(self):
+        self.assertTrue(could_try_harder.save(make_subject("9A", ["Good work.", "Well done."])))
+        self.assertTrue(could_try_harder.save(make_subject("9A", ["Good work."])))
+        self.assertEqual(could_try_harder.prune_comment_library(), 1)
+        self.assertEqual([entry['text'] for entry in self.read_library()], ["Good work."])
+        self.assertEqual(could_try_harder.load('9A')['comment_bank'], ["Good work."])
+        self.assertEqual(could_try_harder.prune_comment_library(), 0)
+
+    def test_prune_with_broken_subject(self):
+        self.assertTrue(could_try_harder.save(make_subject("9A", ["Good work."])))
+        with open(self.folder + "9B.json", 'w') as json_out:
+            json_out.write("{")
+        self.assertEqual(could_try_harder.prune_comment_library(), 0)
+        self.assertEqual([entry['text'] for entry in self.read_library()], ["Good work."])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import could_try_harder
+
+ROWS = ["Ann;Lee;Female", "Ben;Ng;Male", "Cat;Roe;Female", "Dan;Oh;Male", "Eve;Yu;Female"]
+
+class CsvTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def read(self, data):
+        filename = os.path.join(self.folder, "class.csv")
+        with open(filename, 'wb') as csv_out:
+            csv_out.write(data)
+        report = could_try_harder.ImportReport(filename)
+        students = [student for group, student in could_try_harder.read_class_list(filename, report)]
+        return students, report
+
+class DelimiterTest(CsvTest):
+
+    def test_ragged_row(self):
+        students, report = self.read("\n".join(ROWS + ["Al;Bo"]).encode('utf-8'))
+        self.assertEqual(report.delimiter, ';')
+        self.assertEqual([student['first_name'] for student in students], ["Ann", "Ben", "Cat", "Dan", "Eve"])
+        self.assertEqual(report.rows, 6)
+        self.assertEqual([line for line, message in report.problems], [6])
+
+    def test_extra_column(self):
+        students, report = self.read("\n".join(ROWS + ["Bob;Smith;Male;9A;extra"]).encode('utf-8'))
+        self.assertEqual(report.delimiter, ';')
+        self.assertEqual(len(students), 6)
+        self.assertEqual(students[-1]['last_name'], "Smith")
+
+    def test_ragged_row_with_bom(self):
+        students, report = self.read(b'\xef\xbb\xbf' + "\r\n".join(ROWS + ["Al;Bo", "Zoë;Kim;Female"]).encode('utf-8'))
+        self.assertEqual(report.encoding, 'utf-8-sig')
+        self.assertEqual(report.delimiter, ';')
+        self.assertEqual(len(students), 6)
+        self.assertEqual(students[0]['first_name'], "Ann")
+        self.assertEqual(students[-1]['first_name'], "Zoë")
+
+    def test_quoted_delimiters_in_first_line(self):
+        students, report = self.read(b'"Lee, Ann";Lee;Female\n' + "\n".join(ROWS[1:] + ["Al;Bo"]).encode('utf-8'))
+        self.assertEqual(report.delimiter, ';')
+        self.assertEqual(students[0]['first_name'], "Lee, Ann")
+
+    def test_other_delimiters(self):
+        students, report = self.read(b"Ann\tLee\tF\nBen\tNg\tM\n")
+        self.assertEqual(report.delimiter, '\t')
+        self.assertEqual(len(students), 2)
+        students, report = self.read(b"Ann|Lee|F\nBen|Ng|M\n")
+        self.assertEqual(report.delimiter, '|')
+        self.assertEqual(len(students), 2)
+
+class EncodingTest(CsvTest):
+
+    def names(self, data):
+        students, report = self.read(data)
+        return [student['first_name'] for student in students], report.encoding
+
+    def test_utf8(self):
+        self.assertEqual(self.names("Zoë,Roe,F\n".encode('utf-8')), (["Zoë"], 'utf-8'))
+
+    def test_cp1252(self):
+        self.assertEqual(self.names("Zoë,Roe,F\n".encode('cp1252')), (["Zoë"], 'cp1252'))
+
+    def test_utf16(self):
+        self.assertEqual(self.names("Zoë,Roe,F\n".encode('utf-16')), (["Zoë"], 'utf-16'))
+
+    def test_cp1252_after_sample(self):
+        rows = "".join("Ann{},Lee,F\n".format(i) for i in range(5000)).encode('utf-8')
+        self.assertGreater(len(rows), could_try_harder._CSV_SAMPLE_SIZE)
+        names, encoding = self.names(rows + "Zoë,Roe,F\n".encode('cp1252'))
+        self.assertEqual(encoding, 'utf-8')
+        self.assertEqual(len(names), 5001)
+        self.assertEqual(names[-1], "Zoë")
+
+class RowTest(CsvTest):
+
+    def test_headings(self):
+        students, report = self.read(b"Gender,Surname,First Name,Tutor\nF,Lee,Ann,XY\n")
+        self.assertTrue(report.has_headings)
+        self.assertEqual((students[0]['first_name'], students[0]['last_name']), ("Ann", "Lee"))
+
+    def test_missing_headings(self):
+        students, report = self.read(b"First Name,Gender\nAnn,F\n")
+        self.assertTrue(report.failed)
+        self.assertEqual(students, [])
+
+    def test_problems(self):
+        students, report = self.read(b"Ann,Lee,Other\n,Lee,Male\n\n,,\nBen,Ng\nCat,Roe,f\n")
+        self.assertEqual([student['first_name'] for student in students], ["Ann", "Cat"])
+        self.assertEqual(students[0]['pronouns'], tuple(config.PRONOUNS['female']))
+        self.assertEqual((report.rows, report.imported), (4, 2))
+        self.assertEqual([line for line, message in report.problems], [1, 2, 5])
+        self.assertIn("line 5: expected at least 3 columns", str(report))
+
+    def test_group_column(self):
+        filename = os.path.join(self.folder, "roll.csv")
+        with open(filename, 'wb') as csv_out:
+            csv_out.write(b"First Name,Last Name,Gender,Class\nAnn,Lee,F,9A\nBen,Ng,M,9B\nCat,Roe,F,\n")
+        report = could_try_harder.ImportReport(filename)
+        students = [(group, student['first_name'])
+                    for group, student in could_try_harder.read_class_list(filename, report, "Class")]
+        self.assertEqual(students, [("9A", "Ann"), ("9B", "Ben")])
+        self.assertEqual(report.problems, [(4, "no subject given for Cat Roe")])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import could_try_harder
+
+# Style rules which change where sentences end. The last one matches across the end of a sentence, so comments
+# can't be styled one sentence at a time at all.
+SENTENCE_RULES = [
+    ("foo", "e.g"), ("bar", "x y. z"), ("baz", ""), ("qu+x", "Mr"), (" +zed", "  "), (r"\. +and", " and")
+]
+
+PIECES = ["foo", "bar", "baz", "quux", "zed", "year nine", "class 2", "e.g.", "Mr.", "<name>", "<sp>", ".", "!", "?",
+          "  ", "\n", '"', ")", "(", "hello", "5", "A", "she", "and"]
+
+STUDENTS = [("Sam", config.PRONOUNS['male']), ("Dr", config.PRONOUNS['female']), ("J", config.PRONOUNS['female'])]
+
+class IncrementalStyleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = {name: getattr(config, name)
+                         for name in ('INCREMENTAL_STYLE', 'SENTENCE_CAPITALISER', 'STYLE_RULES')}
+        config.INCREMENTAL_STYLE = True
+        config.SENTENCE_CAPITALISER = 'builtin'
+
+    def tearDown(self):
+        for name, value in self.settings.items():
+            setattr(config, name, value)
+
+    def check(self, text):
+        for name, pronouns in STUDENTS:
+            self.assertEqual(could_try_harder.style_student_comment(text, name, pronouns),
+                             could_try_harder.do_style(could_try_harder.do_placeholders(text, name, pronouns)),
+                             (text, name))
+
+    def random_comments(self, count):
+        rng = random.Random(4)
+        for i in range(count):
+            yield "".join(rng.choice(PIECES) + rng.choice(["", " ", " "]) for j in range(rng.randint(1, 12)))
+
+    def test_config_rules(self):
+        self.assertTrue(could_try_harder._get_style_engine().splits_sentences)
+        for text in self.random_comments(2000):
+            self.check(text)
+
+    def test_rules_changing_sentence_ends(self):
+        config.STYLE_RULES = config.STYLE_RULES + SENTENCE_RULES[:-1]
+        self.assertTrue(could_try_harder._get_style_engine().splits_sentences)
+        for text in self.random_comments(1000):
+            self.check(text)
+
+    def test_rules_across_sentences(self):
+        config.STYLE_RULES = config.STYLE_RULES + SENTENCE_RULES
+        self.assertFalse(could_try_harder._get_style_engine().splits_sentences)
+        for text in self.random_comments(500):
+            self.check(text)
+
+    def test_edits(self):
+        text = "<name> worked hard in year nine. <sp> got an A. well done!"
+        self.check(text)
+        self.check(text.replace("worked hard", "tried"))
+        self.check(text + " keep it up mr. <name>.")
+        self.check(text.replace(". well", ", well"))
+
+if __name__ == '__main__':
+    unittest.main()
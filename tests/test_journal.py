@@ -0,0 +1,70 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+import could_try_harder
+
+# Loads a subject in another process, changes it and saves it as a snapshot, like the command line does
+_OTHER_LOADER = """
+import sys
+sys.path.insert(0, {root!r})
+import config
+import could_try_harder
+config.DATA_FOLDER = {folder!r}
+config.STORAGE_MODE = 'snapshot'
+subject = could_try_harder.load('9A')
+subject['intro_comment'] = 'Changed elsewhere.'
+sys.exit(0 if could_try_harder.save(subject) else 1)
+"""
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp() + os.sep
+        self.settings = {name: getattr(config, name) for name in ('DATA_FOLDER', 'STORAGE_MODE', 'STORAGE_BACKEND')}
+        config.DATA_FOLDER = self.folder
+        config.STORAGE_MODE = 'journal'
+        config.STORAGE_BACKEND = 'json'
+        self.assertTrue(could_try_harder.save({
+            "subject_name": "9A",
+            "intro_comment": "",
+            "comment_bank": [],
+            "students": [could_try_harder.Student({"first_name": "Jo", "last_name": "Bloggs", "gender": "female",
+                                                   "pronouns": config.PRONOUNS['female'], "comment": ""})]}))
+
+    def tearDown(self):
+        could_try_harder.release_subject('9A')
+        for name, value in self.settings.items():
+            setattr(config, name, value)
+        shutil.rmtree(self.folder)
+
+    def save_elsewhere(self):
+        subprocess.run([sys.executable, "-c", _OTHER_LOADER.format(root=ROOT, folder=self.folder)], check=True)
+
+    def test_save_after_another_process_saved(self):
+        subject = could_try_harder.load('9A')
+        self.save_elsewhere()
+        subject['students'][0]['comment'] = "Jo worked hard."
+        self.assertTrue(could_try_harder.save(subject))
+        self.assertEqual(could_try_harder.load('9A')['students'][0]['comment'], "Jo worked hard.")
+
+    def test_journal_entries_are_replayed(self):
+        subject = could_try_harder.load('9A')
+        subject['students'][0]['comment'] = "Jo worked hard."
+        self.assertTrue(could_try_harder.save(subject))
+        self.assertTrue(os.path.exists(could_try_harder._journal_filename('9A')))
+        could_try_harder.release_subject('9A')
+        self.save_elsewhere()
+        subject = could_try_harder.load('9A')
+        self.assertEqual(subject['students'][0]['comment'], "Jo worked hard.")
+        self.assertEqual(subject['intro_comment'], "Changed elsewhere.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import os
+import sys
+import stat
+import pickle
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import could_try_harder
+import sqlite_storage
+import binary_storage
+
+def make_subject():
+    return {
+        "subject_name": "9A",
+        "intro_comment": "<name> is in 9A. Zoë's class.",
+        "comment_bank": ["<name> worked hard.", "", "Keep it up!"],
+        "term": 2,
+        "students": [
+            could_try_harder.Student({"first_name": "Jo", "last_name": "Bloggs", "gender": "Female",
+                                      "pronouns": config.PRONOUNS['female'], "comment": "Jo worked hard.",
+                                      "tutor": "XY"}),
+            could_try_harder.Student({"first_name": "Al", "last_name": "Smith", "gender": "Male",
+                                      "pronouns": config.PRONOUNS['male'], "comment": ""}),
+            could_try_harder.Student({"first_name": "Sam", "last_name": "Ng", "gender": "Female",
+                                      "pronouns": ["they", "them", "their", "theirs", "themself"],
+                                      "comment": "Line one.\nLine two."})
+        ]
+    }
+
+class StorageTest(unittest.TestCase):
+
+    backend = 'json'
+    # Extension of the file each subject is saved in, or None if subjects aren't saved in their own files
+    extension = '.json'
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp() + os.sep
+        self.settings = {name: getattr(config, name) for name in ('DATA_FOLDER', 'STORAGE_MODE', 'STORAGE_BACKEND')}
+        config.DATA_FOLDER = self.folder
+        config.STORAGE_MODE = 'snapshot'
+        config.STORAGE_BACKEND = self.backend
+        self.assertTrue(could_try_harder.save(make_subject()))
+
+    def tearDown(self):
+        sqlite_storage.close()
+        for name, value in self.settings.items():
+            setattr(config, name, value)
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        subject = could_try_harder.load('9A')
+        self.assertEqual(subject, make_subject())
+        self.assertIsInstance(subject['students'][0], could_try_harder.Student)
+        self.assertEqual(could_try_harder.get_saved_list(), ['9A'])
+
+    def test_save_changes(self):
+        subject = could_try_harder.load('9A')
+        subject['comment_bank'].append("New comment.")
+        subject['students'][1]['comment'] = "Al tried."
+        del subject['students'][0]
+        subject['intro_comment'] = ""
+        self.assertTrue(could_try_harder.save(subject))
+        self.assertEqual(could_try_harder.load('9A'), subject)
+
+    def test_load_parts(self):
+        self.assertEqual(could_try_harder.load_comment_bank('9A'), make_subject()['comment_bank'])
+        self.assertEqual(could_try_harder.load_student('9A', 2), make_subject()['students'][2])
+        self.assertIsNone(could_try_harder.load_student('9A', 3))
+
+    def test_summaries(self):
+        summary = could_try_harder.get_subject_summaries()['9A']
+        self.assertEqual((summary['students'], summary['comment_bank'], summary['completed']), (3, 3, 2))
+
+    def test_delete(self):
+        self.assertTrue(could_try_harder.delete('9A'))
+        self.assertEqual(could_try_harder.get_saved_list(), [])
+        self.assertEqual(could_try_harder.load('9A'), {})
+
+    def get_mode(self):
+        if self.extension is None:
+            self.skipTest("subjects aren't saved in their own files")
+        return stat.S_IMODE(os.stat(self.folder + "9A" + self.extension).st_mode)
+
+    def test_new_file_permissions(self):
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(self.get_mode(), 0o666 & ~umask)
+
+    def test_permissions_kept(self):
+        self.get_mode()
+        os.chmod(self.folder + "9A" + self.extension, 0o640)
+        subject = could_try_harder.load('9A')
+        subject['intro_comment'] = "Changed."
+        self.assertTrue(could_try_harder.save(subject))
+        self.assertEqual(self.get_mode(), 0o640)
+        self.assertFalse([filename for filename in os.listdir(self.folder) if filename.endswith('.tmp')])
+
+class SqliteStorageTest(StorageTest):
+
+    backend = 'sqlite'
+    extension = None
+
+    def test_migrate(self):
+        config.STORAGE_BACKEND = 'json'
+        subject = make_subject()
+        subject['subject_name'] = "9B"
+        self.assertTrue(could_try_harder.save(subject))
+        config.STORAGE_BACKEND = 'sqlite'
+        self.assertEqual(could_try_harder.migrate_to_sqlite(), ['9B'])
+        self.assertEqual(could_try_harder.load('9B'), subject)
+
+class BinaryStorageTest(StorageTest):
+
+    backend = 'binary'
+    extension = binary_storage.EXTENSION
+
+    def test_convert(self):
+        config.STORAGE_BACKEND = 'json'
+        self.assertEqual(could_try_harder.convert_subjects('json'), ['9A'])
+        self.assertEqual(could_try_harder.load('9A'), make_subject())
+        os.remove(binary_storage.get_filename('9A'))
+        self.assertEqual(could_try_harder.convert_subjects('binary'), ['9A'])
+        config.STORAGE_BACKEND = 'binary'
+        self.assertEqual(could_try_harder.load('9A'), make_subject())
+
+    def test_header(self):
+        header = binary_storage.load_header('9A')
+        self.assertEqual((header['subject_name'], header['intro_comment'], header['term']),
+                         ("9A", make_subject()['intro_comment'], 2))
+        self.assertNotIn('students', header)
+
+class StudentTest(unittest.TestCase):
+
+    def test_shared_pronouns(self):
+        students = [could_try_harder.Student(student) for student in make_subject()['students'] * 2]
+        self.assertIs(students[0]['pronouns'], students[3]['pronouns'])
+        self.assertIs(students[2]['pronouns'], could_try_harder.intern_pronouns(
+            ["they", "them", "their", "theirs", "themself"]))
+        self.assertEqual(students[2]['pronouns'], ("they", "them", "their", "theirs", "themself"))
+
+    def test_dict_behaviour(self):
+        student = make_subject()['students'][0]
+        self.assertEqual(list(student), ['first_name', 'last_name', 'gender', 'pronouns', 'comment', 'tutor'])
+        self.assertEqual(len(student), 6)
+        self.assertEqual(student.get('house', "none"), "none")
+        del student['tutor']
+        del student['gender']
+        self.assertEqual(len(student), 4)
+        self.assertNotIn('gender', student)
+        with self.assertRaises(KeyError):
+            student['gender']
+
+    def test_copy(self):
+        student = make_subject()['students'][0]
+        copy = student.copy()
+        copy['comment'] = "Changed."
+        copy['tutor'] = "AB"
+        self.assertEqual((student['comment'], student['tutor']), ("Jo worked hard.", "XY"))
+        self.assertEqual(pickle.loads(pickle.dumps(student)), student)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import re
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import could_try_harder
+
+# Rules which overlap, depend on each other or can't be analysed, so they mustn't all be merged into one pass
+TRICKY_RULES = [
+    ("foo", "bar"),
+    ("bar", "baz"),
+    ("(?<=k)lm", "L"),
+    ("ab(?=c)", " "),
+    (" +zed", "  "),
+    ("qu+x", "Mr"),
+    (r"(\w)\1", r"\1"),
+    ("year", "class"),
+]
+
+WORDS = ["class one", "year 9", "Year Eleven", "class  two", "foo", "bar", "klm", "abc", "quux", " zed", "moon",
+         "aabb", ".", "!", "\n", "year", "  "]
+
+def apply_in_order(rules, text):
+    for pattern, replacement in rules:
+        text = re.sub(pattern, replacement, text, flags=re.I)
+    return text
+
+class StyleRuleEngineTest(unittest.TestCase):
+
+    def check(self, rules, count=2000):
+        engine = could_try_harder.StyleRuleEngine(rules)
+        rng = random.Random(1)
+        for i in range(count):
+            text = " ".join(rng.choice(WORDS) for j in range(rng.randint(0, 12)))
+            self.assertEqual(engine.apply(text), apply_in_order(rules, text), text)
+
+    def test_config_rules(self):
+        self.check(config.STYLE_RULES)
+
+    def test_config_rules_are_merged(self):
+        engine = could_try_harder.StyleRuleEngine(config.STYLE_RULES)
+        self.assertLess(len(engine.passes), len(config.STYLE_RULES))
+
+    def test_tricky_rules(self):
+        self.check(TRICKY_RULES)
+
+    def test_tricky_rules_with_config_rules(self):
+        self.check(config.STYLE_RULES + TRICKY_RULES)
+        self.check(TRICKY_RULES + config.STYLE_RULES)
+
+    def test_do_style(self):
+        rules = config.STYLE_RULES
+        try:
+            config.STYLE_RULES = TRICKY_RULES
+            self.assertEqual(could_try_harder.do_style("foo in year 9. abc"), "Baz in class 9.  C")
+        finally:
+            config.STYLE_RULES = rules
+
+if __name__ == '__main__':
+    unittest.main()
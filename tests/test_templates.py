@@ -0,0 +1,71 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import could_try_harder
+
+PIECES = ["<name>", "<sp>", "<op>", "<pa>", "<pp>", "<rp>", " ", ". ", "! ", "? ", "\n", "a", "b", "A", "mr", "e.g",
+          ".", "'", "(", '"', ")", "<", ">", "sp", "name", "  ", "1", "é"]
+
+STUDENTS = [
+    ("Sam", config.PRONOUNS['male']),
+    ("sam", config.PRONOUNS['female']),
+    ("J", config.PRONOUNS['female']),
+    ("Mr", config.PRONOUNS['male']),
+    ("Jo-Ann", ["they", "them", "their", "theirs", "themself"]),
+    ("O'Brien", config.PRONOUNS['male']),
+    ("Ann Marie", config.PRONOUNS['female']),
+    ("a.b", ["e", "em", "eir", "eirs", "emself"]),
+]
+
+class TemplateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.capitaliser = config.SENTENCE_CAPITALISER
+        config.SENTENCE_CAPITALISER = 'builtin'
+
+    def tearDown(self):
+        config.SENTENCE_CAPITALISER = self.capitaliser
+
+    def check(self, text):
+        template = could_try_harder.compile_template(text)
+        for name, pronouns in STUDENTS:
+            self.assertEqual(template.render(name, pronouns),
+                             could_try_harder._do_placeholders_uncompiled(text, name, pronouns), (text, name))
+
+    def test_examples(self):
+        self.check("<name> worked hard. <sp> should be proud of <rp>.")
+        self.check("well done <name>! <pa> project was <pp>. <name>. <op>")
+        self.check("<name>'s work <sp>. got an A. <sp> did (<name>.) well")
+        self.check("ask mr. <name>. then <sp>")
+        self.check("<<name>> <sp<sp>> <")
+
+    def test_random(self):
+        rng = random.Random(3)
+        for i in range(3000):
+            self.check("".join(rng.choice(PIECES) for j in range(rng.randint(0, 10))))
+
+    def test_compiled_subject(self):
+        bank = ["<name> tried. <sp> did well.", "keep it up, <name>!"]
+        compiled = could_try_harder.CompiledSubject("<name> is in 9A.", bank)
+        for name, pronouns in STUDENTS:
+            self.assertEqual(compiled.render_intro(name, pronouns),
+                             could_try_harder._do_placeholders_uncompiled("<name> is in 9A.", name, pronouns))
+            self.assertEqual(compiled.render_bank(name, pronouns),
+                             [could_try_harder._do_placeholders_uncompiled(text, name, pronouns) for text in bank])
+
+    def test_abbreviations_changed(self):
+        abbreviations = config.ABBREVIATIONS
+        try:
+            self.assertEqual(could_try_harder.do_placeholders("see <name>. then go", "Xy", ["a"] * 5), "See Xy. Then go")
+            config.ABBREVIATIONS = abbreviations + ['xy']
+            self.assertEqual(could_try_harder.do_placeholders("see <name>. then go", "Xy", ["a"] * 5), "See Xy. then go")
+        finally:
+            config.ABBREVIATIONS = abbreviations
+
+if __name__ == '__main__':
+    unittest.main()